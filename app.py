@@ -1,38 +1,65 @@
 import streamlit as st
+import sys
 from pathlib import Path
-import json
-import openai
-from typing import Optional, Dict, Tuple
+from typing import Dict, Tuple
 
 # Constants
 MAX_REQUESTS_PER_SESSION = 5
+# Shared by all sessions of this server process (see ClassificationFrontend)
+GLOBAL_REQUESTS_PER_SECOND = 2.0
+GLOBAL_BURST = 10
+QUEUE_TIMEOUT_SECONDS = 30.0
+MEMO_TTL_SECONDS = 300.0
 BASE_DIR = Path(__file__).parent
 DECODER_PATH = BASE_DIR / "data/finetune.jsonl"
-MODEL_ID = "ft:gpt-3.5-turbo-0613:personal::7qnGb8rm"
 CONTACT_INFO = "scott.patterson[at]mail[dot]mcgill[dot]ca"
 
+# The prompt, MODEL_ID and decoding are shared with the batch tools in src/
+sys.path.insert(0, str(BASE_DIR / "src"))
+from classification import MODEL_ID, build_repair_index, decode_with_score
+from classification import load_decoder as load_decoder_from
+from classification_cache import ClassificationCache
+from classification_frontend import ClassificationFrontend
+import metrics
+
+CACHE_PATH = BASE_DIR / "data/classification_cache.sqlite"
+# Offline engine, trained with: python src/local_classifier.py train --dict data/finetune.jsonl --output <this>
+LOCAL_MODEL_PATH = BASE_DIR / "data/local_classifier.pkl"
+
 def load_decoder() -> Dict[str, str]:
-    with open(DECODER_PATH, "r") as f:
-        return {json.loads(line)["transformed_completion"].strip(): 
-                json.loads(line)["completion"] for line in f}
-
-def get_classification(occup_title: str) -> str:
-    try:
-        response = openai.ChatCompletion.create(
-            model=MODEL_ID,
-            messages=[
-                {"role": "system", "content": "classify this entry:"},
-                {"role": "user", "content": occup_title}
-            ],
-            max_tokens=50,
-            temperature=0.1
-        )
-        return response['choices'][0]['message']['content'].strip()
-    except openai.OpenAIError as e:
-        return f"Error: {str(e)}"
-
-def decode_classification(raw_output: str, decoder_map: Dict[str, str]) -> Optional[str]:
-    return decoder_map.get(raw_output)
+    return load_decoder_from(DECODER_PATH)
+
+@st.cache_resource
+def get_repair_index(decoder_path: str, mtime: float):
+    # Rebuilt only when finetune.jsonl changes
+    return build_repair_index(load_decoder())
+
+@st.cache_resource
+def get_cache() -> ClassificationCache:
+    # One connection per server process, shared by all sessions
+    return ClassificationCache(CACHE_PATH)
+
+@st.cache_resource
+def get_local_classifier(model_path: str, mtime: float, decoder_mtime: float):
+    # Reloaded only when the saved model or finetune.jsonl changes; a model
+    # trained on another finetune.jsonl is rejected
+    from local_classifier import LocalClassifier
+    return LocalClassifier.load(model_path, DECODER_PATH)
+
+@st.cache_resource
+def configure_openai() -> None:
+    # Deferred to the first API call, so the page renders without importing openai
+    import openai
+    openai.api_key = st.secrets["openai"]["api_key"]
+
+@st.cache_resource
+def get_frontend() -> ClassificationFrontend:
+    # One per server process: concurrent identical titles share a call, and
+    # all sessions draw from the same request budget
+    return ClassificationFrontend(
+        requests_per_second=GLOBAL_REQUESTS_PER_SECOND, burst=GLOBAL_BURST,
+        queue_timeout=QUEUE_TIMEOUT_SECONDS, memo_ttl=MEMO_TTL_SECONDS
+    )
 
 def initialize_session_state():
     if 'request_count' not in st.session_state:
@@ -50,11 +77,9 @@ def main():
     # Setup
     initialize_session_state()
     
-    # Configure OpenAI
-    openai.api_key = st.secrets["openai"]["api_key"]
-    
     # Load decoder
     decoder_map = load_decoder()
+    repair_index = get_repair_index(str(DECODER_PATH), DECODER_PATH.stat().st_mtime)
 
     st.title("Occupation Classifier")
     st.markdown("""
@@ -62,27 +87,57 @@ def main():
     Enter an occupation title, and the model will classify it according to Bureau of Labor Statistics codes.
     """)
 
+    metrics.render_diagnostics(st, lambda: {"classification_cache": get_cache().stats(),
+                                            "frontend": get_frontend().stats()})
+
     # Display remaining requests
     st.info(f"Remaining requests: {MAX_REQUESTS_PER_SESSION - st.session_state.request_count}")
 
+    engine = "Fine-tuned GPT-3.5"
+    if LOCAL_MODEL_PATH.exists():
+        engine = st.radio("Engine:", ["Fine-tuned GPT-3.5", "Local (offline)"], horizontal=True)
+
     user_input = st.text_input("Enter an occupation title:", "")
     
     if st.button("Classify") and user_input.strip():
-        can_proceed, message = check_rate_limit()
-        
-        if not can_proceed:
-            st.warning(message)
-            return
+        cache = get_cache()
+        cached = cache.get(user_input) if engine == "Fine-tuned GPT-3.5" else None
+
+        if engine == "Local (offline)":
+            # No API call, so no request limit and no cache
+            try:
+                classifier = get_local_classifier(str(LOCAL_MODEL_PATH), LOCAL_MODEL_PATH.stat().st_mtime,
+                                                  DECODER_PATH.stat().st_mtime)
+            except ValueError as e:
+                st.error(f"The local model can't be used: {e}")
+                return
+            raw_classification, probability = classifier.predict([user_input])[0]
+            human_readable, score = decode_with_score(raw_classification, decoder_map, repair_index)
+            st.caption(f"Local model probability: {probability:.2f}")
+        elif cached is not None:
+            # Answered from earlier runs; doesn't count against the request limit
+            raw_classification = cached[0]
+            human_readable, score = decode_with_score(raw_classification, decoder_map, repair_index)
+        else:
+            can_proceed, message = check_rate_limit()
+
+            if not can_proceed:
+                st.warning(message)
+                return
 
-        with st.spinner("Classifying..."):
-            raw_classification = get_classification(user_input)
-            human_readable = decode_classification(raw_classification, decoder_map)
+            with st.spinner("Classifying..."):
+                configure_openai()
+                raw_classification = get_frontend().classify(user_input)
+                human_readable, score = decode_with_score(raw_classification, decoder_map, repair_index)
+            cache.put(user_input, raw_classification, human_readable)
 
         st.subheader("Results")
         st.write(f"**Raw Classification**: {raw_classification}")
         
         if human_readable:
             st.write(f"**Human-Readable Classification**: {human_readable}")
+            if raw_classification not in decoder_map:
+                st.info(f"Raw output repaired to the nearest valid label (similarity {score:.2f}).")
         else:
             st.warning("No match found for the raw output. Likely hallucination.")
 
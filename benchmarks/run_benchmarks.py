@@ -0,0 +1,391 @@
+"""
+Benchmarks for the pre-match, suggestion and classification hot paths.
+
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 --output bench.json
+
+Each stage writes one record per configuration (rows/sec, peak traced
+memory, per-query latency percentiles) into a JSON file, so two runs can be
+compared with compare_results() or any JSON diff. The suggestion stage is
+skipped if sentence-transformers isn't installed; the classification stage
+runs against a local stub of the OpenAI endpoint, never the real API.
+
+The startup stage imports each entry point in a fresh interpreter under
+-X importtime and times a small headless pre-match run; the script exits
+with status 1 if an entry point loads a heavy package it shouldn't (see
+STARTUP_FORBIDDEN) or the run exceeds its budget:
+
+    python benchmarks/run_benchmarks.py --stages startup
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from compact_dict import load_compact_dict  # noqa: E402
+from finetune_data import clear_cache, load_finetune_data, parse_finetune_jsonl  # noqa: E402
+from occupation_text import DEFAULT_MIN_SIMILARITY  # noqa: E402
+from pre_matching import build_fuzzy_index, fuzzy_pre_match_occupation, pre_match_occupation  # noqa: E402
+from stub_openai import StubOpenAIServer, answers_from_finetune  # noqa: E402
+from synthetic import add_typo, generate_alias_dictionary, generate_occupations  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_DICT_PATH = BASE_DIR / "data" / "prematch.jsonl"
+# Keys in the synthetic alias dictionary the large fuzzy lookup case runs on
+LARGE_FUZZY_KEYS = 150_000
+STAGES = ["load_dict", "pre_match", "fuzzy", "suggest", "classify", "startup"]
+# Entry-point modules and the heavy packages importing them must not load;
+# those belong on the code paths that use them
+STARTUP_FORBIDDEN = {
+    "main": ("pandas", "tkinter", "openai", "torch", "sentence_transformers"),
+    "suggestiontool": ("pandas", "openai", "torch", "sentence_transformers"),
+    "batch_jobs": ("openai", "torch", "sentence_transformers"),
+    "batch_classify": ("openai", "torch", "sentence_transformers"),
+    "cascade": ("openai", "torch", "sentence_transformers"),
+    "classification": ("pandas", "openai", "torch"),
+}
+HEADLESS_STARTUP_BUDGET_SECONDS = 1.0
+
+
+def measure(fn: Callable, *args, setup: Optional[Callable[[], object]] = None, **kwargs) -> Dict[str, float]:
+    """
+    Runs fn twice: once untimed by tracemalloc for the wall time, then once
+    under tracemalloc for the peak memory (tracing slows allocation-heavy
+    code down several times, so the two can't share a run). `setup` runs
+    before each, e.g. to undo caching or in-place changes from the first.
+    """
+    if setup is not None:
+        setup()
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(seconds, 6), "peak_mem_mb": round(peak / 2 ** 20, 3)}
+
+
+def latency_percentiles(latencies_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(latencies_s) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p90_ms": round(float(np.percentile(ms, 90)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+    }
+
+
+def timed_calls(fn: Callable, inputs) -> List[float]:
+    latencies = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def record(stage: str, rows: int, params: dict, measured: dict, **extra) -> dict:
+    result = {"stage": stage, "rows": rows, "params": params, **measured, **extra}
+    if rows and measured.get("seconds"):
+        result["rows_per_sec"] = round(rows / measured["seconds"], 1)
+    return result
+
+
+def bench_load_dict(jsonl_path: str, **_) -> List[dict]:
+    data = parse_finetune_jsonl(jsonl_path)
+    n = len(data.pre_match)
+    results = [record("load_dict", n, {"mode": "parse_jsonl"}, measure(parse_finetune_jsonl, jsonl_path))]
+
+    # Warm the artifact, then time a fresh process-level cache hitting it
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = Path(tmp) / "finetune.jsonl"
+        copy.write_bytes(Path(jsonl_path).read_bytes())
+        load_finetune_data(str(copy))
+        results.append(record("load_dict", n, {"mode": "compiled_artifact"},
+                              measure(load_finetune_data, str(copy), setup=clear_cache)))
+        load_compact_dict(str(copy))
+        results.append(record("load_dict", n, {"mode": "compact_dict"},
+                              measure(load_compact_dict, str(copy))))
+    return results
+
+
+def bench_pre_match(jsonl_path: str, sizes: List[int], seed: int, **_) -> List[dict]:
+    backends = {"dict": load_finetune_data(jsonl_path).pre_match, "compact": load_compact_dict(jsonl_path)}
+    results = []
+    for n in sizes:
+        df = generate_occupations(n, jsonl_path, seed=seed)
+        for backend, pre_match_dict in backends.items():
+            measured = measure(pre_match_occupation, df, "occupation", pre_match_dict)
+            hit_rate = float((df["method"] == "pre_match").mean())
+            results.append(record("pre_match", n, {"distinct": int(df["occupation"].nunique()), "backend": backend},
+                                  measured, hit_rate=round(hit_rate, 4)))
+    return results
+
+
+def bench_fuzzy(jsonl_path: str, sizes: List[int], seed: int, **_) -> List[dict]:
+    pre_match_dict = load_finetune_data(jsonl_path).pre_match
+    results = []
+    fuzzy_index = build_fuzzy_index(pre_match_dict)
+    build = measure(build_fuzzy_index, pre_match_dict)
+    results.append(record("fuzzy_build", len(pre_match_dict), {}, build))
+
+    queries = generate_occupations(2000, jsonl_path, seed=seed)["occupation"].dropna().astype(str).tolist()
+    latencies = timed_calls(fuzzy_index.lookup, queries)
+    results.append(record("fuzzy_lookup", len(queries), {"keys": len(fuzzy_index)},
+                          {"seconds": round(sum(latencies), 6)}, latency=latency_percentiles(latencies)))
+
+    # A real alias dictionary is far bigger than the seed file and its keys
+    # share most n-grams; time typo'd keys against the thresholded lookup
+    aliases = generate_alias_dictionary(pre_match_dict, LARGE_FUZZY_KEYS, seed=seed)
+    build = measure(build_fuzzy_index, aliases)
+    large_index = build_fuzzy_index(aliases)
+    results.append(record("fuzzy_build", len(aliases), {}, build))
+    rng = np.random.default_rng(seed)
+    keys = list(aliases)
+    queries = [add_typo(keys[i], rng) for i in rng.integers(len(keys), size=2000)]
+    latencies = timed_calls(lambda query: large_index.lookup(query, DEFAULT_MIN_SIMILARITY), queries)
+    results.append(record("fuzzy_lookup", len(queries), {"keys": len(large_index),
+                                                         "min_similarity": DEFAULT_MIN_SIMILARITY},
+                          {"seconds": round(sum(latencies), 6)}, latency=latency_percentiles(latencies)))
+
+    for n in sizes:
+        df = generate_occupations(n, jsonl_path, seed=seed)
+        # The fuzzy tier fills rows in place; start both runs from the exact-match output
+        measured = measure(fuzzy_pre_match_occupation, df, "occupation", fuzzy_index,
+                           setup=lambda: pre_match_occupation(df, "occupation", pre_match_dict))
+        results.append(record("fuzzy_pre_match", n, {}, measured,
+                              fuzzy_rate=round(float((df["method"] == "fuzzy_match").mean()), 4)))
+    return results
+
+
+def bench_suggest(jsonl_path: str, seed: int, model_name: str = "all-MiniLM-L6-v2", **_) -> List[dict]:
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return [{"stage": "suggest", "skipped": "sentence-transformers is not installed"}]
+    from batch_suggest import suggest_completions_batch
+    from embedding_index import (
+        PRECISIONS,
+        CompletionIndex,
+        QueryEmbeddingCache,
+        encode_normalized,
+        top_k_agreement,
+        top_k_indices,
+    )
+
+    model = SentenceTransformer(model_name)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = CompletionIndex.load_or_build(jsonl_path, model, model_name, cache_dir=tmp)
+        queries = generate_occupations(500, jsonl_path, seed=seed)["occupation"].dropna().astype(str).tolist()
+
+        def single_query(profession):
+            top_k_indices(index.scores(encode_normalized(model, profession)), 5)
+
+        latencies = timed_calls(single_query, queries[:200])
+        results = [record("suggest_single", len(latencies), {"labels": len(index)},
+                          {"seconds": round(sum(latencies), 6)}, latency=latency_percentiles(latencies))]
+        measured = measure(lambda: list(suggest_completions_batch(queries, index, model, k=5)))
+        results.append(record("suggest_batch", len(queries), {"labels": len(index)}, measured))
+
+        # Repeated queries served from the query-embedding cache
+        query_cache = QueryEmbeddingCache(model)
+        query_cache.encode(queries[:200])
+        latencies = timed_calls(lambda p: top_k_indices(index.scores(query_cache.encode(p)), 5), queries[:200])
+        results.append(record("suggest_single_cached", len(latencies), {"labels": len(index)},
+                              {"seconds": round(sum(latencies), 6)}, latency=latency_percentiles(latencies),
+                              hit_rate=round(query_cache.stats()["hit_rate"], 4)))
+
+        # Scoring latency, memory and top-k agreement of reduced-precision matrices
+        query_embeddings = encode_normalized(model, queries)
+        for kind in ("completions", "examples"):
+            reference = CompletionIndex.load_or_build(jsonl_path, model, model_name, cache_dir=tmp, kind=kind)
+            reference_scores = reference.scores(query_embeddings)
+            for precision in PRECISIONS:
+                stored = reference.quantized(precision)
+                latencies = timed_calls(lambda q: stored.scores(q), query_embeddings[:200])
+                results.append(record(
+                    "suggest_precision", len(latencies), {"kind": kind, "precision": precision, "labels": len(stored)},
+                    {"seconds": round(sum(latencies), 6)}, latency=latency_percentiles(latencies),
+                    matrix_bytes=stored.nbytes,
+                    top5_agreement=round(top_k_agreement(reference_scores, stored.scores(query_embeddings), 5), 4)
+                ))
+    return results
+
+
+def bench_classify(jsonl_path: str, seed: int, latency_ms: float = 100.0,
+                   workers=(1, 4, 16), n_titles: int = 200, **_) -> List[dict]:
+    from batch_classify import classify_batch, make_openai_create
+    from classification import load_decoder, request_classification
+
+    data = load_finetune_data(jsonl_path)
+    titles = generate_occupations(n_titles * 3, jsonl_path, seed=seed)["occupation"].dropna().astype(str)
+    titles = list(dict.fromkeys(titles))[:n_titles]
+    results = []
+    with StubOpenAIServer(answers=answers_from_finetune(data), latency_ms=latency_ms, seed=seed) as stub:
+        create = make_openai_create("stub", stub.api_base)
+        latencies = timed_calls(lambda t: request_classification(t, create), titles[:50])
+        results.append(record("classify_request", len(latencies), {"stub_latency_ms": latency_ms},
+                              {"seconds": round(sum(latencies), 6)}, latency=latency_percentiles(latencies)))
+        decoder_map = load_decoder(jsonl_path)
+        for n_workers in workers:
+            measured = measure(classify_batch, titles, decoder_map, create=create, max_workers=n_workers)
+            results.append(record("classify_batch", len(titles),
+                                  {"workers": n_workers, "stub_latency_ms": latency_ms}, measured))
+    return results
+
+
+def import_profile(module: str) -> Dict[str, object]:
+    """
+    Imports `module` from src/ in a fresh interpreter under -X importtime;
+    returns its cumulative import time and every module it loaded.
+    """
+    env = dict(os.environ, PYTHONPATH=str(BASE_DIR / "src"))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=env, check=True)
+    loaded, seconds = set(), 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        loaded.add(name)
+        if name == module:
+            seconds = int(cumulative) / 1e6
+    return {"seconds": round(seconds, 6), "loaded": loaded}
+
+
+def bench_startup(jsonl_path: str, seed: int, **_) -> List[dict]:
+    results = []
+    for module, forbidden in STARTUP_FORBIDDEN.items():
+        profile = import_profile(module)
+        unexpected = sorted(name for name in forbidden if name in profile["loaded"])
+        results.append(record("startup_import", 0, {"module": module}, {"seconds": profile["seconds"]},
+                              modules_loaded=len(profile["loaded"]), unexpected_imports=unexpected))
+
+    # Wall time of a whole headless pre-match run on a small file, interpreter start included
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path, output_path = Path(tmp) / "in.csv", Path(tmp) / "out.csv"
+        generate_occupations(1000, jsonl_path, seed=seed).to_csv(input_path, index=False)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(BASE_DIR / "src" / "main.py"), "--input", str(input_path),
+                        "--output", str(output_path), "--column", "occupation", "--dict", str(jsonl_path)],
+                       capture_output=True, check=True)
+        seconds = time.perf_counter() - start
+    results.append(record("startup_headless", 1000, {}, {"seconds": round(seconds, 6)},
+                          over_budget=seconds > HEADLESS_STARTUP_BUDGET_SECONDS))
+    return results
+
+
+def startup_regressions(results: List[dict]) -> List[str]:
+    """
+    Problems found by the startup stage: heavy imports on entry points
+    and a headless run over its budget.
+    """
+    problems = []
+    for r in results:
+        if r.get("unexpected_imports"):
+            problems.append(f"import {r['params']['module']} loads {', '.join(r['unexpected_imports'])}")
+        if r.get("over_budget"):
+            problems.append(f"headless pre-match took {r['seconds']}s "
+                            f"(budget {HEADLESS_STARTUP_BUDGET_SECONDS}s)")
+    return problems
+
+
+BENCHMARKS = {
+    "load_dict": bench_load_dict,
+    "pre_match": bench_pre_match,
+    "fuzzy": bench_fuzzy,
+    "suggest": bench_suggest,
+    "classify": bench_classify,
+    "startup": bench_startup,
+}
+
+
+def run(stages: List[str], jsonl_path: str, sizes: List[int], seed: int) -> dict:
+    results = []
+    for stage in stages:
+        print(f"Running {stage}...")
+        for result in BENCHMARKS[stage](jsonl_path=jsonl_path, sizes=sizes, seed=seed):
+            print(f"  {json.dumps(result)}")
+            results.append(result)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "dict_path": str(jsonl_path),
+            "sizes": sizes,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline_path: str, current_path: str) -> List[dict]:
+    """
+    Ratio of rows_per_sec (current / baseline) for every stage and
+    configuration present in both result files.
+    """
+    def keyed(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return {
+                (r["stage"], r.get("rows"), json.dumps(r.get("params"), sort_keys=True)): r
+                for r in json.load(f)["results"] if "rows_per_sec" in r
+            }
+    baseline, current = keyed(baseline_path), keyed(current_path)
+    return [
+        {"stage": key[0], "rows": key[1], "params": json.loads(key[2]),
+         "speedup": round(current[key]["rows_per_sec"] / baseline[key]["rows_per_sec"], 3)}
+        for key in baseline if key in current
+    ]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pre-match, suggestion and classification paths.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES,
+                        help="Synthetic row counts, e.g. 10000 100000 1000000 10000000.")
+    parser.add_argument("--dict", dest="jsonl_path", default=str(DEFAULT_DICT_PATH),
+                        help="JSONL used as dictionary and data seed (default: data/prematch.jsonl).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="Earlier results file to compare this run against.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args.stages, args.jsonl_path, args.sizes, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        for row in compare_results(args.compare, args.output):
+            print(f"{row['stage']:>18} rows={row['rows']:<9} {row['params']}  x{row['speedup']}")
+
+    problems = startup_regressions(report["results"])
+    for problem in problems:
+        print(f"Startup regression: {problem}")
+    if problems:
+        sys.exit(1)
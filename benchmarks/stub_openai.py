@@ -0,0 +1,136 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+class StubOpenAIServer:
+    """
+    Local stand-in for the OpenAI chat completions endpoint, for benchmarks
+    and offline runs. Use as a context manager and point a client at
+    `api_base`:
+
+        with StubOpenAIServer(latency_ms=300) as stub:
+            create = make_openai_create("stub", stub.api_base)
+
+    Each request sleeps latency_ms (+/- jitter) and answers with the
+    transformed_completion for the title if `answers` knows it, otherwise
+    `default_answer`. A `rate_limit_rate` share of requests gets a 429.
+    """
+
+    def __init__(
+        self,
+        answers: Optional[Dict[str, str]] = None,
+        default_answer: str = "insufficient_information",
+        latency_ms: float = 200.0,
+        jitter_ms: float = 50.0,
+        rate_limit_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 0
+    ):
+        self.answers = {k.strip().lower(): v for k, v in (answers or {}).items()}
+        self.default_answer = default_answer
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.requests = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests += 1
+                    limited = stub._rng.random() < stub.rate_limit_rate
+                    delay = max(0.0, stub.latency_ms + stub._rng.uniform(-1, 1) * stub.jitter_ms)
+                if limited:
+                    with stub._lock:
+                        stub.rate_limited += 1
+                    self._reply(429, {"error": {"message": "Rate limit reached (stub)",
+                                                "type": "requests", "code": "rate_limit_exceeded"}})
+                    return
+
+                time.sleep(delay / 1000.0)
+                title = request["messages"][-1]["content"]
+                answer = stub.answers.get(title.strip().lower(), stub.default_answer)
+                self._reply(200, {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "model": request.get("model"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": answer}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+
+        return Handler
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def answers_from_finetune(finetune_data) -> Dict[str, str]:
+    """
+    Title -> transformed_completion answers built from a FinetuneData, so the
+    stub's outputs decode like the real model's.
+    """
+    encoder = {completion.strip(): raw for raw, completion in finetune_data.decoder.items()}
+    return {
+        title: encoder[completion]
+        for title, completion in finetune_data.pre_match.items()
+        if completion in encoder
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stub of the OpenAI chat completions endpoint.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = StubOpenAIServer(latency_ms=args.latency_ms, rate_limit_rate=args.rate_limit_rate, port=args.port)
+    print(f"Stub OpenAI endpoint at {stub.api_base} (Ctrl-C to stop)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
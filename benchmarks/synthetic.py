@@ -0,0 +1,164 @@
+import json
+import string
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+# Share of the vocabulary that is a dictionary key with a typo, and that is
+# an occupation the dictionary has never seen
+DEFAULT_TYPO_RATE = 0.25
+DEFAULT_UNKNOWN_RATE = 0.15
+DEFAULT_MISSING_RATE = 0.02
+DEFAULT_ZIPF_EXPONENT = 1.1
+
+_UNKNOWN_WORDS = [
+    "assistant", "senior", "regional", "chief", "lead", "junior", "associate",
+    "technician", "specialist", "coordinator", "analyst", "operator", "agent",
+    "inspector", "planner", "supervisor", "clerk", "trainer", "advisor",
+]
+
+_SPECIALTY_WORDS = [
+    "care", "sales", "retail", "health", "services", "maintenance", "production",
+    "warehouse", "office", "school", "hospital", "construction", "food",
+    "finance", "marketing", "customer", "systems", "field", "quality", "night",
+]
+
+
+def load_seed_occupations(jsonl_path: str) -> List[str]:
+    """
+    The prompt_occupation values of a prematch/finetune JSONL file, as written
+    (original casing), used as the realistic core of the synthetic data.
+    """
+    occupations = []
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                occupations.append(json.loads(line)["prompt_occupation"])
+    return occupations
+
+
+def add_typo(text: str, rng: np.random.Generator) -> str:
+    """
+    One realistic corruption: a dropped, doubled, swapped or substituted
+    character, changed casing, stray punctuation or extra whitespace.
+    """
+    if not text:
+        return text
+    kind = rng.integers(7)
+    i = int(rng.integers(len(text)))
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + text[i] + text[i:]
+    if kind == 2 and len(text) > 1:
+        i = min(i, len(text) - 2)
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    if kind == 3:
+        return text[:i] + rng.choice(list(string.ascii_lowercase)) + text[i + 1:]
+    if kind == 4:
+        return text.upper() if rng.random() < 0.5 else text.title()
+    if kind == 5:
+        return text + rng.choice([".", ",", " -", "/"])
+    return f" {text}  "
+
+
+def build_vocabulary(
+    seeds: List[str],
+    size: int,
+    rng: np.random.Generator,
+    typo_rate: float = DEFAULT_TYPO_RATE,
+    unknown_rate: float = DEFAULT_UNKNOWN_RATE
+) -> List[str]:
+    """
+    Distinct occupation strings to sample rows from: the seed occupations
+    themselves, typo'd variants of them, and unknown titles.
+    """
+    vocabulary = list(seeds)
+    n_typo = int(size * typo_rate)
+    n_unknown = int(size * unknown_rate)
+    for _ in range(n_typo):
+        vocabulary.append(add_typo(seeds[int(rng.integers(len(seeds)))], rng))
+    for _ in range(n_unknown):
+        words = rng.choice(_UNKNOWN_WORDS, size=int(rng.integers(1, 4)), replace=False)
+        vocabulary.append(" ".join(words))
+    while len(vocabulary) < size:
+        vocabulary.append(seeds[int(rng.integers(len(seeds)))])
+    return vocabulary
+
+
+def generate_alias_dictionary(pre_match: Mapping[str, str], size: int, seed: int = 0) -> Dict[str, str]:
+    """
+    A large pre-match dictionary in the shape of a real alias list: titles
+    built from the words of `pre_match`'s keys and common modifiers, each
+    mapped to the completion of the key it extends, so the keys share
+    most of their vocabulary (and their common n-grams).
+    """
+    rng = np.random.default_rng(seed)
+    seeds = list(pre_match)
+    words = sorted({word for key in seeds for word in key.lower().split()} | set(_UNKNOWN_WORDS)
+                   | set(_SPECIALTY_WORDS))
+    aliases = dict(pre_match)
+    while len(aliases) < size:
+        # Draw a batch at a time: up to two modifiers before a seed key and
+        # up to one specialty after it (-1 for none), some with a typo
+        batch = size - len(aliases)
+        keys = rng.integers(len(seeds), size=batch)
+        before = np.where(rng.random((batch, 2)) < 0.5, rng.integers(len(words), size=(batch, 2)), -1)
+        after = np.where(rng.random(batch) < 0.5, rng.integers(len(_SPECIALTY_WORDS), size=batch), -1)
+        typo = rng.random(batch) < DEFAULT_TYPO_RATE
+        for i in range(batch):
+            key = seeds[keys[i]]
+            parts = [words[j] for j in before[i] if j >= 0] + [key]
+            if after[i] >= 0:
+                parts.append(_SPECIALTY_WORDS[after[i]])
+            alias = " ".join(parts)
+            aliases.setdefault(add_typo(alias, rng) if typo[i] else alias, pre_match[key])
+    return aliases
+
+
+def generate_occupations(
+    n_rows: int,
+    jsonl_path: str,
+    seed: int = 0,
+    vocabulary_size: Optional[int] = None,
+    typo_rate: float = DEFAULT_TYPO_RATE,
+    unknown_rate: float = DEFAULT_UNKNOWN_RATE,
+    missing_rate: float = DEFAULT_MISSING_RATE,
+    zipf_exponent: float = DEFAULT_ZIPF_EXPONENT
+) -> pd.DataFrame:
+    """
+    Synthetic contributor-style file with an 'occupation' column.
+
+    Rows are drawn from the vocabulary with Zipf-distributed frequencies, so
+    a few titles ("teacher", "retired") dominate like in real files while a
+    long tail of typos and unknown titles appears rarely.
+
+    Args:
+        n_rows (int): Number of rows.
+        jsonl_path (str): JSONL whose prompt_occupation values seed the data.
+        seed (int, optional): Random seed; the same seed gives the same data.
+        vocabulary_size (int, optional): Distinct strings before sampling.
+            Defaults to roughly sqrt(n_rows) * 10, capped at 200k.
+        typo_rate, unknown_rate (float, optional): Vocabulary composition.
+        missing_rate (float, optional): Share of rows left empty (NaN).
+        zipf_exponent (float, optional): Skew of the frequency distribution.
+
+    Returns:
+        pd.DataFrame: Columns 'row_id' and 'occupation'.
+    """
+    rng = np.random.default_rng(seed)
+    seeds = load_seed_occupations(jsonl_path)
+    if vocabulary_size is None:
+        vocabulary_size = int(min(max(len(seeds), np.sqrt(n_rows) * 10), 200_000))
+    vocabulary = build_vocabulary(seeds, vocabulary_size, rng, typo_rate, unknown_rate)
+
+    # Shuffle so the frequency ranking doesn't follow the vocabulary layout
+    order = rng.permutation(len(vocabulary))
+    vocabulary = np.array(vocabulary, dtype=object)[order]
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1) ** zipf_exponent
+    codes = rng.choice(len(vocabulary), size=n_rows, p=weights / weights.sum())
+
+    occupations = vocabulary[codes]
+    occupations[rng.random(n_rows) < missing_rate] = np.nan
+    return pd.DataFrame({"row_id": np.arange(n_rows), "occupation": occupations})
@@ -0,0 +1,449 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from classification import (
+    DEFAULT_REPAIR_SIMILARITY,
+    build_repair_index,
+    decode_classification,
+    load_decoder,
+    request_classification,
+)
+from classification_cache import ClassificationCache, normalize_title
+from classification_journal import (
+    ClassificationJournal,
+    pending_titles_path,
+    read_pending_titles_file,
+    write_pending_titles,
+)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_SECONDS = 1.0
+DEFAULT_CHUNKSIZE = 100_000
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def retryable_errors() -> tuple:
+    """
+    Errors worth retrying: rate limits and transient server/network failures.
+    A function rather than a constant so importing this module doesn't
+    import openai.
+    """
+    import openai
+    return (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.APIConnectionError,
+        openai.error.Timeout,
+        openai.error.TryAgain,
+    )
+
+
+def make_openai_create(api_key: Optional[str] = None, api_base: Optional[str] = None) -> Callable:
+    """
+    Returns an openai.ChatCompletion.create bound to a key and endpoint, e.g.
+    a local stub server for offline runs (api_base="http://127.0.0.1:8000/v1").
+    """
+    import openai
+    kwargs = {}
+    if api_key:
+        kwargs["api_key"] = api_key
+    if api_base:
+        kwargs["api_base"] = api_base
+    return partial(openai.ChatCompletion.create, **kwargs)
+
+
+def classify_with_retry(
+    occup_title: str,
+    create: Optional[Callable] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    before_attempt: Optional[Callable[[], None]] = None
+) -> str:
+    """
+    Like get_classification, but retries rate-limit and transient errors with
+    exponential backoff and jitter. Other errors, and retryable ones after
+    max_retries attempts, come back as "Error: ..." strings.
+
+    `before_attempt` is called before every request, retries included (e.g.
+    to take a rate-limit token); an exception it raises is not caught.
+    """
+    import openai
+    retryable = retryable_errors()
+    for attempt in range(max_retries + 1):
+        if before_attempt is not None:
+            before_attempt()
+        try:
+            return request_classification(occup_title, create)
+        except retryable as e:
+            if attempt == max_retries:
+                return f"Error: {str(e)}"
+            delay = min(backoff_seconds * 2 ** attempt, MAX_BACKOFF_SECONDS)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+        except openai.OpenAIError as e:
+            return f"Error: {str(e)}"
+
+
+def classify_batch(
+    titles: Sequence[str],
+    decoder_map: Dict[str, str],
+    create: Optional[Callable] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    repair_index=None,
+    min_similarity: float = DEFAULT_REPAIR_SIMILARITY
+) -> List[Tuple[str, Optional[str]]]:
+    """
+    Classifies many titles with at most `max_workers` requests in flight.
+
+    Args:
+        titles (Sequence[str]): Occupation titles to classify.
+        decoder_map (Dict[str, str]): Output of load_decoder.
+        create (Callable, optional): Client call, see request_classification.
+        max_workers (int, optional): Maximum number of concurrent requests.
+        max_retries (int, optional): Retries per title on retryable errors.
+        backoff_seconds (float, optional): Initial backoff, doubled per retry.
+        repair_index (FuzzyIndex, optional): From build_repair_index; maps
+            near-miss outputs to the closest valid label.
+        min_similarity (float, optional): Minimum similarity for a repair.
+
+    Returns:
+        List[Tuple[str, Optional[str]]]: (raw output, decoded label or None),
+        in the same order as `titles`.
+    """
+    classify = partial(
+        classify_with_retry, create=create, max_retries=max_retries, backoff_seconds=backoff_seconds
+    )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        raw_outputs = list(executor.map(classify, titles))
+    return [
+        (raw, decode_classification(raw, decoder_map, repair_index, min_similarity))
+        for raw in raw_outputs
+    ]
+
+
+def redecode(
+    records: Dict[str, Tuple[str, Optional[str]]],
+    decoder_map: Dict[str, str],
+    repair_index=None,
+    min_similarity: float = DEFAULT_REPAIR_SIMILARITY
+) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    Decodes stored {key: (raw output, decoded label)} records again with the
+    current decoder and repair settings. A stored label reflects the
+    settings of the run that stored it (e.g. another --repair-similarity or
+    an older finetune.jsonl), so cached raw outputs are always re-decoded.
+    """
+    return {
+        key: (raw, decode_classification(raw, decoder_map, repair_index, min_similarity))
+        for key, (raw, _) in records.items()
+    }
+
+
+def classify_dataframe(
+    df: pd.DataFrame,
+    occupation_column: str,
+    decoder_map: Dict[str, str],
+    output_col: str = "final_output",
+    method_col: str = "method",
+    raw_col: str = "raw_output",
+    cache: Optional[ClassificationCache] = None,
+    **batch_kwargs
+) -> pd.DataFrame:
+    """
+    Sends every row that has an occupation but no final_output yet (e.g. the
+    rows pre_match_occupation missed) to the model, once per distinct title.
+    Decoded rows get method = 'fine_tuned_model', or 'model_repaired' when
+    the output only decoded via the repair index; the raw output is kept in
+    raw_col either way. With a cache, titles already classified in earlier
+    runs are answered from it and new results are added to it.
+    """
+    if output_col not in df.columns:
+        df[output_col] = pd.Series(np.nan, index=df.index, dtype=object)
+    if method_col not in df.columns:
+        df[method_col] = pd.Series(np.nan, index=df.index, dtype=object)
+    df[output_col] = df[output_col].astype(object)
+    df[method_col] = df[method_col].astype(object)
+    df[raw_col] = pd.Series(np.nan, index=df.index, dtype=object)
+
+    todo = df[output_col].isna() & df[occupation_column].notna()
+    titles = pd.unique(df.loc[todo, occupation_column].astype(str))
+
+    if cache is None:
+        results = dict(zip(titles, classify_batch(list(titles), decoder_map, **batch_kwargs)))
+    else:
+        # Titles that normalize to the same cache key share one request
+        cached = redecode(
+            cache.get_many(titles), decoder_map, batch_kwargs.get("repair_index"),
+            batch_kwargs.get("min_similarity", DEFAULT_REPAIR_SIMILARITY)
+        )
+        pending = {}
+        for title in titles:
+            key = normalize_title(title)
+            if key not in cached:
+                pending.setdefault(key, title)
+        fresh = classify_batch(list(pending.values()), decoder_map, **batch_kwargs)
+        cached.update(zip(pending, fresh))
+        cache.put_many((title, raw, decoded) for title, (raw, decoded) in zip(pending.values(), fresh))
+        results = {title: cached[normalize_title(title)] for title in titles}
+
+    row_titles = df.loc[todo, occupation_column].astype(str)
+    df.loc[todo, raw_col] = row_titles.map(lambda t: results[t][0])
+    decoded = row_titles.map(lambda t: results[t][1])
+    decoded_rows = decoded.index[decoded.notna()]
+    df.loc[decoded_rows, output_col] = decoded[decoded_rows]
+    exact = df.loc[decoded_rows, raw_col].isin(decoder_map.keys())
+    df.loc[decoded_rows, method_col] = np.where(exact, "fine_tuned_model", "model_repaired")
+    return df
+
+
+def read_pending_titles(input_path, occupation_column, done, output_col, chunksize) -> List[str]:
+    """
+    Distinct titles of the rows that still need the model, in first-seen row
+    order, keyed by normalize_title and excluding keys in `done`.
+    """
+    header = pd.read_csv(input_path, nrows=0).columns
+    usecols = [occupation_column] + ([output_col] if output_col in header else [])
+    pending = {}
+    for chunk in pd.read_csv(input_path, usecols=usecols, chunksize=chunksize):
+        todo = chunk[occupation_column].notna()
+        if output_col in chunk.columns:
+            todo &= chunk[output_col].isna()
+        for title in pd.unique(chunk.loc[todo, occupation_column].astype(str)):
+            key = normalize_title(title)
+            if key not in done and key not in pending:
+                pending[key] = title
+    return list(pending.values())
+
+
+def write_classified_csv(
+    input_path: str,
+    output_path: str,
+    occupation_column: str,
+    records: Union[
+        Dict[str, Tuple[str, Optional[str]]],
+        Callable[[List[str]], Dict[str, Tuple[str, Optional[str]]]]
+    ],
+    decoder_map: Dict[str, str],
+    key: Callable[[str], str] = normalize_title,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    output_col: str = "final_output",
+    method_col: str = "method",
+    raw_col: str = "raw_output"
+) -> Tuple[int, int]:
+    """
+    Streams input_path to output_path in chunks of `chunksize` rows, filling
+    each row that still needs the model from `records`, {key(title): (raw
+    output, decoded label or None)}, the way classify_dataframe would.
+    `records` can also be a function returning that dict for a list of keys,
+    called once per chunk, so the records don't all have to be in memory.
+
+    Returns:
+        Tuple[int, int]: Rows written and rows filled from a successful
+        record (not an "Error: ..." one).
+    """
+    rows = filled = 0
+    with open(output_path, "w", encoding="utf-8", newline="") as out:
+        for i, chunk in enumerate(pd.read_csv(input_path, chunksize=chunksize)):
+            for col in (output_col, method_col):
+                if col not in chunk.columns:
+                    chunk[col] = np.nan
+                chunk[col] = chunk[col].astype(object)
+            chunk[raw_col] = pd.Series(np.nan, index=chunk.index, dtype=object)
+
+            todo = chunk[output_col].isna() & chunk[occupation_column].notna()
+            titles = chunk.loc[todo, occupation_column].astype(str)
+            keys = titles.map({title: key(title) for title in pd.unique(titles)})
+            chunk_records = records(list(pd.unique(keys))) if callable(records) else records
+            found = keys.map(chunk_records).dropna()
+            if len(found):
+                raw_outputs = found.str[0]
+                chunk.loc[found.index, raw_col] = raw_outputs
+                filled += int((~raw_outputs.str.startswith("Error:")).sum())
+                decoded = found.str[1].dropna()
+                chunk.loc[decoded.index, output_col] = decoded
+                exact = chunk.loc[decoded.index, raw_col].isin(decoder_map.keys())
+                chunk.loc[decoded.index, method_col] = np.where(exact, "fine_tuned_model", "model_repaired")
+
+            chunk.to_csv(out, index=False, header=(i == 0))
+            rows += len(chunk)
+    return rows, filled
+
+
+def classify_file_resumable(
+    input_path: str,
+    output_path: str,
+    occupation_column: str,
+    decoder_map: Dict[str, str],
+    journal_path: str,
+    create: Optional[Callable] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    repair_index=None,
+    min_similarity: float = DEFAULT_REPAIR_SIMILARITY,
+    cache: Optional[ClassificationCache] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    output_col: str = "final_output",
+    method_col: str = "method",
+    raw_col: str = "raw_output"
+) -> dict:
+    """
+    classify_dataframe for runs too long to lose: every finished title is
+    appended to a ClassificationJournal as soon as its request completes.
+    Rerunning with the same journal after a crash or Ctrl-C skips the
+    titles already in it (and retries ones that ended in "Error: ..."),
+    picking up at the first row whose title is not done yet.
+
+    The first run streams the input twice, in chunks of `chunksize` rows:
+    once to collect the pending titles, which it saves next to the journal
+    (<journal>.pending), and once to write the output, filling each row from
+    the journal. A resume reads the saved titles instead of scanning the
+    input again, as long as the input's mtime and size are unchanged, but
+    it still streams the whole input to write the output, so restart time
+    grows with the input size. Memory holds the pending titles and one
+    journal offset per finished title; records are read back from the
+    journal (and re-decoded) a chunk at a time while writing the output.
+
+    Returns:
+        dict: Counts for the run (resumed, sent, errors, rows written).
+    """
+    with ClassificationJournal(journal_path) as journal:
+        # {key: journal offset} of the finished titles
+        done = journal.index()
+        resumed = len(done)
+        stat = os.stat(input_path)
+        source = {"input": os.path.abspath(input_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                  "column": occupation_column, "output_col": output_col}
+        sidecar = pending_titles_path(journal_path)
+        titles = read_pending_titles_file(sidecar, source)
+        if titles is None:
+            titles = read_pending_titles(input_path, occupation_column, {}, output_col, chunksize)
+            write_pending_titles(sidecar, titles, source)
+        pending = [title for title in titles if normalize_title(title) not in done]
+
+        if cache is not None and pending:
+            cached = redecode(cache.get_many(pending), decoder_map, repair_index, min_similarity)
+            for title in pending:
+                key = normalize_title(title)
+                if key in cached:
+                    done[key] = journal.append(key, *cached[key])
+            pending = [t for t in pending if normalize_title(t) not in cached]
+
+        errors = 0
+        classify = partial(
+            classify_with_retry, create=create, max_retries=max_retries, backoff_seconds=backoff_seconds
+        )
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            # Submit in windows so an interrupt leaves few requests in flight
+            window = max_workers * 16
+            for start in range(0, len(pending), window):
+                futures = {executor.submit(classify, title): title for title in pending[start:start + window]}
+                for future in as_completed(futures):
+                    title = futures[future]
+                    raw = future.result()
+                    decoded = decode_classification(raw, decoder_map, repair_index, min_similarity)
+                    done[normalize_title(title)] = journal.append(normalize_title(title), raw, decoded)
+                    if raw.startswith("Error:"):
+                        errors += 1
+                    elif cache is not None:
+                        cache.put(title, raw, decoded)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            journal.sync()
+
+        def chunk_records(keys):
+            records = journal.get_many({key: done[key] for key in keys if key in done})
+            return redecode(records, decoder_map, repair_index, min_similarity)
+
+        rows, _ = write_classified_csv(
+            input_path, output_path, occupation_column, chunk_records, decoder_map, chunksize=chunksize,
+            output_col=output_col, method_col=method_col, raw_col=raw_col
+        )
+    return {"resumed_titles": resumed, "sent_titles": len(pending), "errors": errors, "rows": rows}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Classify the occupation column of a CSV with the fine-tuned model, concurrently."
+    )
+    parser.add_argument("--input", required=True, help="CSV file (e.g. the output of a pre-match run).")
+    parser.add_argument("--output", required=True, help="Path for the output CSV.")
+    parser.add_argument("--column", required=True, help="Name of the occupation column.")
+    parser.add_argument("--decoder", required=True, help="Path to finetune.jsonl.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"Maximum concurrent requests (default: {DEFAULT_MAX_WORKERS}).")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f"Retries per title on rate-limit errors (default: {DEFAULT_MAX_RETRIES}).")
+    parser.add_argument("--api-base", help="Alternative API endpoint, e.g. a local stub server.")
+    parser.add_argument("--cache", help="SQLite classification cache to read from and add to.")
+    parser.add_argument("--journal",
+                        help="Progress journal; makes the run resumable. Rerun with the same journal "
+                             "to continue an interrupted run without repeating finished requests.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f"Rows per chunk when streaming with --journal (default: {DEFAULT_CHUNKSIZE}).")
+    parser.add_argument("--metrics", help="Write per-stage metrics here (.prom for Prometheus text, else JSON).")
+    parser.add_argument("--repair-similarity", type=float, default=DEFAULT_REPAIR_SIMILARITY,
+                        help="Minimum similarity for mapping undecodable outputs to the nearest "
+                             f"valid label (default: {DEFAULT_REPAIR_SIMILARITY}; above 1 disables repair).")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key and not args.api_base:
+        print("Set OPENAI_API_KEY (or pass --api-base for a local endpoint).")
+        sys.exit(1)
+
+    if args.metrics:
+        metrics.enable()
+
+    decoder_map = load_decoder(args.decoder)
+    create = make_openai_create(api_key or "stub", args.api_base)
+    cache = ClassificationCache(args.cache) if args.cache else None
+
+    start = time.perf_counter()
+    if args.journal:
+        try:
+            stats = classify_file_resumable(
+                args.input, args.output, args.column, decoder_map, args.journal,
+                create=create, max_workers=args.workers, max_retries=args.max_retries,
+                repair_index=build_repair_index(decoder_map), min_similarity=args.repair_similarity,
+                cache=cache, chunksize=args.chunksize
+            )
+        except KeyboardInterrupt:
+            print(f"Interrupted. Progress is saved in {args.journal}; rerun the same command to resume.")
+            sys.exit(130)
+        print(f"Resumed {stats['resumed_titles']} finished titles, sent {stats['sent_titles']} "
+              f"({stats['errors']} errors), wrote {stats['rows']} rows "
+              f"in {time.perf_counter() - start:.1f}s. Output: {args.output}")
+    else:
+        df = classify_dataframe(
+            pd.read_csv(args.input), args.column, decoder_map, cache=cache,
+            create=create, max_workers=args.workers, max_retries=args.max_retries,
+            repair_index=build_repair_index(decoder_map), min_similarity=args.repair_similarity
+        )
+        elapsed = time.perf_counter() - start
+        df.to_csv(args.output, index=False)
+        n_sent = int(df["raw_output"].notna().sum())
+        n_decoded = int((df["method"] == "fine_tuned_model").sum())
+        n_repaired = int((df["method"] == "model_repaired").sum())
+        print(f"Classified {n_sent} rows ({n_decoded} decoded, {n_repaired} repaired) "
+              f"in {elapsed:.1f}s. Output: {args.output}")
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+    if args.metrics:
+        metrics.dump(args.metrics)
@@ -0,0 +1,308 @@
+"""
+Offline batch-job mode for large backfills.
+
+`build` writes one provider batch request per distinct pending title
+(the same request get_classification would send) into size-limited JSONL
+shards to upload as batch jobs. `ingest` streams the result files the
+provider returns, decodes them and joins them back onto the input rows.
+
+Each request's custom_id is derived from the normalized title, so ingest
+needs nothing from build but the input CSV and the result files. Both
+sides stream: memory holds one entry per distinct title, never the input
+rows or the result files.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+from batch_classify import DEFAULT_CHUNKSIZE, read_pending_titles, redecode, write_classified_csv
+from classification import (
+    DEFAULT_REPAIR_SIMILARITY,
+    MAX_TOKENS,
+    MODEL_ID,
+    PROMPT_VERSION,
+    TEMPERATURE,
+    build_messages,
+    build_repair_index,
+    decode_classification,
+    load_decoder,
+)
+from classification_cache import ClassificationCache, normalize_title
+
+# OpenAI's batch API takes at most 50,000 requests and 200 MB per input file
+MAX_REQUESTS_PER_SHARD = 50_000
+MAX_SHARD_BYTES = 200 * 1000 * 1000
+BATCH_ENDPOINT = "/v1/chat/completions"
+MANIFEST_NAME = "manifest.json"
+
+
+def batch_custom_id(occup_title: str) -> str:
+    """
+    Stable custom_id of a title's batch request; titles with the same
+    normalize_title share it.
+    """
+    return "occ-" + hashlib.sha1(normalize_title(occup_title).encode("utf-8")).hexdigest()[:24]
+
+
+def build_request_line(occup_title: str) -> str:
+    """
+    One batch request line with the settings of request_classification.
+    """
+    return json.dumps({
+        "custom_id": batch_custom_id(occup_title),
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": MODEL_ID,
+            "messages": build_messages(occup_title),
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE,
+        },
+    }, ensure_ascii=False)
+
+
+def write_request_shards(
+    titles: Iterable[str],
+    output_dir: str,
+    max_requests: int = MAX_REQUESTS_PER_SHARD,
+    max_bytes: int = MAX_SHARD_BYTES,
+    prefix: str = "requests"
+) -> List[dict]:
+    """
+    Writes one request per title to output_dir/<prefix>-00000.jsonl,
+    -00001.jsonl, ..., starting a new shard before one would exceed
+    max_requests lines or max_bytes.
+
+    Returns:
+        List[dict]: {"path", "requests", "bytes"} per shard, in order.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shards = []
+    out = None
+    try:
+        for title in titles:
+            line = (build_request_line(title) + "\n").encode("utf-8")
+            if len(line) > max_bytes:
+                raise ValueError(f"A single request is larger than max_bytes ({max_bytes}): {title[:80]!r}")
+            if out is None or shards[-1]["requests"] >= max_requests or shards[-1]["bytes"] + len(line) > max_bytes:
+                if out is not None:
+                    out.close()
+                path = output_dir / f"{prefix}-{len(shards):05d}.jsonl"
+                out = open(path, "wb")
+                shards.append({"path": str(path), "requests": 0, "bytes": 0})
+            out.write(line)
+            shards[-1]["requests"] += 1
+            shards[-1]["bytes"] += len(line)
+    finally:
+        if out is not None:
+            out.close()
+    return shards
+
+
+def build_batch_requests(
+    input_path: str,
+    occupation_column: str,
+    output_dir: str,
+    cache: Optional[ClassificationCache] = None,
+    max_requests: int = MAX_REQUESTS_PER_SHARD,
+    max_bytes: int = MAX_SHARD_BYTES,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    output_col: str = "final_output"
+) -> dict:
+    """
+    Turns the rows of input_path that still need the model (no final_output
+    yet, e.g. after a pre-match run) into batch request shards, one request
+    per distinct normalized title. Titles already in the cache are skipped.
+    A manifest.json describing the shards is written next to them.
+
+    Returns:
+        dict: The manifest.
+    """
+    pending = read_pending_titles(input_path, occupation_column, {}, output_col, chunksize)
+    skipped = 0
+    if cache is not None and pending:
+        cached = cache.get_many(pending)
+        skipped = len(cached)
+        pending = [title for title in pending if normalize_title(title) not in cached]
+
+    shards = write_request_shards(pending, output_dir, max_requests, max_bytes)
+    manifest = {
+        "input": str(input_path),
+        "column": occupation_column,
+        "model": MODEL_ID,
+        "prompt_version": PROMPT_VERSION,
+        "requests": len(pending),
+        "cached_titles_skipped": skipped,
+        "shards": shards,
+    }
+    with open(Path(output_dir) / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    metrics.inc("batch_requests_written", len(pending))
+    return manifest
+
+
+def parse_result_line(line: str) -> Tuple[str, str]:
+    """
+    (custom_id, raw output) of one batch result line; failed requests come
+    back as "Error: ..." like classify_with_retry.
+    """
+    record = json.loads(line)
+    custom_id = record["custom_id"]
+    error = record.get("error")
+    if error:
+        return custom_id, f"Error: {error.get('message') or error.get('code') or error}"
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    if response.get("status_code", 200) != 200:
+        message = (body.get("error") or {}).get("message", "")
+        return custom_id, f"Error: HTTP {response.get('status_code')} {message}".rstrip()
+    try:
+        return custom_id, body["choices"][0]["message"]["content"].strip()
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return custom_id, "Error: Result has no message content."
+
+
+def iter_batch_results(paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Streams (custom_id, raw output) from result files, one line at a time.
+    """
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield parse_result_line(line)
+
+
+def ingest_batch_results(
+    input_path: str,
+    result_paths: Iterable[str],
+    output_path: str,
+    occupation_column: str,
+    decoder_map: Dict[str, str],
+    repair_index=None,
+    min_similarity: float = DEFAULT_REPAIR_SIMILARITY,
+    cache: Optional[ClassificationCache] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE
+) -> dict:
+    """
+    Decodes the batch results and writes input_path to output_path with
+    them joined onto the rows by custom_id, filling final_output, method and
+    raw_output like classify_dataframe. With a cache, titles without a
+    successful result (e.g. those build skipped as cached) are filled from
+    it, and new results are added to it; other rows are left unfilled.
+
+    Returns:
+        dict: Counts for the run (results, errors, rows written, rows filled).
+    """
+    records: Dict[str, Tuple[str, Optional[str]]] = {}
+    results = errors = 0
+    with metrics.timer("batch_ingest_results"):
+        for custom_id, raw in iter_batch_results(result_paths):
+            results += 1
+            if raw.startswith("Error:"):
+                errors += 1
+                # A retried request may have succeeded in another result file
+                records.setdefault(custom_id, (raw, None))
+                continue
+            records[custom_id] = (raw, decode_classification(raw, decoder_map, repair_index, min_similarity))
+
+    if cache is not None:
+        # One more pass over the titles: cache the new results and pick up
+        # the titles build skipped because they were already cached
+        titles = read_pending_titles(input_path, occupation_column, {}, "final_output", chunksize)
+        cached = redecode(cache.get_many(titles), decoder_map, repair_index, min_similarity)
+        fresh = []
+        for title in titles:
+            custom_id = batch_custom_id(title)
+            record = records.get(custom_id)
+            if record is not None and not record[0].startswith("Error:"):
+                fresh.append((title, *record))
+            elif normalize_title(title) in cached:
+                records[custom_id] = cached[normalize_title(title)]
+        cache.put_many(fresh)
+
+    with metrics.timer("batch_ingest_join"):
+        rows, filled = write_classified_csv(
+            input_path, output_path, occupation_column, records, decoder_map,
+            key=batch_custom_id, chunksize=chunksize
+        )
+    return {"results": results, "errors": errors, "rows": rows, "rows_filled": filled}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Classify a large CSV through provider batch jobs instead of per-request calls."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Write batch request shards for the titles that need the model.")
+    build.add_argument("--input", required=True, help="CSV file (e.g. the output of a pre-match run).")
+    build.add_argument("--column", required=True, help="Name of the occupation column.")
+    build.add_argument("--output-dir", required=True, help="Directory for the request shards and manifest.json.")
+    build.add_argument("--max-requests", type=int, default=MAX_REQUESTS_PER_SHARD,
+                       help=f"Requests per shard (default: {MAX_REQUESTS_PER_SHARD}).")
+    build.add_argument("--max-bytes", type=int, default=MAX_SHARD_BYTES,
+                       help=f"Bytes per shard (default: {MAX_SHARD_BYTES}).")
+    build.add_argument("--cache", help="SQLite classification cache; cached titles are not requested.")
+    build.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                       help=f"Rows per chunk when streaming the input (default: {DEFAULT_CHUNKSIZE}).")
+
+    ingest = subparsers.add_parser("ingest", help="Join batch result files back onto the input rows.")
+    ingest.add_argument("--input", required=True, help="The CSV the requests were built from.")
+    ingest.add_argument("--results", required=True, nargs="+", help="Batch result JSONL files.")
+    ingest.add_argument("--output", required=True, help="Path for the output CSV.")
+    ingest.add_argument("--column", required=True, help="Name of the occupation column.")
+    ingest.add_argument("--decoder", required=True, help="Path to finetune.jsonl.")
+    ingest.add_argument("--cache", help="SQLite classification cache to read from and add to.")
+    ingest.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f"Rows per chunk when streaming the input (default: {DEFAULT_CHUNKSIZE}).")
+    ingest.add_argument("--repair-similarity", type=float, default=DEFAULT_REPAIR_SIMILARITY,
+                        help="Minimum similarity for mapping undecodable outputs to the nearest "
+                             f"valid label (default: {DEFAULT_REPAIR_SIMILARITY}; above 1 disables repair).")
+    for subparser in (build, ingest):
+        subparser.add_argument("--metrics",
+                               help="Write per-stage metrics here (.prom for Prometheus text, else JSON).")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.metrics:
+        metrics.enable()
+    cache = ClassificationCache(args.cache) if args.cache else None
+
+    start = time.perf_counter()
+    if args.command == "build":
+        manifest = build_batch_requests(
+            args.input, args.column, args.output_dir, cache=cache,
+            max_requests=args.max_requests, max_bytes=args.max_bytes, chunksize=args.chunksize
+        )
+        print(f"Wrote {manifest['requests']} requests in {len(manifest['shards'])} shards "
+              f"({manifest['cached_titles_skipped']} cached titles skipped) "
+              f"in {time.perf_counter() - start:.1f}s. Manifest: "
+              f"{os.path.join(args.output_dir, MANIFEST_NAME)}")
+    else:
+        missing = [path for path in args.results if not os.path.exists(path)]
+        if missing:
+            print(f"Result file not found: {', '.join(missing)}")
+            sys.exit(1)
+        decoder_map = load_decoder(args.decoder)
+        stats = ingest_batch_results(
+            args.input, args.results, args.output, args.column, decoder_map,
+            repair_index=build_repair_index(decoder_map), min_similarity=args.repair_similarity,
+            cache=cache, chunksize=args.chunksize
+        )
+        print(f"Ingested {stats['results']} results ({stats['errors']} errors), filled "
+              f"{stats['rows_filled']} of {stats['rows']} rows in {time.perf_counter() - start:.1f}s. "
+              f"Output: {args.output}")
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+    if args.metrics:
+        metrics.dump(args.metrics)
@@ -0,0 +1,136 @@
+import argparse
+import csv
+import sys
+import time
+from typing import Iterator, List, Tuple
+
+import pandas as pd
+
+import metrics
+from embedding_index import PRECISIONS, CompletionIndex, QueryEmbeddingCache, encode_normalized, top_k_indices
+from suggestion_client import SuggestionClient
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_BATCH_SIZE = 256
+
+
+def suggest_completions_batch(
+    titles: List[str],
+    index: CompletionIndex,
+    model,
+    k: int = 5,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    query_cache: QueryEmbeddingCache = None
+) -> Iterator[Tuple[str, List[Tuple[str, float]]]]:
+    """
+    Batch version of suggest_completions_semantically. Encodes the titles
+    `batch_size` at a time, scores each batch against the label matrix with
+    one matrix multiply, and keeps the top k labels per title.
+
+    Args:
+        titles (List[str]): Occupation titles to suggest labels for.
+        index (CompletionIndex): Completion embedding index.
+        model: A loaded SentenceTransformer (the one the index was built with).
+        k (int, optional): Number of candidates per title.
+        batch_size (int, optional): Titles encoded and scored per batch.
+        query_cache (QueryEmbeddingCache, optional): Reuse embeddings of titles seen before.
+
+    Yields:
+        (title, [(label, score), ...]) in input order, candidates best first.
+    """
+    for start in range(0, len(titles), batch_size):
+        batch = titles[start:start + batch_size]
+        with metrics.timer("suggest_batch"):
+            if query_cache is not None:
+                queries = query_cache.encode(batch, batch_size=batch_size)
+            else:
+                queries = encode_normalized(model, batch, batch_size=batch_size)
+            similarities = index.scores(queries)
+            top = top_k_indices(similarities, k)
+        metrics.inc("suggest_batch_titles", len(batch))
+        for row, title in enumerate(batch):
+            yield title, [(index.labels[i], float(similarities[row, i])) for i in top[row]]
+
+
+def read_titles(csv_path: str, occupation_column: str, only_unmatched: bool = False) -> List[str]:
+    """
+    Distinct, stripped, non-empty titles from a CSV column, in first-seen order.
+    With only_unmatched, rows that already have a 'final_output' (e.g. the
+    output of a pre-match run) are skipped.
+    """
+    usecols = [occupation_column, "final_output"] if only_unmatched else [occupation_column]
+    df = pd.read_csv(csv_path, usecols=usecols)
+    column = df[occupation_column]
+    if only_unmatched:
+        column = column[df["final_output"].isna()]
+    titles = column.dropna().astype(str).str.strip()
+    return [t for t in pd.unique(titles) if t]
+
+
+def write_candidates(output_path: str, ranked) -> int:
+    """
+    Streams (title, rank, label, score) rows to a CSV; returns the number of titles written.
+    """
+    n_titles = 0
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "rank", "label", "score"])
+        for title, candidates in ranked:
+            for rank, (label, score) in enumerate(candidates, start=1):
+                writer.writerow([title, rank, label, f"{score:.4f}"])
+            n_titles += 1
+    return n_titles
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write ranked candidate labels (title, rank, label, score) for many titles at once."
+    )
+    parser.add_argument("--input", required=True, help="CSV file with occupation titles.")
+    parser.add_argument("--column", required=True, help="Name of the occupation column.")
+    parser.add_argument("--dict", dest="jsonl_path", required=True, help="Path to finetune.jsonl.")
+    parser.add_argument("--output", required=True, help="Path for the ranked-candidates CSV.")
+    parser.add_argument("--k", type=int, default=5, help="Candidates per title (default: 5).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Titles encoded per batch (default: {DEFAULT_BATCH_SIZE}).")
+    parser.add_argument("--only-unmatched", action="store_true",
+                        help="Skip rows that already have a 'final_output' value.")
+    parser.add_argument("--metrics", help="Write per-stage metrics here (.prom for Prometheus text, else JSON).")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32",
+                        help="Storage precision of the label embeddings (default: float32).")
+    parser.add_argument("--server", nargs="?", const="default",
+                        help="Get suggestions from a running suggestion server (optionally its URL) "
+                             "instead of loading the model here.")
+    parser.add_argument("--model", default=MODEL_NAME, help=f"SentenceTransformer model (default: {MODEL_NAME}).")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.metrics:
+        metrics.enable()
+    titles = read_titles(args.input, args.column, args.only_unmatched)
+    print(f"Loaded {len(titles)} distinct titles from {args.input}")
+
+    if args.server:
+        client = SuggestionClient() if args.server == "default" else SuggestionClient(args.server)
+        if not client.serves(args.jsonl_path, args.model):
+            print(f"No suggestion server at {client.url} with model {args.model} and {args.jsonl_path}.")
+            sys.exit(1)
+        print(f"Using suggestion server at {client.url} ({client.health()['labels']} labels).")
+        ranked = client.suggest_batch(titles, args.k)
+    else:
+        from sentence_transformers import SentenceTransformer
+
+        print("Loading sentence transformer model...")
+        model = SentenceTransformer(args.model)
+        index = CompletionIndex.load_or_build(args.jsonl_path, model, args.model, precision=args.precision)
+        print(f"Embedding index ready ({len(index)} labels).")
+        ranked = suggest_completions_batch(titles, index, model, args.k, args.batch_size)
+
+    start = time.perf_counter()
+    n_titles = write_candidates(args.output, ranked)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote candidates for {n_titles} titles to {args.output} in {elapsed:.1f}s")
+    if args.metrics:
+        metrics.dump(args.metrics)
@@ -0,0 +1,204 @@
+import argparse
+import os
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from batch_classify import DEFAULT_MAX_WORKERS, classify_dataframe, make_openai_create
+from batch_suggest import MODEL_NAME, suggest_completions_batch
+from classification import build_repair_index, decode_with_score, load_decoder
+from classification_cache import ClassificationCache
+from embedding_index import PRECISIONS, CompletionIndex
+from pre_matching import load_pre_match_dict, pre_match_occupation
+
+DEFAULT_MIN_EMBEDDING_SIMILARITY = 0.85
+
+
+def embedding_match_occupation(
+    df: pd.DataFrame,
+    occupation_column: str,
+    example_index: CompletionIndex,
+    pre_match_dict: Dict[str, str],
+    model,
+    min_similarity: float = DEFAULT_MIN_EMBEDDING_SIMILARITY,
+    output_col: str = "final_output",
+    method_col: str = "method",
+    score_col: str = "match_score"
+) -> pd.DataFrame:
+    """
+    Embedding tier of the cascade. Each distinct still-unmatched occupation is
+    compared with the labeled prompt_occupation examples; if the nearest
+    example has a similarity of at least min_similarity, the row takes that example's
+    completion with method = 'embedding_match' and the similarity as score.
+
+    Args:
+        df (pd.DataFrame): Output of pre_match_occupation.
+        occupation_column (str): Name of the column with occupation data.
+        example_index (CompletionIndex): Index built with kind="examples".
+        pre_match_dict (Dict[str, str]): Maps the example texts to completions.
+        model: The SentenceTransformer the index was built with.
+        min_similarity (float, optional): Cosine similarity needed to accept a match.
+
+    Returns:
+        pd.DataFrame: The DataFrame with accepted rows filled in.
+    """
+    if score_col not in df.columns:
+        df[score_col] = np.where(df[method_col] == "pre_match", 1.0, np.nan)
+    df[output_col] = df[output_col].astype(object)
+    df[method_col] = df[method_col].astype(object)
+
+    todo = df[output_col].isna() & df[occupation_column].notna()
+    titles = list(pd.unique(df.loc[todo, occupation_column].astype(str)))
+    matches = {}
+    for title, candidates in suggest_completions_batch(titles, example_index, model, k=1):
+        example, score = candidates[0]
+        if score >= min_similarity:
+            matches[title] = (pre_match_dict[example], score)
+
+    if matches:
+        row_titles = df.loc[todo, occupation_column].astype(str)
+        rows = row_titles.index[row_titles.isin(matches.keys())]
+        df.loc[rows, output_col] = row_titles[rows].map(lambda t: matches[t][0])
+        df.loc[rows, method_col] = "embedding_match"
+        df.loc[rows, score_col] = row_titles[rows].map(lambda t: matches[t][1])
+    return df
+
+
+def run_cascade(
+    df: pd.DataFrame,
+    occupation_column: str,
+    jsonl_path: str,
+    model,
+    example_index: CompletionIndex,
+    min_similarity: float = DEFAULT_MIN_EMBEDDING_SIMILARITY,
+    create=None,
+    cache: Optional[ClassificationCache] = None,
+    dry_run: bool = False,
+    **batch_kwargs
+) -> Tuple[pd.DataFrame, dict]:
+    """
+    Confidence-gated cascade: exact dictionary pre-match, then embedding
+    similarity against the labeled examples, then the fine-tuned model for
+    whatever is left. The method column records the deciding tier and
+    match_score its confidence.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame.
+        occupation_column (str): Name of the column with occupation data.
+        jsonl_path (str): Path to finetune.jsonl (dictionary, examples and decoder).
+        model: A loaded SentenceTransformer.
+        example_index (CompletionIndex): Index built with kind="examples".
+        min_similarity (float, optional): Cosine similarity the embedding tier needs.
+        create (Callable, optional): Client call for the model tier.
+        cache (ClassificationCache, optional): Cache for the model tier.
+        dry_run (bool, optional): Stop before the model tier, e.g. to see how
+            many calls a run would make.
+        **batch_kwargs: Passed on to classify_dataframe.
+
+    Returns:
+        Tuple[pd.DataFrame, dict]: The classified DataFrame and per-tier counts,
+        including how many model calls the first two tiers saved.
+    """
+    pre_match_dict = load_pre_match_dict(jsonl_path)
+    df = pre_match_occupation(df, occupation_column, pre_match_dict)
+    with metrics.timer("embedding_match"):
+        df = embedding_match_occupation(
+            df, occupation_column, example_index, pre_match_dict, model, min_similarity
+        )
+
+    present = df[occupation_column].notna()
+    distinct_titles = df.loc[present, occupation_column].astype(str).nunique()
+    todo = df["final_output"].isna() & present
+    model_titles = df.loc[todo, occupation_column].astype(str).nunique()
+
+    if not dry_run and model_titles:
+        decoder_map = load_decoder(jsonl_path)
+        repair_index = build_repair_index(decoder_map)
+        df = classify_dataframe(
+            df, occupation_column, decoder_map, cache=cache, create=create,
+            repair_index=repair_index, **batch_kwargs
+        )
+        decoded = todo & df["final_output"].notna()
+        df.loc[decoded, "match_score"] = [
+            decode_with_score(raw, decoder_map, repair_index)[1] for raw in df.loc[decoded, "raw_output"]
+        ]
+
+    method_counts = df["method"].value_counts()
+    stats = {
+        "rows": len(df),
+        "pre_match": int(method_counts.get("pre_match", 0)),
+        "embedding_match": int(method_counts.get("embedding_match", 0)),
+        "fine_tuned_model": int(method_counts.get("fine_tuned_model", 0)),
+        "model_repaired": int(method_counts.get("model_repaired", 0)),
+        "unresolved": int(df["final_output"].isna().sum()),
+        "distinct_titles": int(distinct_titles),
+        # Without the cascade every distinct title would go to the model
+        "titles_sent_to_model": int(model_titles),
+        "model_calls_saved": int(distinct_titles - model_titles),
+    }
+    return df, stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Classify occupations with the cascade: exact pre-match -> "
+                    "embedding similarity -> fine-tuned model."
+    )
+    parser.add_argument("--input", required=True, help="CSV file containing occupation data.")
+    parser.add_argument("--output", required=True, help="Path for the output CSV.")
+    parser.add_argument("--column", required=True, help="Name of the occupation column.")
+    parser.add_argument("--dict", dest="jsonl_path", required=True, help="Path to finetune.jsonl.")
+    parser.add_argument("--min-similarity", type=float, default=DEFAULT_MIN_EMBEDDING_SIMILARITY,
+                        help=f"Similarity the embedding tier needs (default: {DEFAULT_MIN_EMBEDDING_SIMILARITY}).")
+    parser.add_argument("--model", default=MODEL_NAME, help=f"SentenceTransformer model (default: {MODEL_NAME}).")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32",
+                        help="Storage precision of the example embeddings (default: float32).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"Maximum concurrent model requests (default: {DEFAULT_MAX_WORKERS}).")
+    parser.add_argument("--api-base", help="Alternative API endpoint, e.g. a local stub server.")
+    parser.add_argument("--cache", help="SQLite classification cache for the model tier.")
+    parser.add_argument("--metrics", help="Write per-stage metrics here (.prom for Prometheus text, else JSON).")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Skip the model tier and only report how many titles it would get.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+
+    args = parse_args()
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not (api_key or args.api_base or args.dry_run):
+        print("Set OPENAI_API_KEY, pass --api-base for a local endpoint, or use --dry-run.")
+        sys.exit(1)
+
+    if args.metrics:
+        metrics.enable()
+
+    print("Loading sentence transformer model...")
+    model = SentenceTransformer(args.model)
+    example_index = CompletionIndex.load_or_build(args.jsonl_path, model, args.model, kind="examples",
+                                                  precision=args.precision)
+    print(f"Example index ready ({len(example_index)} labeled examples).")
+
+    start = time.perf_counter()
+    df, stats = run_cascade(
+        pd.read_csv(args.input), args.column, args.jsonl_path, model, example_index,
+        min_similarity=args.min_similarity,
+        create=None if args.dry_run else make_openai_create(api_key or "stub", args.api_base),
+        cache=ClassificationCache(args.cache) if args.cache else None,
+        dry_run=args.dry_run,
+        max_workers=args.workers
+    )
+    elapsed = time.perf_counter() - start
+
+    df.to_csv(args.output, index=False)
+    for name, value in stats.items():
+        print(f"{name:>22}: {value}")
+    print(f"Finished in {elapsed:.1f}s. Output: {args.output}")
+    if args.metrics:
+        metrics.dump(args.metrics)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from finetune_data import load_finetune_data
+
+if TYPE_CHECKING:
+    # pre_matching imports pandas; only build_repair_index needs it at runtime
+    from pre_matching import FuzzyIndex
+
+MODEL_ID = "ft:gpt-3.5-turbo-0613:personal::7qnGb8rm"
+SYSTEM_PROMPT = "classify this entry:"
+MAX_TOKENS = 50
+TEMPERATURE = 0.1
+# Minimum similarity for mapping an undecodable output to its nearest valid label
+DEFAULT_REPAIR_SIMILARITY = 0.8
+
+# Identifies the request settings above; cached results are only reused
+# while the prompt, max_tokens and temperature are unchanged.
+PROMPT_VERSION = hashlib.sha1(
+    json.dumps([SYSTEM_PROMPT, MAX_TOKENS, TEMPERATURE]).encode("utf-8")
+).hexdigest()[:12]
+
+
+def build_messages(occup_title: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": occup_title}
+    ]
+
+
+def load_decoder(decoder_path) -> Dict[str, str]:
+    """
+    Maps each 'transformed_completion' (what the fine-tuned model emits) in
+    finetune.jsonl to its human-readable 'completion'. Served from the shared
+    load_finetune_data cache, so Streamlit reruns don't re-read the file.
+    """
+    return load_finetune_data(decoder_path).decoder
+
+
+def request_classification(occup_title: str, create: Optional[Callable] = None) -> str:
+    """
+    Sends one title to the fine-tuned model and returns its raw output.
+    Errors from the client are raised, so callers can decide whether to retry.
+
+    Args:
+        occup_title (str): The occupation title to classify.
+        create (Callable, optional): Anything with the signature of
+            openai.ChatCompletion.create (the default). Lets batch runs and
+            tests swap in another endpoint or a local stub.
+
+    Returns:
+        str: The stripped model output.
+    """
+    if create is None:
+        # Imported on first use; it is slow to import and most tools never call the API
+        import openai
+        create = openai.ChatCompletion.create
+    start = time.perf_counter()
+    try:
+        response = create(
+            model=MODEL_ID,
+            messages=build_messages(occup_title),
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE
+        )
+    except Exception as e:
+        metrics.inc("api_errors", labels={"type": type(e).__name__})
+        raise
+    finally:
+        metrics.observe("api_latency_seconds", time.perf_counter() - start)
+    metrics.inc("api_calls")
+    return response['choices'][0]['message']['content'].strip()
+
+
+@metrics.instrument("get_classification")
+def get_classification(occup_title: str, create: Optional[Callable] = None, classifier=None) -> str:
+    """
+    Raw classification of one title, or "Error: ..." if the request failed.
+    With a classifier (e.g. local_classifier.LocalClassifier), it answers
+    offline instead of the API; its output decodes the same way.
+    """
+    if classifier is not None:
+        return classifier.classify(occup_title)
+    import openai
+    try:
+        return request_classification(occup_title, create)
+    except openai.OpenAIError as e:
+        return f"Error: {str(e)}"
+
+
+def build_repair_index(decoder_map: Dict[str, str]) -> "FuzzyIndex":
+    """
+    Character n-gram index over the valid decoder keys, used to repair
+    near-miss model outputs (other casing, missing underscores, truncation).
+    Build it once per decoder map and reuse it.
+    """
+    from pre_matching import FuzzyIndex
+    return FuzzyIndex(decoder_map)
+
+
+def decode_with_score(
+    raw_output: str,
+    decoder_map: Dict[str, str],
+    repair_index: Optional["FuzzyIndex"] = None,
+    min_similarity: float = DEFAULT_REPAIR_SIMILARITY
+) -> Tuple[Optional[str], float]:
+    """
+    Decodes a raw model output and reports how confident the decoding is.
+
+    Exact decoder keys score 1.0. Otherwise, if a repair index is given, the
+    output is mapped to the closest valid key; that label is returned only if
+    the similarity reaches min_similarity.
+
+    Returns:
+        Tuple[Optional[str], float]: (label or None, similarity). A None label
+        with a low score is a likely hallucination.
+    """
+    if raw_output in decoder_map:
+        metrics.inc("decode", labels={"result": "exact"})
+        return decoder_map[raw_output], 1.0
+    if repair_index is None or raw_output.startswith("Error:"):
+        metrics.inc("decode", labels={"result": "failed"})
+        return None, 0.0
+    label, score = repair_index.lookup(raw_output)
+    if label is None or score < min_similarity:
+        metrics.inc("decode", labels={"result": "failed"})
+        return None, score
+    metrics.inc("decode", labels={"result": "repaired"})
+    return label, score
+
+
+def decode_classification(
+    raw_output: str,
+    decoder_map: Dict[str, str],
+    repair_index: Optional["FuzzyIndex"] = None,
+    min_similarity: float = DEFAULT_REPAIR_SIMILARITY
+) -> Optional[str]:
+    return decode_with_score(raw_output, decoder_map, repair_index, min_similarity)[0]
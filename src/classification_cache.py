@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import metrics
+from classification import MODEL_ID, PROMPT_VERSION
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+# SQLite's default limit on host parameters per statement is 999
+_LOOKUP_CHUNK = 500
+
+
+def normalize_title(occup_title: str) -> str:
+    """
+    Cache key for a title: lowercased, with whitespace collapsed.
+    """
+    return " ".join(str(occup_title).lower().split())
+
+
+class ClassificationCache:
+    """
+    Persistent SQLite cache of model classifications, keyed by
+    (normalized title, model id, prompt version).
+
+    Entries carry a last-used timestamp; once the cache holds more than
+    max_entries rows, the least recently used ones are evicted. The row
+    count is read once on open and then tracked, so rows added by other
+    processes only count from the next open. Error outputs ("Error: ...")
+    are never stored. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        model_id: str = MODEL_ID,
+        prompt_version: str = PROMPT_VERSION,
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.db_path = str(db_path)
+        self.model_id = model_id
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS classifications (
+                    title TEXT NOT NULL,
+                    model_id TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    raw_output TEXT NOT NULL,
+                    decoded TEXT,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (title, model_id, prompt_version)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_used ON classifications (last_used)"
+            )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+
+    def get(self, occup_title: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Cached (raw output, decoded label) for a title, or None on a miss.
+        """
+        return self.get_many([occup_title]).get(normalize_title(occup_title))
+
+    def get_many(self, titles: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """
+        Bulk lookup for a whole column. Returns {normalized title: (raw, decoded)}
+        for the titles found; hit/miss counters count distinct titles.
+        """
+        keys = list(dict.fromkeys(normalize_title(t) for t in titles))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT title, raw_output, decoded FROM classifications "
+                    f"WHERE model_id = ? AND prompt_version = ? AND title IN ({placeholders})",
+                    [self.model_id, self.prompt_version, *chunk]
+                ).fetchall()
+                for title, raw, decoded in rows:
+                    found[title] = (raw, decoded)
+
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE classifications SET last_used = ? "
+                        "WHERE title = ? AND model_id = ? AND prompt_version = ?",
+                        [(now, title, self.model_id, self.prompt_version) for title in found]
+                    )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        metrics.inc("classification_cache_hits", len(found))
+        metrics.inc("classification_cache_misses", len(keys) - len(found))
+        return found
+
+    def put(self, occup_title: str, raw_output: str, decoded: Optional[str]) -> None:
+        self.put_many([(occup_title, raw_output, decoded)])
+
+    def put_many(self, results: Iterable[Tuple[str, str, Optional[str]]]) -> None:
+        """
+        Stores (title, raw output, decoded label) triples, skipping errors,
+        then evicts least recently used entries beyond max_entries.
+        """
+        now = time.time()
+        # The last result for a title wins, as with one INSERT OR REPLACE each
+        rows = list({
+            normalize_title(title): (raw, decoded, now, normalize_title(title), self.model_id, self.prompt_version)
+            for title, raw, decoded in results
+            if raw is not None and not raw.startswith("Error:")
+        }.values())
+        if not rows:
+            return
+        with self._lock, self._conn:
+            # Update the titles already cached, then insert the rest; the
+            # insert's row count keeps the size without a COUNT(*) per put
+            self._conn.executemany(
+                "UPDATE classifications SET raw_output = ?, decoded = ?, last_used = ? "
+                "WHERE title = ? AND model_id = ? AND prompt_version = ?",
+                rows
+            )
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO classifications "
+                "(raw_output, decoded, last_used, title, model_id, prompt_version) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            ).rowcount
+            self._size += inserted
+            self._evict()
+
+    def _evict(self) -> None:
+        excess = self._size - self.max_entries
+        if excess > 0:
+            self._size -= self._conn.execute(
+                "DELETE FROM classifications WHERE rowid IN "
+                "(SELECT rowid FROM classifications ORDER BY last_used LIMIT ?)",
+                (excess,)
+            ).rowcount
+
+    def __len__(self):
+        # The row count tracked by put_many/_evict; rows written by another
+        # process sharing the file are only counted after reopening
+        return self._size
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
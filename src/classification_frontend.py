@@ -0,0 +1,177 @@
+"""
+Process-wide front-end for classification requests from the Streamlit app.
+
+Every session in the server process goes through one ClassificationFrontend,
+which in order:
+  1. answers from a short-TTL memo of recent results,
+  2. joins an identical request already in flight (single-flight), and
+  3. otherwise makes the upstream call, waiting for a token from a shared
+     TokenBucket (up to a timeout) before every attempt, retries included.
+So bursts of users queue briefly instead of hitting 429s from the API.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Dict, Optional, Tuple
+
+import metrics
+from batch_classify import classify_with_retry
+from classification_cache import normalize_title
+
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_BURST = 10
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 30.0
+DEFAULT_MEMO_TTL_SECONDS = 300.0
+DEFAULT_MEMO_ENTRIES = 10_000
+BUSY_ERROR = "Error: The service is busy; please try again in a minute."
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `burst`.
+
+    acquire() reserves the next token even if it isn't there yet, so callers
+    are served in arrival order; one whose wait would exceed its timeout
+    gives up immediately instead of sleeping first.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Takes one token, sleeping until it is available. Returns the time
+        waited in seconds, or None if that would take longer than `timeout`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Negative tokens are reservations by callers still waiting
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return None
+            self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ServiceBusy(Exception):
+    """
+    Raised when no token is available within the queue timeout.
+    """
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+
+
+class ClassificationFrontend:
+    """
+    Memoized, coalesced and rate-limited access to the model. Safe to share
+    between threads; use one instance per process.
+
+    Args:
+        classify (Callable, optional): title -> raw output or "Error: ...".
+            Defaults to classify_with_retry (which backs off on 429s), taking
+            a token before each of its attempts; a custom callable takes one
+            token per call.
+        requests_per_second (float, optional): Sustained upstream attempt rate.
+        burst (int, optional): Attempts allowed back to back after idle time.
+        queue_timeout (float, optional): Longest a request waits for a token,
+            or for an identical request in flight to finish.
+        memo_ttl (float, optional): Seconds a successful answer is reused.
+        memo_entries (int, optional): Bound on memoized titles (LRU).
+    """
+
+    def __init__(
+        self,
+        classify: Optional[Callable[[str], str]] = None,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        burst: int = DEFAULT_BURST,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT_SECONDS,
+        memo_ttl: float = DEFAULT_MEMO_TTL_SECONDS,
+        memo_entries: int = DEFAULT_MEMO_ENTRIES
+    ):
+        # Whether self._classify takes its own tokens, one per attempt
+        self._per_attempt_tokens = classify is None
+        self._classify = classify or partial(classify_with_retry, before_attempt=self._take_token)
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.queue_timeout = queue_timeout
+        self.memo_ttl = memo_ttl
+        self.memo_entries = memo_entries
+        self._memo: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._counts = {"upstream_calls": 0, "memo_hits": 0, "coalesced": 0, "rejected": 0}
+
+    def _count(self, name: str) -> None:
+        self._counts[name] += 1
+        metrics.inc(f"frontend_{name}")
+
+    def _take_token(self) -> None:
+        waited = self.bucket.acquire(self.queue_timeout)
+        with self._lock:
+            if waited is None:
+                self._count("rejected")
+                raise ServiceBusy(BUSY_ERROR[len("Error: "):])
+            self._count("upstream_calls")
+        metrics.observe("frontend_queue_wait_seconds", waited)
+
+    def classify(self, occup_title: str) -> str:
+        """
+        Raw classification of one title, or "Error: ..." like get_classification.
+        """
+        key = normalize_title(occup_title)
+        with self._lock:
+            memo = self._memo.get(key)
+            if memo is not None and memo[0] > time.monotonic():
+                self._memo.move_to_end(key)
+                self._count("memo_hits")
+                return memo[1]
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+            else:
+                self._count("coalesced")
+
+        if not leader:
+            # The leader always resolves its flight, even on errors, but
+            # its retries may outlast what a user should wait
+            if not flight.done.wait(self.queue_timeout):
+                with self._lock:
+                    self._count("rejected")
+                return BUSY_ERROR
+            return flight.result
+
+        try:
+            if not self._per_attempt_tokens:
+                self._take_token()
+            flight.result = self._classify(occup_title)
+        except Exception as e:
+            flight.result = f"Error: {str(e)}"
+        finally:
+            if flight.result is None:  # interrupted
+                flight.result = "Error: Request was interrupted."
+            with self._lock:
+                if not flight.result.startswith("Error:"):
+                    self._memo[key] = (time.monotonic() + self.memo_ttl, flight.result)
+                    self._memo.move_to_end(key)
+                    while len(self._memo) > self.memo_entries:
+                        self._memo.popitem(last=False)
+                del self._in_flight[key]
+            flight.done.set()
+        return flight.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts, in_flight=len(self._in_flight), memo_size=len(self._memo))
@@ -0,0 +1,169 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_FSYNC_EVERY = 200
+DEFAULT_FSYNC_SECONDS = 5.0
+
+
+class ClassificationJournal:
+    """
+    Append-only progress journal of a classification run: one JSON line
+    {"key", "raw", "decoded"} per finished title, so an interrupted run can
+    resume without paying for the same calls again.
+
+    Lines are flushed as they are written and fsynced every `fsync_every`
+    records or `fsync_seconds`, whichever comes first, and on close(). A
+    torn last line left by a crash is cut off when the journal is reopened.
+    A key written twice keeps its last record. Records are addressed by
+    their byte offset, so a run only needs {key: offset} in memory and reads
+    records back as it needs them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fsync_every: int = DEFAULT_FSYNC_EVERY,
+        fsync_seconds: float = DEFAULT_FSYNC_SECONDS
+    ):
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._repair_tail()
+        self._file = open(self.path, "ab")
+        self._end = self.path.stat().st_size
+        self._reader = None
+
+    def _repair_tail(self, block_size: int = 1 << 16) -> None:
+        if not self.path.exists():
+            return
+        size = self.path.stat().st_size
+        with open(self.path, "rb") as f:
+            f.seek(max(0, size - 1))
+            if size == 0 or f.read(1) == b"\n":
+                return
+            # Only the last line can be torn; walk back to the newline before it
+            keep = 0
+            end = size
+            while end > 0:
+                start = max(0, end - block_size)
+                f.seek(start)
+                cut = f.read(end - start).rfind(b"\n")
+                if cut >= 0:
+                    keep = start + cut + 1
+                    break
+                end = start
+        with open(self.path, "r+b") as f:
+            f.truncate(keep)
+
+    def index(self) -> Dict[str, int]:
+        """
+        {key: byte offset} of the last record of every key, streamed from
+        disk. Keys whose last record is an "Error: ..." are left out, as a
+        resumed run sends them again.
+        """
+        offsets = {}
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["raw"].startswith("Error:"):
+                    offsets.pop(record["key"], None)
+                else:
+                    offsets[record["key"]] = offset
+                offset += len(line)
+        return offsets
+
+    def get_many(self, offsets: Dict[str, int]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """
+        {key: (raw output, decoded label or None)} of the records at `offsets`,
+        as returned by index() and append().
+        """
+        if self._reader is None:
+            self._reader = open(self.path, "rb")
+        records = {}
+        # In file order, so reads of a chunk's records mostly move forward
+        for key, offset in sorted(offsets.items(), key=lambda item: item[1]):
+            self._reader.seek(offset)
+            record = json.loads(self._reader.readline())
+            records[key] = (record["raw"], record["decoded"])
+        return records
+
+    def append(self, key: str, raw_output: str, decoded: Optional[str]) -> int:
+        """
+        Writes one record and returns its byte offset.
+        """
+        line = (json.dumps({"key": key, "raw": raw_output, "decoded": decoded}) + "\n").encode("utf-8")
+        offset = self._end
+        self._file.write(line)
+        self._file.flush()
+        self._end += len(line)
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_seconds:
+            self.sync()
+        return offset
+
+    def sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def pending_titles_path(journal_path: str) -> Path:
+    """
+    The sidecar next to a journal that lists the titles its run has to classify.
+    """
+    path = Path(journal_path)
+    return path.with_name(path.name + ".pending")
+
+
+def write_pending_titles(path: str, titles: List[str], source: dict) -> None:
+    """
+    Writes the pending titles of a run, one JSON string per line after a
+    header line with `source` (what they were read from). Written to a temp
+    file and renamed, so a crash never leaves a partial list.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"source": source}) + "\n")
+            for title in titles:
+                f.write(json.dumps(title) + "\n")
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def read_pending_titles_file(path: str, source: dict) -> Optional[List[str]]:
+    """
+    The titles write_pending_titles stored, or None if there is no such
+    file or it was written for a different `source`.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if json.loads(f.readline() or "{}").get("source") != source:
+                return None
+            return [json.loads(line) for line in f]
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,227 @@
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+PARQUET_SUFFIXES = (".parquet", ".pq")
+ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+# Row key column added when the input has no key column of its own
+ROW_NUMBER_COLUMN = "row_number"
+# Output columns that must keep one type across batches in Parquet/Arrow files
+STRING_OUTPUT_COLUMNS = ("final_output", "method", "raw_output")
+FLOAT_OUTPUT_COLUMNS = ("match_score",)
+
+
+def file_format(path: str) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix in PARQUET_SUFFIXES:
+        return "parquet"
+    if suffix in ARROW_SUFFIXES:
+        return "arrow"
+    return "csv"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet/Arrow files need pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def read_column_names(path: str) -> List[str]:
+    """
+    Column names of a CSV, Parquet or Arrow IPC file, read from its header/schema only.
+    """
+    fmt = file_format(path)
+    if fmt == "csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    pa = _import_pyarrow()
+    if fmt == "parquet":
+        return pa.parquet.ParquetFile(path).schema_arrow.names
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def iter_batches(
+    path: str,
+    columns: Optional[List[str]] = None,
+    batch_size: int = 100_000,
+    csv_as_strings: bool = False
+) -> Iterator[pd.DataFrame]:
+    """
+    Streams a CSV, Parquet or Arrow IPC file as DataFrames of at most
+    batch_size rows. Only `columns` are read when given: Parquet skips the
+    other column chunks on disk, Arrow IPC is memory-mapped so unselected
+    columns are never touched, and CSV parses only those fields.
+
+    CSV dtypes are inferred per chunk, so one column can come back as int64
+    in one chunk and float64 or object in the next. With csv_as_strings
+    every CSV column is read as text (missing values stay NaN), which keeps
+    the types stable for a BatchWriter writing Parquet/Arrow.
+
+    A file without rows still yields one empty DataFrame with its columns,
+    so the output of an empty input keeps its header/schema.
+    """
+    fmt = file_format(path)
+    if fmt == "csv":
+        # read_csv already yields one empty chunk for a header-only file
+        yield from pd.read_csv(path, usecols=columns, chunksize=batch_size,
+                               dtype=str if csv_as_strings else None)
+        return
+
+    pa = _import_pyarrow()
+    if fmt == "parquet":
+        parquet_file = pa.parquet.ParquetFile(path)
+        if parquet_file.metadata.num_rows == 0:
+            schema = parquet_file.schema_arrow
+            yield (schema.empty_table().select(columns) if columns is not None else schema.empty_table()).to_pandas()
+            return
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    with pa.memory_map(str(path), "r") as source:
+        reader = pa.ipc.open_file(source)
+        empty = True
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            for offset in range(0, batch.num_rows, batch_size):
+                empty = False
+                yield batch.slice(offset, batch_size).to_pandas()
+        if empty:
+            table = reader.schema.empty_table()
+            yield (table.select(columns) if columns is not None else table).to_pandas()
+
+
+def read_frame(path: str) -> pd.DataFrame:
+    """
+    A whole CSV, Parquet or Arrow IPC file as one DataFrame. CSV dtypes are
+    inferred once over the whole file, unlike with iter_batches.
+    """
+    fmt = file_format(path)
+    if fmt == "csv":
+        return pd.read_csv(path)
+    pa = _import_pyarrow()
+    if fmt == "parquet":
+        return pa.parquet.read_table(path).to_pandas()
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+class BatchWriter:
+    """
+    Appends DataFrames to a CSV, Parquet or Arrow IPC file (chosen by suffix).
+
+    For the columnar formats the schema is fixed by the first batch, with
+    the pipeline's output columns forced to string/float64 (and all-missing
+    columns to string), so a batch in which nothing matched still fits it.
+    Later batches are cast to that schema; text columns take any value as
+    a string, and a batch that can't be cast raises a ValueError.
+
+    The data goes to a temporary file next to `path`, which replaces `path`
+    only when the writer is closed without an error, so a failed run never
+    leaves a partial output behind. Closing a writer that was never given a
+    DataFrame raises a ValueError, as there is no header/schema to write;
+    write an empty DataFrame to get an empty file with its columns.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self.format = file_format(path)
+        self.rows = 0
+        self._tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self._file = None
+        self._writer = None
+        self._schema = None
+
+    def _schema_for(self, df: pd.DataFrame):
+        pa = _import_pyarrow()
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        for i, field in enumerate(schema):
+            if field.name in STRING_OUTPUT_COLUMNS or pa.types.is_null(field.type):
+                schema = schema.set(i, pa.field(field.name, pa.string()))
+            elif field.name in FLOAT_OUTPUT_COLUMNS:
+                schema = schema.set(i, pa.field(field.name, pa.float64()))
+        return schema.remove_metadata()
+
+    def _to_table(self, df: pd.DataFrame):
+        pa = _import_pyarrow()
+        df = df.astype({c: object for c in STRING_OUTPUT_COLUMNS if c in df.columns})
+        try:
+            return pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+        # A column whose inferred type changed since the first batch: text
+        # columns take the values as strings, anything else is an error
+        df = df.copy()
+        for field in self._schema:
+            if (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)) and field.name in df.columns:
+                df[field.name] = pd.Series([None if pd.isna(v) else str(v) for v in df[field.name]],
+                                           index=df.index, dtype=object)
+        try:
+            return pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(
+                f"Batch starting at row {self.rows} doesn't fit the schema of {self.path} "
+                f"(fixed by the first batch): {e}. Read CSV input with csv_as_strings=True."
+            ) from e
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.format == "csv":
+            # The header goes with the first DataFrame, even an empty one
+            header = self._file is None
+            if header:
+                self._file = open(self._tmp_path, "w", encoding="utf-8", newline="")
+            df.to_csv(self._file, index=False, header=header)
+        else:
+            pa = _import_pyarrow()
+            if self._schema is None:
+                self._schema = self._schema_for(df)
+                if self.format == "parquet":
+                    self._writer = pa.parquet.ParquetWriter(self._tmp_path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self._tmp_path, self._schema)
+            self._writer.write_table(self._to_table(df))
+        self.rows += len(df)
+
+    def _close_files(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self) -> None:
+        """
+        Finishes the file and moves it to `path`.
+        """
+        if self._file is None and self._writer is None:
+            raise ValueError(f"Nothing was written to {self.path}, not even the columns; it was not created.")
+        self._close_files()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        """
+        Discards everything written so far; `path` is left untouched.
+        """
+        try:
+            self._close_files()
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,274 @@
+"""
+Compact, memory-mappable pre-match dictionary for very large alias tables.
+
+A plain dict holds a str object and a hash-table slot per alias, so a few
+million aliases cost hundreds of MB in every worker, and forked workers
+copy those pages as soon as reference counts are touched. CompactDict
+keeps the same data in four flat arrays inside one file:
+
+    hashes   uint64[n]       64-bit hash of each key, sorted
+    offsets  uint32/64[n+1]  where each key starts in `keys`
+    codes    uint16/32[n]    index of each key's completion in `labels`
+    keys     bytes           UTF-8 keys, concatenated in hash order
+
+The few hundred distinct completions are kept once, in the JSON header.
+The file is mapped read-only, so every process shares the same page cache
+and nothing is copied on fork. Lookups binary-search the hash array and
+confirm the hit against the key bytes, so hash collisions can't produce a
+wrong answer.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from finetune_data import parse_finetune_jsonl
+
+MAGIC = b"OCCDICT\x00"
+# Bump when the file layout or the key hash changes
+FORMAT_VERSION = 1
+_ALIGN = 64
+# Keys are stored and compared as UTF-8; "surrogatepass" lets lone
+# surrogates (e.g. from undecodable input bytes) through instead of raising
+_ERRORS = "surrogatepass"
+
+
+def hash_keys(keys) -> np.ndarray:
+    """
+    Stable 64-bit hashes of a sequence of str keys (pandas' SipHash with its
+    fixed default key, so they are the same in every process and run).
+    """
+    keys = np.asarray(keys, dtype=object)
+    try:
+        return pd.util.hash_array(keys, categorize=False)
+    except UnicodeEncodeError:
+        # pandas hashes str keys by their UTF-8 bytes, so hashing the bytes
+        # ourselves gives every other key the same hash
+        encoded = np.empty(len(keys), dtype=object)
+        encoded[:] = [key.encode("utf-8", _ERRORS) if isinstance(key, str) else key for key in keys]
+        return pd.util.hash_array(encoded, categorize=False)
+
+
+def compact_dict_path(jsonl_path: str) -> Path:
+    path = Path(jsonl_path)
+    return path.with_name(path.name + ".dict")
+
+
+def _aligned(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def write_compact_dict(pre_match_dict: Dict[str, str], path: str, source: Optional[dict] = None) -> None:
+    """
+    Writes a str -> str mapping in the CompactDict file format. `source`
+    is stored in the header (load_compact_dict uses it to spot stale files).
+    """
+    labels = sorted(set(pre_match_dict.values()))
+    label_codes = {label: i for i, label in enumerate(labels)}
+    keys = list(pre_match_dict)
+    hashes = hash_keys(keys)
+    order = np.argsort(hashes, kind="stable")
+
+    encoded = [keys[i].encode("utf-8", _ERRORS) for i in order]
+    lengths = np.fromiter((len(key) for key in encoded), dtype=np.int64, count=len(encoded))
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    offsets = offsets.astype(np.uint32 if offsets[-1] < 2 ** 32 else np.uint64)
+    code_dtype = np.uint16 if len(labels) < 2 ** 16 else np.uint32
+    codes = np.fromiter((label_codes[pre_match_dict[keys[i]]] for i in order), dtype=code_dtype, count=len(keys))
+
+    arrays = [("hashes", hashes[order]), ("offsets", offsets), ("codes", codes)]
+    header = {
+        "version": FORMAT_VERSION,
+        "count": len(keys),
+        "labels": labels,
+        "canary": int(hash_keys(["software developer"])[0]),
+        "source": source or {},
+        "arrays": {},
+    }
+    position = 0
+    for name, array in arrays:
+        header["arrays"][name] = {"dtype": array.dtype.str, "offset": position, "length": len(array)}
+        position = _aligned(position + array.nbytes)
+    header["arrays"]["keys"] = {"dtype": "|u1", "offset": position, "length": int(offsets[-1])}
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+            for name, array in arrays:
+                f.seek(data_start + header["arrays"][name]["offset"])
+                f.write(array.tobytes())
+            f.seek(data_start + header["arrays"]["keys"]["offset"])
+            for key in encoded:
+                f.write(key)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class CompactDict(Mapping):
+    """
+    Read-only lowercased prompt_occupation -> completion mapping backed by a
+    memory-mapped file (see the module docstring). It is a Mapping, so it
+    can stand in for the dict from load_pre_match_dict. Use lookup_codes or
+    get_many to look up many keys at once.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a compact dictionary file")
+        (header_len,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[header_start:header_start + header_len])
+        if self.header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{self.path} has format version {self.header.get('version')}, "
+                             f"expected {FORMAT_VERSION}")
+        if self.header["canary"] != int(hash_keys(["software developer"])[0]):
+            raise ValueError(f"{self.path} was written with a different key hash")
+
+        self._data_start = _aligned(header_start + header_len)
+        self.labels: List[str] = self.header["labels"]
+        self.hashes = self._array("hashes")
+        self.offsets = self._array("offsets")
+        self.codes = self._array("codes")
+        self._keys_start = self._data_start + self.header["arrays"]["keys"]["offset"]
+        # Code -1 (missing) indexes the trailing None
+        self._label_array = np.array(self.labels + [None], dtype=object)
+
+    def _array(self, name: str) -> np.ndarray:
+        spec = self.header["arrays"][name]
+        return np.frombuffer(self._mmap, dtype=np.dtype(spec["dtype"]), count=spec["length"],
+                             offset=self._data_start + spec["offset"])
+
+    def _key_bytes(self, i: int) -> bytes:
+        return self._mmap[self._keys_start + int(self.offsets[i]):self._keys_start + int(self.offsets[i + 1])]
+
+    def _find(self, key: bytes, key_hash: int, start: int) -> int:
+        i = start
+        while i < len(self.hashes) and self.hashes[i] == key_hash:
+            if self._key_bytes(i) == key:
+                return i
+            i += 1
+        return -1
+
+    def lookup_codes(self, keys: Iterable[str]) -> np.ndarray:
+        """
+        Bulk lookup: the label index of each key (see .labels), or -1 where
+        the key is missing. Hashing and the binary search are vectorized;
+        only hash hits are compared byte by byte.
+        """
+        keys = np.asarray(keys if isinstance(keys, np.ndarray) else list(keys), dtype=object)
+        result = np.full(len(keys), -1, dtype=np.int64)
+        if not len(keys) or not len(self.hashes):
+            return result
+        key_hashes = hash_keys(keys)
+        # Sorted needles let searchsorted walk the table mostly forwards
+        order = np.argsort(key_hashes)
+        positions = np.empty(len(keys), dtype=np.int64)
+        positions[order] = np.searchsorted(self.hashes, key_hashes[order])
+        hit = positions < len(self.hashes)
+        hit[hit] = self.hashes[positions[hit]] == key_hashes[hit]
+        rows = np.flatnonzero(hit)
+        positions = positions[rows]
+        starts = (self.offsets[positions].astype(np.int64) + self._keys_start).tolist()
+        ends = (self.offsets[positions + 1].astype(np.int64) + self._keys_start).tolist()
+
+        confirmed = np.zeros(len(rows), dtype=bool)
+        data = self._mmap
+        for n, (row, start, end) in enumerate(zip(rows.tolist(), starts, ends)):
+            encoded = keys[row].encode("utf-8", _ERRORS)
+            if data[start:end] == encoded:
+                confirmed[n] = True
+            else:
+                # A different key with the same hash; any others follow it
+                i = self._find(encoded, key_hashes[row], int(positions[n]) + 1)
+                if i >= 0:
+                    result[row] = self.codes[i]
+        result[rows[confirmed]] = self.codes[positions[confirmed]]
+        return result
+
+    def get_many(self, keys: Iterable[str]) -> np.ndarray:
+        """
+        Bulk lookup: an object array with each key's completion or None.
+        """
+        return self._label_array[self.lookup_codes(keys)]
+
+    def __getitem__(self, key: str) -> str:
+        if not isinstance(key, str):
+            raise KeyError(key)
+        code = self.lookup_codes([key])[0]
+        if code < 0:
+            raise KeyError(key)
+        return self.labels[code]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._key_bytes(i).decode("utf-8", _ERRORS)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        # Straight from the arrays; Mapping.items() would look up every key again
+        for i in range(len(self)):
+            yield self._key_bytes(i).decode("utf-8", _ERRORS), self.labels[self.codes[i]]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mmap)
+
+    def close(self) -> None:
+        # Arrays still viewing the mapping keep it open
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+
+def load_compact_dict(jsonl_path: str) -> CompactDict:
+    """
+    The CompactDict for a finetune.jsonl file, compiled on first use into
+    <name>.jsonl.dict next to it and recompiled when the JSONL's mtime or
+    size changes. If the directory is read-only, the file is compiled into
+    the temporary directory instead, under a name derived from the JSONL's
+    path, mtime and size, so other processes find and share it.
+    """
+    resolved = Path(jsonl_path).resolve()
+    stat = os.stat(resolved)
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    path = compact_dict_path(str(resolved))
+    fallback_key = hashlib.sha1(f"{resolved}\0{stat.st_mtime_ns}\0{stat.st_size}".encode("utf-8", _ERRORS))
+    fallback = Path(tempfile.gettempdir()) / f"{resolved.name}.{fallback_key.hexdigest()[:16]}.dict"
+    for candidate in (path, fallback):
+        try:
+            compact = CompactDict(candidate)
+            if compact.header["source"] == source:
+                return compact
+            compact.close()
+        except (OSError, ValueError):
+            pass
+
+    pre_match = parse_finetune_jsonl(str(resolved)).pre_match
+    try:
+        write_compact_dict(pre_match, path, source)
+    except OSError:
+        path = fallback
+        write_compact_dict(pre_match, path, source)
+    return CompactDict(path)
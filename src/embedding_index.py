@@ -0,0 +1,379 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from finetune_data import load_finetune_data
+
+INDEX_VERSION = 1
+# Storage types for index matrices; int8 rows carry a float32 scale each
+PRECISIONS = ("float32", "float16", "int8")
+# Reduced-precision matrices are scored this many rows at a time
+_SCORE_BLOCK_ROWS = 1024
+DEFAULT_QUERY_CACHE_SIZE = 10_000
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Returns the hex SHA-256 digest of a file's content, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_key(jsonl_path: str, model_name: str, kind: str = "completions") -> str:
+    """
+    Cache key for an embedding index: changes whenever the finetune.jsonl
+    content, the embedding model or the kind of text indexed changes.
+    """
+    digest = hashlib.sha256()
+    digest.update(file_sha256(jsonl_path).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(model_name.encode("utf-8"))
+    digest.update(f"\0{kind}\0v{INDEX_VERSION}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def default_cache_dir(jsonl_path: str) -> Path:
+    return Path(jsonl_path).resolve().parent / "embedding_cache"
+
+
+def load_completion_labels(jsonl_path: str) -> List[str]:
+    """
+    Sorted unique 'completion' values of a finetune.jsonl file.
+    """
+    return list(load_finetune_data(jsonl_path).completions)
+
+
+def load_example_texts(jsonl_path: str) -> List[str]:
+    """
+    Sorted labeled examples (lowercased prompt_occupation keys) of a finetune.jsonl file.
+    """
+    return sorted(load_finetune_data(jsonl_path).pre_match)
+
+
+# What load_or_build can index, by kind
+INDEX_SOURCES = {
+    "completions": load_completion_labels,
+    "examples": load_example_texts,
+}
+
+
+def encode_normalized(model, texts, batch_size: int = 64) -> np.ndarray:
+    """
+    Encodes text(s) with a SentenceTransformer into unit-length float32 vectors,
+    so cosine similarity reduces to a dot product.
+    """
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def quantize_embeddings(
+    embeddings: np.ndarray,
+    precision: str
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Converts a float32 embedding matrix to a storage precision.
+
+    Returns:
+        (matrix, scales): For "int8", each row is stored as round(row / scale)
+        with scale = max(|row|) / 127, and `scales` holds the per-row scales;
+        for "float32"/"float16" scales is None.
+
+    int8 scores about as fast as float32 at a quarter of the memory; float16
+    saves half, but numpy widens it slowly, so it suits rarely queried banks.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if precision == "float32":
+        return embeddings, None
+    if precision == "float16":
+        return embeddings.astype(np.float16), None
+    if precision == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"precision must be one of {PRECISIONS}, not {precision!r}")
+
+
+def top_k_agreement(reference_scores: np.ndarray, scores: np.ndarray, k: int) -> float:
+    """
+    Mean fraction of the reference top-k that also appears in the top-k of
+    `scores` (1.0 = identical top-k sets), e.g. float32 vs int8 rankings.
+    """
+    reference = top_k_indices(np.atleast_2d(reference_scores), k)
+    candidate = top_k_indices(np.atleast_2d(scores), k)
+    overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(reference, candidate) if len(a)]
+    return float(np.mean(overlap)) if overlap else 1.0
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores along the last axis, best first.
+    Uses argpartition so only the selected k entries get sorted.
+
+    Args:
+        scores (np.ndarray): Similarities, shape (n_labels,) or (n_queries, n_labels).
+        k (int): Number of indices to return per query (capped at n_labels).
+
+    Returns:
+        np.ndarray: Shape (k,) or (n_queries, k).
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < scores.shape[-1]:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(k), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def _matrix_name(key: str, precision: str) -> str:
+    # float32 keeps the original file name so existing caches stay valid
+    return f"{key}.npy" if precision == "float32" else f"{key}.{precision}.npy"
+
+
+class CompletionIndex:
+    """
+    Unit-normalized embeddings of the completion labels, stored on disk as a
+    .npy matrix (opened memory-mapped) plus a JSON file with the labels.
+
+    The matrix may be float32, float16 or int8 with per-row `scales` (see
+    quantize_embeddings): float16 halves and int8 quarters its memory.
+    """
+
+    def __init__(
+        self,
+        labels: List[str],
+        embeddings: np.ndarray,
+        key: Optional[str] = None,
+        scales: Optional[np.ndarray] = None
+    ):
+        if len(labels) != embeddings.shape[0]:
+            raise ValueError("Number of labels does not match number of embedding rows.")
+        self.labels = labels
+        self.embeddings = embeddings
+        self.key = key
+        self.scales = scales
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def precision(self) -> str:
+        return "int8" if self.scales is not None else np.dtype(self.embeddings.dtype).name
+
+    @property
+    def nbytes(self) -> int:
+        return self.embeddings.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, query_embedding: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of one normalized query vector (dim,) or a batch
+        of them (n, dim) against every label.
+        """
+        if self.embeddings.dtype == np.float32:
+            return query_embedding @ self.embeddings.T
+
+        # Widen the stored matrix to float32 one block at a time, so scoring
+        # stays a BLAS matrix product without a full float32 copy in memory
+        queries = np.atleast_2d(np.asarray(query_embedding, dtype=np.float32))
+        n_rows, dim = self.embeddings.shape
+        out = np.empty((queries.shape[0], n_rows), dtype=np.float32)
+        block = np.empty((min(_SCORE_BLOCK_ROWS, n_rows), dim), dtype=np.float32)
+        for start in range(0, n_rows, _SCORE_BLOCK_ROWS):
+            rows = self.embeddings[start:start + _SCORE_BLOCK_ROWS]
+            widened = block[:len(rows)]
+            widened[...] = rows
+            np.matmul(queries, widened.T, out=out[:, start:start + len(rows)])
+        if self.scales is not None:
+            out *= self.scales
+        return out if np.ndim(query_embedding) > 1 else out[0]
+
+    def quantized(self, precision: str) -> "CompletionIndex":
+        """
+        Copy of a float32 index stored at another precision.
+        """
+        matrix, scales = quantize_embeddings(self.embeddings, precision)
+        return CompletionIndex(self.labels, matrix, self.key, scales)
+
+    @classmethod
+    def build(cls, labels: List[str], model, key: Optional[str] = None) -> "CompletionIndex":
+        return cls(labels, encode_normalized(model, labels), key)
+
+    def save(self, cache_dir: Path) -> None:
+        """
+        Writes the matrix and <key>.json atomically into cache_dir. The matrix
+        is <key>.npy for float32 and <key>.<precision>.npy otherwise, plus
+        <key>.int8.scales.npy for int8.
+        """
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        matrix_path = cache_dir / _matrix_name(self.key, self.precision)
+        labels_path = cache_dir / f"{self.key}.json"
+
+        if self.scales is not None:
+            scales_path = cache_dir / f"{self.key}.int8.scales.npy"
+            tmp_scales = scales_path.with_suffix(f".npy.{os.getpid()}.tmp")
+            with open(tmp_scales, "wb") as f:
+                np.save(f, np.ascontiguousarray(self.scales, dtype=np.float32))
+            os.replace(tmp_scales, scales_path)
+
+        tmp_matrix = matrix_path.with_suffix(f".npy.{os.getpid()}.tmp")
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.embeddings))
+        tmp_labels = labels_path.with_suffix(f".json.{os.getpid()}.tmp")
+        with open(tmp_labels, "w", encoding="utf-8") as f:
+            json.dump(self.labels, f)
+
+        # Labels last: load() treats a missing labels file as "not built yet"
+        os.replace(tmp_matrix, matrix_path)
+        os.replace(tmp_labels, labels_path)
+
+    @classmethod
+    def load(cls, cache_dir: Path, key: str, precision: str = "float32") -> Optional["CompletionIndex"]:
+        """
+        Opens a saved index memory-mapped, or returns None if it doesn't exist.
+        """
+        matrix_path = Path(cache_dir) / _matrix_name(key, precision)
+        labels_path = Path(cache_dir) / f"{key}.json"
+        if not (matrix_path.exists() and labels_path.exists()):
+            return None
+        scales = None
+        if precision == "int8":
+            # Written before the matrix, so present whenever the matrix is
+            scales = np.load(Path(cache_dir) / f"{key}.int8.scales.npy")
+        with open(labels_path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        embeddings = np.load(matrix_path, mmap_mode="r")
+        return cls(labels, embeddings, key, scales)
+
+    @classmethod
+    def load_or_build(
+        cls,
+        jsonl_path: str,
+        model,
+        model_name: str,
+        cache_dir: Optional[str] = None,
+        kind: str = "completions",
+        precision: str = "float32",
+    ) -> "CompletionIndex":
+        """
+        Returns the completion index for (finetune.jsonl content, model_name),
+        building and saving it first if there is no cached copy.
+
+        Args:
+            jsonl_path (str): Path to the finetune.jsonl file.
+            model: A loaded SentenceTransformer.
+            model_name (str): Name the model was loaded with; part of the cache key.
+            cache_dir (str, optional): Where index files live. Defaults to an
+                'embedding_cache' directory next to the JSONL file.
+            kind (str, optional): "completions" to index the completion labels,
+                "examples" to index the labeled prompt_occupation examples
+                (map them back with load_pre_match_dict).
+            precision (str, optional): "float32", "float16" or "int8"; reduced
+                precisions are quantized from the float32 index and cached too.
+
+        Returns:
+            CompletionIndex: Index with labels in the same sorted order as
+            load_finetune_completions (or load_example_texts for "examples").
+        """
+        cache_dir = Path(cache_dir) if cache_dir else default_cache_dir(jsonl_path)
+        key = index_key(jsonl_path, model_name, kind)
+
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}, not {precision!r}")
+
+        index = cls.load(cache_dir, key, precision)
+        if index is not None:
+            return index
+
+        index = cls.load(cache_dir, key)
+        if index is None:
+            index = cls.build(INDEX_SOURCES[kind](jsonl_path), model, key)
+            index.save(cache_dir)
+        if precision != "float32":
+            index.quantized(precision).save(cache_dir)
+        # Re-open from disk so every caller gets the memory-mapped matrix
+        return cls.load(cache_dir, key, precision)
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of normalized query embeddings, so re-querying the same
+    profession skips the model. Keys are lowercased with whitespace collapsed,
+    which loses nothing with uncased models such as all-MiniLM-L6-v2.
+    Safe to share between threads.
+    """
+
+    def __init__(self, model, max_entries: int = DEFAULT_QUERY_CACHE_SIZE):
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(str(text).lower().split())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def encode(self, texts, batch_size: int = 64) -> np.ndarray:
+        """
+        Drop-in for encode_normalized(model, texts): a str gives (dim,), a
+        list gives (n, dim). Only texts not in the cache are encoded, in one batch.
+        """
+        single = isinstance(texts, str)
+        keys = [self.normalize(t) for t in ([texts] if single else texts)]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries and key not in found:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+
+        if missing:
+            encoded = encode_normalized(self.model, missing, batch_size=batch_size)
+            with self._lock:
+                for key, vector in zip(missing, encoded):
+                    found[key] = self._entries[key] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        hits = len(keys) - len(missing)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(missing)
+        metrics.inc("query_cache_hits", hits)
+        metrics.inc("query_cache_misses", len(missing))
+        embeddings = np.stack([found[k] for k in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
@@ -0,0 +1,205 @@
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from embedding_index import CompletionIndex, default_cache_dir, encode_normalized, top_k_indices
+from finetune_data import load_finetune_data
+
+DEFAULT_NEIGHBOURS = 20
+# Neighbours less similar than this don't vote
+DEFAULT_MIN_NEIGHBOUR_SIMILARITY = 0.5
+_INITIAL_CAPACITY = 256
+
+
+def normalize_example(text: str) -> str:
+    # Same form as the finetune.jsonl example keys (see load_example_texts)
+    return str(text).strip().lower()
+
+
+class ExampleIndex:
+    """
+    Nearest-neighbour index over labeled prompt_occupation examples that
+    suggests completions by similarity-weighted neighbour votes.
+
+    The examples of a finetune.jsonl/prematch.jsonl file come from its
+    cached "examples" CompletionIndex and are never re-embedded. Mappings
+    added later (e.g. with "Add Mapping") are embedded once, appended to an
+    in-memory buffer that grows by doubling, and persisted by appending to
+    two files in the cache directory, so nothing is ever rebuilt:
+
+        annotations-<model>.jsonl   add/delete journal, one JSON op per line
+        annotations-<model>.f32     raw float32 embeddings of added examples
+
+    Deleting an added mapping only journals a tombstone. The files are keyed
+    by model name, not by the JSONL content, so annotations survive edits
+    of the base file. Safe to share between threads.
+    """
+
+    def __init__(self, base: CompletionIndex, base_completions: List[str], model, store_dir: Path, model_name: str):
+        self.base = base
+        self.base_completions = base_completions
+        self.model = model
+        self._lock = threading.Lock()
+        safe_name = re.sub(r"[^\w.-]+", "_", model_name)
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+        self.journal_path = store_dir / f"annotations-{safe_name}.jsonl"
+        self.vectors_path = store_dir / f"annotations-{safe_name}.f32"
+
+        dim = base.embeddings.shape[1]
+        self._vectors = np.zeros((_INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._texts: List[str] = []
+        self._completions: List[str] = []
+        self._alive = np.zeros(_INITIAL_CAPACITY, dtype=bool)
+        self._replay()
+
+    @classmethod
+    def open(
+        cls,
+        jsonl_path: str,
+        model,
+        model_name: str,
+        cache_dir: Optional[str] = None,
+        precision: str = "float32"
+    ) -> "ExampleIndex":
+        """
+        Loads (or builds once) the example embeddings of jsonl_path and replays
+        the saved annotations on top of them.
+        """
+        cache_dir = Path(cache_dir) if cache_dir else default_cache_dir(jsonl_path)
+        base = CompletionIndex.load_or_build(
+            jsonl_path, model, model_name, cache_dir=cache_dir, kind="examples", precision=precision
+        )
+        pre_match = load_finetune_data(jsonl_path).pre_match
+        return cls(base, [pre_match[text] for text in base.labels], model, cache_dir, model_name)
+
+    def _replay(self) -> None:
+        if not self.journal_path.exists():
+            return
+        dim = self._vectors.shape[1]
+        ops = []
+        good_bytes = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated line")
+                    ops.append(json.loads(line))
+                except ValueError:
+                    break
+                good_bytes += len(line)
+        if good_bytes < self.journal_path.stat().st_size:
+            # A torn last line from an interrupted write; cut it so new ops stay readable
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_bytes)
+        added = [op for op in ops if op["op"] == "add"]
+        stored = np.fromfile(self.vectors_path, dtype=np.float32).reshape(-1, dim) \
+            if self.vectors_path.exists() else np.empty((0, dim), dtype=np.float32)
+        # Drop vectors written by an add whose journal line never made it to disk
+        if len(stored) > len(added):
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(len(added) * dim * 4)
+            stored = stored[:len(added)]
+
+        for op in ops:
+            if op["op"] == "add" and op["row"] < len(stored):
+                self._append(op["text"], op["completion"], stored[op["row"]])
+            elif op["op"] == "delete" and op["row"] < len(self._texts):
+                self._alive[op["row"]] = False
+
+    def _append(self, text: str, completion: str, vector: np.ndarray) -> int:
+        row = len(self._texts)
+        if row == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+        self._vectors[row] = vector
+        self._alive[row] = True
+        self._texts.append(text)
+        self._completions.append(completion)
+        return row
+
+    def _journal(self, op: dict) -> None:
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(op) + "\n")
+
+    def __len__(self):
+        return len(self.base) + int(self._alive[:len(self._texts)].sum())
+
+    def add(self, prompt_occupation: str, completion: str) -> None:
+        """
+        Adds one labeled example and persists it.
+        """
+        text = normalize_example(prompt_occupation)
+        vector = encode_normalized(self.model, [text])[0]
+        with self._lock:
+            row = self._append(text, completion, vector)
+            # Vector first: _replay drops vectors without a journal line
+            with open(self.vectors_path, "ab") as f:
+                f.write(vector.astype(np.float32).tobytes())
+            self._journal({"op": "add", "row": row, "text": text, "completion": completion})
+        metrics.inc("example_index_adds")
+
+    def remove(self, prompt_occupation: str, completion: str) -> bool:
+        """
+        Deletes the most recently added example with this text and completion.
+        Examples from the base JSONL file are not affected. Returns whether
+        one was found.
+        """
+        text = normalize_example(prompt_occupation)
+        with self._lock:
+            for row in range(len(self._texts) - 1, -1, -1):
+                if self._alive[row] and self._texts[row] == text and self._completions[row] == completion:
+                    self._alive[row] = False
+                    self._journal({"op": "delete", "row": row})
+                    metrics.inc("example_index_deletes")
+                    return True
+        return False
+
+    def neighbours(self, query_embedding: np.ndarray, k: int = DEFAULT_NEIGHBOURS) -> List[Tuple[str, str, float]]:
+        """
+        The k most similar examples to one normalized query vector, as
+        (example text, completion, similarity), most similar first.
+        """
+        with self._lock:
+            n_added = len(self._texts)
+            added_scores = self._vectors[:n_added] @ query_embedding
+            added_scores[~self._alive[:n_added]] = -np.inf
+            texts = self._texts[:n_added]
+            completions = self._completions[:n_added]
+        scores = np.concatenate([self.base.scores(query_embedding), added_scores])
+        result = []
+        for i in top_k_indices(scores, k):
+            if scores[i] == -np.inf:
+                break
+            if i < len(self.base):
+                result.append((self.base.labels[i], self.base_completions[i], float(scores[i])))
+            else:
+                result.append((texts[i - len(self.base)], completions[i - len(self.base)], float(scores[i])))
+        return result
+
+    def suggest(
+        self,
+        query_embedding: np.ndarray,
+        num_suggestions: int = 5,
+        k: int = DEFAULT_NEIGHBOURS,
+        min_similarity: float = DEFAULT_MIN_NEIGHBOUR_SIMILARITY
+    ) -> List[Tuple[str, float]]:
+        """
+        Completions ranked by the summed similarity of the neighbours that
+        carry them, as (completion, share of the total vote). Neighbours below
+        min_similarity don't vote, so this may return fewer than num_suggestions.
+        """
+        with metrics.timer("example_suggest"):
+            votes: Dict[str, float] = {}
+            for _, completion, score in self.neighbours(query_embedding, k):
+                if score < min_similarity:
+                    break
+                votes[completion] = votes.get(completion, 0.0) + score
+        total = sum(votes.values())
+        ranked = sorted(votes.items(), key=lambda item: -item[1])[:num_suggestions]
+        return [(completion, weight / total) for completion, weight in ranked]
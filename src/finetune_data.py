@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+# Bump when the layout of FinetuneData or of the artifact changes
+ARTIFACT_VERSION = 2
+# Directory for the compiled artifacts instead of next to each JSONL
+ARTIFACT_DIR_ENV = "OCC_ARTIFACT_DIR"
+
+
+class FinetuneData(NamedTuple):
+    """
+    Everything the tools derive from a finetune.jsonl file:
+
+    pre_match: lowercased prompt_occupation -> completion (load_pre_match_dict)
+    decoder: transformed_completion -> completion (load_decoder)
+    completions: sorted unique completions (load_finetune_completions)
+    targets: lowercased prompt_occupation -> the label the model emits, its
+        transformed_completion if present, else the completion (local_classifier)
+
+    The structures are shared by every caller in the process; don't mutate them.
+    """
+    pre_match: Dict[str, str]
+    decoder: Dict[str, str]
+    completions: List[str]
+    targets: Dict[str, str]
+
+
+# Process-level cache: resolved path -> (mtime_ns, size, FinetuneData)
+_loaded: Dict[str, tuple] = {}
+
+
+def parse_finetune_jsonl(jsonl_path: str) -> FinetuneData:
+    """
+    Parses finetune.jsonl in a single pass and builds all derived structures.
+    Label strings are interned, so each distinct completion is stored once.
+    """
+    labels: Dict[str, str] = {}
+    completions = set()
+    pre_match: Dict[str, str] = {}
+    decoder: Dict[str, str] = {}
+    targets: Dict[str, str] = {}
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            completion = labels.setdefault(entry["completion"], entry["completion"])
+            completions.add(completion)
+            stripped = completion.strip()
+            key = entry["prompt_occupation"].strip().lower()
+            pre_match[key] = labels.setdefault(stripped, stripped)
+            targets[key] = pre_match[key]
+            if "transformed_completion" in entry:
+                transformed = entry["transformed_completion"].strip()
+                decoder[transformed] = completion
+                targets[key] = labels.setdefault(transformed, transformed)
+    return FinetuneData(pre_match, decoder, sorted(completions), targets)
+
+
+def artifact_path(jsonl_path: str) -> Path:
+    """
+    <name>.jsonl.compiled next to the JSONL, or, with OCC_ARTIFACT_DIR set
+    (e.g. for a read-only data directory or a test run), a file in that
+    directory named after the JSONL and a hash of its resolved path.
+    """
+    path = Path(jsonl_path)
+    directory = os.environ.get(ARTIFACT_DIR_ENV)
+    if directory:
+        digest = hashlib.sha1(str(path.resolve()).encode("utf-8")).hexdigest()[:16]
+        return Path(directory) / f"{path.name}.{digest}.compiled"
+    return path.with_name(path.name + ".compiled")
+
+
+def _content_hash(jsonl_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(jsonl_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_artifact(path: Path) -> Optional[dict]:
+    try:
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        # TypeError: pickled by an older FinetuneData with other fields
+        return None
+    if not isinstance(artifact, dict) or artifact.get("version") != ARTIFACT_VERSION:
+        return None
+    return artifact
+
+
+def _write_artifact(path: Path, artifact: dict) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # A read-only data directory just means no artifact; the parse still succeeded
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def load_finetune_data(jsonl_path: str, use_artifact: bool = True) -> FinetuneData:
+    """
+    Returns the FinetuneData for a finetune.jsonl file, reading the JSONL as
+    rarely as possible:
+
+    1. within a process, results are cached until the file's mtime or size changes;
+    2. across processes, a compiled binary artifact (<name>.jsonl.compiled,
+       see artifact_path) is loaded instead of the JSONL while its recorded
+       mtime and size still match. If only the mtime changed, the content hash decides whether the
+       artifact is still valid.
+
+    Args:
+        jsonl_path (str): Path to the finetune.jsonl file.
+        use_artifact (bool, optional): Read/write the compiled artifact.
+
+    Returns:
+        FinetuneData: The shared, parsed structures.
+    """
+    resolved = str(Path(jsonl_path).resolve())
+    stat = os.stat(resolved)
+    fingerprint = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _loaded.get(resolved)
+    if cached is not None and cached[:2] == fingerprint:
+        return cached[2]
+
+    data = None
+    if use_artifact:
+        path = artifact_path(resolved)
+        artifact = _read_artifact(path)
+        if artifact is not None:
+            if (artifact["mtime_ns"], artifact["size"]) == fingerprint:
+                data = artifact["data"]
+            elif artifact["size"] == stat.st_size and artifact["sha256"] == _content_hash(resolved):
+                # Touched but unchanged: keep the data, refresh the stamp
+                data = artifact["data"]
+                artifact["mtime_ns"] = stat.st_mtime_ns
+                _write_artifact(path, artifact)
+
+        if data is None:
+            data = parse_finetune_jsonl(resolved)
+            _write_artifact(path, {
+                "version": ARTIFACT_VERSION,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": _content_hash(resolved),
+                "data": data,
+            })
+    else:
+        data = parse_finetune_jsonl(resolved)
+
+    _loaded[resolved] = (*fingerprint, data)
+    return data
+
+
+def clear_cache() -> None:
+    """
+    Forgets every result load_finetune_data cached in this process, so the
+    next call reads the compiled artifact (or the JSONL) again.
+    """
+    _loaded.clear()
@@ -0,0 +1,387 @@
+"""
+Offline classifier trained from the prompt/completion pairs in finetune.jsonl:
+character n-gram TF-IDF features with a linear model, and softmax
+probabilities calibrated by temperature scaling on a held-out split.
+
+It predicts the same strings the fine-tuned model emits
+('transformed_completion' where present, else 'completion'), so its
+output decodes with load_decoder/decode_with_score unchanged, and it can
+stand in for the API in get_classification(..., classifier=...).
+
+    python local_classifier.py train --dict data/finetune.jsonl --output data/local_classifier.pkl
+    python local_classifier.py eval --model data/local_classifier.pkl --cache data/classification_cache.sqlite
+    python local_classifier.py eval --model data/local_classifier.pkl --input gpt_results.csv --column occupation
+    python local_classifier.py predict --model data/local_classifier.pkl --decoder data/finetune.jsonl
+        --input prematched.csv --column occupation --output classified.csv
+"""
+import argparse
+import json
+import os
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from classification import MODEL_ID, PROMPT_VERSION
+from classification_cache import normalize_title
+from embedding_index import file_sha256
+from finetune_data import load_finetune_data
+
+# Bump when the pickled layout changes
+MODEL_VERSION = 1
+DEFAULT_NGRAM_RANGE = (2, 4)
+DEFAULT_HOLDOUT_FRACTION = 0.1
+# L2 penalty of the linear model; raise it for noisier labels
+DEFAULT_ALPHA = 1e-5
+# Rows scored per block in predict_proba, bounding the (rows, classes) matrix
+_PREDICT_BLOCK_ROWS = 10_000
+_TEMPERATURES = np.logspace(-2, 1.5, 71)
+
+
+def load_training_pairs(jsonl_path: str) -> Tuple[List[str], List[str]]:
+    """
+    (normalized prompt_occupation, target) pairs from finetune.jsonl, where the
+    target is the model-facing 'transformed_completion' if present, else the
+    'completion'. A title listed more than once keeps its last target.
+    """
+    pairs = {}
+    for title, target in load_finetune_data(jsonl_path).targets.items():
+        pairs[normalize_title(title)] = target
+    return list(pairs), list(pairs.values())
+
+
+def _softmax(logits: np.ndarray, temperature: float) -> np.ndarray:
+    scaled = logits / temperature
+    scaled -= scaled.max(axis=1, keepdims=True)
+    np.exp(scaled, out=scaled)
+    scaled /= scaled.sum(axis=1, keepdims=True)
+    return scaled
+
+
+def fit_temperature(logits: np.ndarray, targets: np.ndarray) -> float:
+    """
+    The softmax temperature that minimizes the negative log-likelihood of
+    the true classes, by grid search.
+    """
+    rows = np.arange(len(targets))
+    best_temperature, best_nll = 1.0, np.inf
+    for temperature in _TEMPERATURES:
+        nll = -np.log(_softmax(logits, temperature)[rows, targets] + 1e-12).mean()
+        if nll < best_nll:
+            best_temperature, best_nll = float(temperature), nll
+    return best_temperature
+
+
+def expected_calibration_error(confidence: np.ndarray, correct: np.ndarray, n_bins: int = 10) -> float:
+    """
+    Mean |accuracy - confidence| over equal-width confidence bins, weighted by bin size.
+    """
+    bins = np.minimum((confidence * n_bins).astype(int), n_bins - 1)
+    error = 0.0
+    for b in range(n_bins):
+        in_bin = bins == b
+        if in_bin.any():
+            error += in_bin.mean() * abs(correct[in_bin].mean() - confidence[in_bin].mean())
+    return float(error)
+
+
+class LocalClassifier:
+    """
+    A trained TF-IDF + linear classifier with a calibration temperature.
+    Build with train(), persist with save()/load().
+    """
+
+    def __init__(self, vectorizer, model, temperature: float = 1.0, source_sha256: Optional[str] = None):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.temperature = temperature
+        self.source_sha256 = source_sha256
+        self.classes = [str(c) for c in model.classes_]
+
+    @classmethod
+    def train(
+        cls,
+        jsonl_path: str,
+        ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE,
+        holdout_fraction: float = DEFAULT_HOLDOUT_FRACTION,
+        alpha: float = DEFAULT_ALPHA,
+        seed: int = 0
+    ) -> Tuple["LocalClassifier", dict]:
+        """
+        Trains on every pair in jsonl_path. The temperature is first fitted on
+        a random held-out split, scored by a model trained on the rest (which
+        also gives the reported held-out accuracy); the final model then sees
+        all pairs.
+
+        Returns:
+            (classifier, report): report has the held-out accuracy, ECE before
+            and after calibration, the temperature and the training time.
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import SGDClassifier
+
+        start = time.perf_counter()
+        texts, targets = load_training_pairs(jsonl_path)
+
+        def fit(train_texts, train_targets):
+            vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=ngram_range,
+                                         sublinear_tf=True, dtype=np.float32)
+            model = SGDClassifier(loss="log_loss", alpha=alpha, max_iter=50, tol=1e-4,
+                                  random_state=seed, n_jobs=-1)
+            model.fit(vectorizer.fit_transform(train_texts), train_targets)
+            return cls(vectorizer, model)
+
+        report = {"pairs": len(texts), "classes": len(set(targets))}
+        temperature = 1.0
+        rng = np.random.default_rng(seed)
+        holdout = rng.random(len(texts)) < holdout_fraction
+        if 0 < holdout.sum() < len(texts):
+            held_out = fit([t for t, h in zip(texts, holdout) if not h],
+                           [y for y, h in zip(targets, holdout) if not h])
+            # Held-out classes unseen in training can't be scored; leave them out of the fit
+            class_ids = {c: i for i, c in enumerate(held_out.classes)}
+            rows = [i for i in np.flatnonzero(holdout) if targets[i] in class_ids]
+            logits = held_out.decision_function([texts[i] for i in rows])
+            truth = np.array([class_ids[targets[i]] for i in rows])
+            temperature = fit_temperature(logits, truth)
+            raw, calibrated = _softmax(logits, 1.0), _softmax(logits, temperature)
+            correct = raw.argmax(axis=1) == truth
+            report.update({
+                "holdout_pairs": int(holdout.sum()),
+                # Held-out pairs of unseen classes count as errors
+                "holdout_accuracy": round(float(correct.sum() / holdout.sum()), 4),
+                "ece_uncalibrated": round(expected_calibration_error(raw.max(axis=1), correct), 4),
+                "ece_calibrated": round(expected_calibration_error(calibrated.max(axis=1), correct), 4),
+            })
+
+        classifier = fit(texts, targets)
+        classifier.temperature = temperature
+        classifier.source_sha256 = file_sha256(jsonl_path)
+        report.update({"temperature": round(temperature, 4),
+                       "train_seconds": round(time.perf_counter() - start, 2)})
+        return classifier, report
+
+    def decision_function(self, titles: List[str]) -> np.ndarray:
+        logits = self.model.decision_function(self.vectorizer.transform([normalize_title(t) for t in titles]))
+        if logits.ndim == 1:  # binary problems give one column
+            logits = np.column_stack([-logits, logits])
+        return logits
+
+    def predict_proba(self, titles: List[str]) -> np.ndarray:
+        """
+        Calibrated class probabilities, shape (len(titles), len(self.classes)).
+        """
+        return _softmax(self.decision_function(titles), self.temperature)
+
+    @metrics.instrument("local_classify")
+    def predict(self, titles: List[str]) -> List[Tuple[str, float]]:
+        """
+        (predicted raw label, calibrated probability) per title, scored in blocks.
+        """
+        results = []
+        for start in range(0, len(titles), _PREDICT_BLOCK_ROWS):
+            probabilities = self.predict_proba(titles[start:start + _PREDICT_BLOCK_ROWS])
+            best = probabilities.argmax(axis=1)
+            results.extend((self.classes[i], float(p)) for i, p in zip(best, probabilities[np.arange(len(best)), best]))
+        metrics.inc("local_classify_rows", len(titles))
+        return results
+
+    def classify(self, occup_title: str) -> str:
+        """
+        Raw label for one title, like request_classification's output.
+        """
+        return self.predict([occup_title])[0][0]
+
+    def save(self, path: str) -> None:
+        payload = {"version": MODEL_VERSION, "vectorizer": self.vectorizer, "model": self.model,
+                   "temperature": self.temperature, "source_sha256": self.source_sha256}
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, jsonl_path: Optional[str] = None) -> "LocalClassifier":
+        """
+        Loads a saved classifier. With jsonl_path, also checks that it was
+        trained on that finetune.jsonl as it is now, since a model trained
+        on an older file can emit labels the current decoder doesn't know.
+        """
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        if payload.get("version") != MODEL_VERSION:
+            raise ValueError(f"{path} was saved by an incompatible version; retrain it.")
+        if jsonl_path is not None and payload["source_sha256"] != file_sha256(jsonl_path):
+            raise ValueError(f"{path} was trained on a different {jsonl_path}; retrain it.")
+        return cls(payload["vectorizer"], payload["model"], payload["temperature"], payload["source_sha256"])
+
+
+def classify_dataframe_locally(
+    df: pd.DataFrame,
+    occupation_column: str,
+    classifier: LocalClassifier,
+    decoder_map: Dict[str, str],
+    min_probability: float = 0.0,
+    output_col: str = "final_output",
+    method_col: str = "method",
+    raw_col: str = "raw_output",
+    probability_col: str = "local_probability"
+) -> pd.DataFrame:
+    """
+    Offline counterpart of batch_classify.classify_dataframe: rows without a
+    final_output are classified in one vectorized pass per distinct title.
+    Predictions at or above min_probability are decoded into output_col
+    with method = 'local_model'; every prediction's raw label and probability
+    are kept, so low-confidence rows can still be sent to the API.
+    """
+    if output_col not in df.columns:
+        df[output_col] = pd.Series(np.nan, index=df.index, dtype=object)
+    if method_col not in df.columns:
+        df[method_col] = pd.Series(np.nan, index=df.index, dtype=object)
+    df[output_col] = df[output_col].astype(object)
+    df[method_col] = df[method_col].astype(object)
+    df[raw_col] = pd.Series(np.nan, index=df.index, dtype=object)
+    df[probability_col] = np.nan
+
+    todo = df[output_col].isna() & df[occupation_column].notna()
+    row_titles = df.loc[todo, occupation_column].astype(str)
+    titles = list(pd.unique(row_titles))
+    results = dict(zip(titles, classifier.predict(titles)))
+
+    df.loc[todo, raw_col] = row_titles.map(lambda t: results[t][0])
+    df.loc[todo, probability_col] = row_titles.map(lambda t: results[t][1])
+    decoded = df.loc[todo, raw_col].map(lambda raw: decoder_map.get(raw, raw))
+    accepted = decoded.index[df.loc[todo, probability_col] >= min_probability]
+    df.loc[accepted, output_col] = decoded[accepted]
+    df.loc[accepted, method_col] = "local_model"
+    return df
+
+
+def load_reference_labels(
+    csv_path: Optional[str] = None,
+    occupation_column: Optional[str] = None,
+    label_column: str = "raw_output",
+    cache_path: Optional[str] = None,
+    model_id: str = MODEL_ID,
+    prompt_version: str = PROMPT_VERSION
+) -> Tuple[List[str], List[str]]:
+    """
+    (title, GPT raw output) pairs to evaluate against: either a CSV written
+    by batch_classify.py (occupation column plus raw_output) or the rows of
+    a classification cache database written by `model_id` with
+    `prompt_version` (the cache keeps other models' rows side by side).
+    Error outputs are skipped.
+    """
+    if cache_path:
+        # sqlite3's context manager only ends the transaction; close explicitly
+        conn = sqlite3.connect(cache_path)
+        try:
+            rows = conn.execute(
+                "SELECT title, raw_output FROM classifications WHERE model_id = ? AND prompt_version = ?",
+                (model_id, prompt_version)
+            ).fetchall()
+        finally:
+            conn.close()
+        df = pd.DataFrame(rows, columns=["title", "label"])
+    else:
+        df = pd.read_csv(csv_path, usecols=[occupation_column, label_column])
+        df.columns = ["title", "label"]
+    df = df.dropna()
+    df = df[~df["label"].astype(str).str.startswith("Error:")]
+    return df["title"].astype(str).tolist(), df["label"].astype(str).str.strip().tolist()
+
+
+def evaluate(classifier: LocalClassifier, titles: List[str], reference: List[str],
+             thresholds=(0.5, 0.7, 0.9)) -> dict:
+    """
+    Agreement of the local predictions with reference (GPT) labels, overall
+    and among predictions at or above each probability threshold, plus
+    calibration error and throughput.
+    """
+    start = time.perf_counter()
+    predictions = classifier.predict(titles)
+    elapsed = time.perf_counter() - start
+    labels = np.array([label for label, _ in predictions], dtype=object)
+    confidence = np.array([p for _, p in predictions])
+    correct = labels == np.array(reference, dtype=object)
+    known = set(classifier.classes)
+    report = {
+        "rows": len(titles),
+        "agreement": round(float(correct.mean()), 4) if len(titles) else None,
+        "reference_labels_unknown_to_model": int(sum(r not in known for r in reference)),
+        "ece": round(expected_calibration_error(confidence, correct), 4) if len(titles) else None,
+        "rows_per_second": round(len(titles) / elapsed) if elapsed > 0 else None,
+        "by_threshold": {},
+    }
+    for threshold in thresholds:
+        kept = confidence >= threshold
+        report["by_threshold"][str(threshold)] = {
+            "coverage": round(float(kept.mean()), 4) if len(titles) else None,
+            "agreement": round(float(correct[kept].mean()), 4) if kept.any() else None,
+        }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train or evaluate the offline local classifier.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="Train from finetune.jsonl and save the model.")
+    train.add_argument("--dict", dest="jsonl_path", required=True, help="Path to finetune.jsonl.")
+    train.add_argument("--output", required=True, help="Where to save the model (pickle).")
+    train.add_argument("--holdout", type=float, default=DEFAULT_HOLDOUT_FRACTION,
+                       help=f"Fraction held out for calibration (default: {DEFAULT_HOLDOUT_FRACTION}).")
+    train.add_argument("--alpha", type=float, default=DEFAULT_ALPHA,
+                       help=f"L2 penalty; raise it for noisy labels (default: {DEFAULT_ALPHA}).")
+
+    evaluate_cmd = commands.add_parser("eval", help="Report agreement with GPT labels.")
+    evaluate_cmd.add_argument("--model", required=True, help="Saved local classifier.")
+    evaluate_cmd.add_argument("--cache", help="Classification cache database with GPT outputs.")
+    evaluate_cmd.add_argument("--input", help="CSV with GPT outputs, e.g. from batch_classify.py.")
+    evaluate_cmd.add_argument("--column", help="Occupation column of --input.")
+    evaluate_cmd.add_argument("--label-column", default="raw_output",
+                              help="Column of --input with the GPT raw output (default: raw_output).")
+
+    predict = commands.add_parser("predict", help="Classify the unmatched rows of a CSV offline.")
+    predict.add_argument("--model", required=True, help="Saved local classifier.")
+    predict.add_argument("--decoder", required=True, help="Path to finetune.jsonl.")
+    predict.add_argument("--input", required=True, help="CSV file (e.g. the output of a pre-match run).")
+    predict.add_argument("--column", required=True, help="Name of the occupation column.")
+    predict.add_argument("--output", required=True, help="Path for the output CSV.")
+    predict.add_argument("--min-probability", type=float, default=0.0,
+                         help="Only accept predictions this probable (default: 0, accept all).")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "train":
+        classifier, report = LocalClassifier.train(
+            args.jsonl_path, holdout_fraction=args.holdout, alpha=args.alpha
+        )
+        classifier.save(args.output)
+        print(json.dumps(report, indent=2))
+        print(f"Model saved to {args.output}")
+    elif args.command == "predict":
+        from classification import load_decoder
+
+        classifier = LocalClassifier.load(args.model, args.decoder)
+        start = time.perf_counter()
+        df = classify_dataframe_locally(pd.read_csv(args.input), args.column, classifier,
+                                        load_decoder(args.decoder), args.min_probability)
+        elapsed = time.perf_counter() - start
+        df.to_csv(args.output, index=False)
+        print(f"Classified {int(df['raw_output'].notna().sum())} rows "
+              f"({int((df['method'] == 'local_model').sum())} accepted) in {elapsed:.1f}s. Output: {args.output}")
+    else:
+        if not (args.cache or (args.input and args.column)):
+            raise SystemExit("eval needs --cache, or --input with --column.")
+        classifier = LocalClassifier.load(args.model)
+        titles, reference = load_reference_labels(args.input, args.column, args.label_column, args.cache)
+        print(json.dumps(evaluate(classifier, titles, reference), indent=2))
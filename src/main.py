@@ -1,21 +1,28 @@
+import argparse
 import sys
-import pandas as pd
+import time
 
-from pre_matching import load_pre_match_dict, pre_match_occupation
+import metrics
+from occupation_text import DEFAULT_MIN_SIMILARITY
+
+# pandas (via columnar_io and pre_matching) and tkinter are imported inside
+# the functions that use them, so `--help`, argument errors and the file
+# dialogs don't wait for them.
+
+DEFAULT_CHUNKSIZE = 100_000
+OUTPUT_MODES = ("merge", "key")
+DATA_FILETYPES = (("CSV Files", "*.csv"), ("Parquet Files", "*.parquet"),
+                  ("Arrow Files", "*.arrow *.feather"), ("All Files", "*.*"))
 
-# We will use Tkinter to prompt the user for file paths.
-try:
-    import tkinter as tk
-    from tkinter import filedialog
-except ImportError:
-    print("Tkinter is not available. Please install or use an environment that supports Tkinter.")
-    sys.exit(1)
 
 def select_file_dialog(title="Select File", filetypes=(("All Files", "*.*"),)):
     """
     Opens a file dialog for the user to select a file.
     Returns the path to the selected file or None if no file is selected.
     """
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     file_path = filedialog.askopenfilename(
@@ -31,6 +38,9 @@ def select_save_dialog(title="Save File As...", filetypes=(("CSV Files", "*.csv"
     Opens a file dialog for the user to select a save location.
     Returns the path to the selected file or None if no file is selected.
     """
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     file_path = filedialog.asksaveasfilename(
@@ -51,19 +61,30 @@ def run_pre_match_pipeline():
      4) performs pre_match_occupation,
      5) and allows them to save the output CSV.
     """
+    # We use Tkinter to prompt the user for file paths; only this interactive
+    # pipeline needs it, so headless runs never import it
+    try:
+        import tkinter  # noqa: F401
+    except ImportError:
+        print("Tkinter is not available. Please install or use an environment that supports Tkinter,")
+        print("or run headless: python main.py --input <csv> --output <csv> --column <name> --dict <jsonl>")
+        sys.exit(1)
 
     # ---- 1) Prompt for CSV input ----
     print("A file dialog will open. Please select the CSV file containing occupation data.")
     csv_path = select_file_dialog(
         title="Select CSV file with occupation data",
-        filetypes=(("CSV Files", "*.csv"), ("All Files", "*.*"))
+        filetypes=DATA_FILETYPES
     )
     if not csv_path:
         print("No CSV file was selected. Exiting.")
         return
 
     print(f"Selected CSV file: {csv_path}")
-    df = pd.read_csv(csv_path)
+    from columnar_io import BatchWriter, read_frame
+    from pre_matching import load_pre_match_dict, pre_match_occupation
+
+    df = read_frame(csv_path)
     print("CSV loaded successfully.\n")
 
     # ---- 2) Load the JSONL from a known path ----
@@ -101,15 +122,174 @@ def run_pre_match_pipeline():
     print("A file dialog will open for you to choose where to save the updated CSV.")
     save_path = select_save_dialog(
         title="Save Updated CSV",
-        filetypes=(("CSV Files", "*.csv"), ("All Files", "*.*"))
+        filetypes=DATA_FILETYPES
     )
     if not save_path:
         print("No output file selected. Exiting without saving.")
         return
 
-    df_updated.to_csv(save_path, index=False)
+    with BatchWriter(save_path) as writer:
+        writer.write(df_updated)
     print(f"Updated CSV saved to: {save_path}")
 
 
+def run_headless_pre_match(
+    input_path: str,
+    output_path: str,
+    occupation_column: str,
+    jsonl_path: str,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    min_similarity: float = None,
+    output_mode: str = "merge",
+    key_column: str = None,
+    compact_dict: bool = False
+) -> dict:
+    """
+    Non-interactive version of run_pre_match_pipeline for batch nodes.
+    Reads the input in chunks of `chunksize` rows, pre-matches each chunk and
+    appends it to the output, so memory use does not grow with file size.
+
+    Input and output may each be CSV, Parquet (.parquet/.pq) or Arrow IPC
+    (.arrow/.feather/.ipc), chosen by file suffix.
+
+    In "merge" mode the output is the whole input with 'final_output'/'method'
+    added. In "key" mode only the key column and the occupation column are
+    read (the other columns of a Parquet/Arrow file are never loaded), and
+    the output holds just the key plus the match columns, to be joined back
+    later. Without a key_column the key is the 0-based row number.
+
+    Args:
+        input_path (str): CSV/Parquet/Arrow file with occupation data.
+        output_path (str): Where to write the result.
+        occupation_column (str): Name of the column with occupation data.
+        jsonl_path (str): Path to the finetune.jsonl dictionary.
+        chunksize (int, optional): Number of rows read and written per chunk.
+        min_similarity (float, optional): If set, rows without an exact match go
+            through the fuzzy tier and are accepted at this similarity or above.
+        output_mode (str, optional): "merge" (default) or "key".
+        key_column (str, optional): Row key written in "key" mode.
+        compact_dict (bool, optional): Use the memory-mapped CompactDict
+            instead of a dict (see load_pre_match_dict).
+
+    Returns:
+        dict: Row counts and throughput for the run.
+    """
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"output_mode must be one of {OUTPUT_MODES}, not {output_mode!r}")
+
+    from columnar_io import ROW_NUMBER_COLUMN, BatchWriter, iter_batches, read_column_names
+    from pre_matching import (
+        build_fuzzy_index,
+        fuzzy_pre_match_occupation,
+        load_pre_match_dict,
+        pre_match_occupation,
+    )
+
+    start = time.perf_counter()
+    input_columns = read_column_names(input_path)
+    for column in (occupation_column, key_column):
+        if column is not None and column not in input_columns:
+            raise KeyError(f"Column '{column}' not found in {input_path}")
+
+    pre_match_dict = load_pre_match_dict(jsonl_path, compact=compact_dict)
+    print(f"Loaded {len(pre_match_dict)} dictionary entries from {jsonl_path}")
+    fuzzy_index = build_fuzzy_index(pre_match_dict) if min_similarity is not None else None
+
+    columns = None
+    if output_mode == "key":
+        columns = [c for c in input_columns if c in (key_column, occupation_column)]
+
+    total_rows = 0
+    matched_rows = 0
+    fuzzy_rows = 0
+    with BatchWriter(output_path) as writer:
+        # Per-chunk CSV type inference could change a column's type mid-file,
+        # which a Parquet/Arrow schema can't follow
+        csv_as_strings = writer.format != "csv"
+        for chunk in iter_batches(input_path, columns=columns, batch_size=chunksize,
+                                  csv_as_strings=csv_as_strings):
+            chunk = pre_match_occupation(chunk, occupation_column, pre_match_dict)
+            if fuzzy_index is not None:
+                chunk = fuzzy_pre_match_occupation(chunk, occupation_column, fuzzy_index, min_similarity)
+
+            if output_mode == "key":
+                match_columns = [c for c in ("final_output", "method", "match_score") if c in chunk.columns]
+                if key_column is None:
+                    chunk = chunk[match_columns]
+                    chunk.insert(0, ROW_NUMBER_COLUMN, range(total_rows, total_rows + len(chunk)))
+                else:
+                    chunk = chunk[[key_column] + match_columns]
+            writer.write(chunk)
+
+            total_rows += len(chunk)
+            matched_rows += int((chunk["method"] == "pre_match").sum())
+            fuzzy_rows += int((chunk["method"] == "fuzzy_match").sum())
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "rows": total_rows,
+        "pre_matched": matched_rows,
+        "fuzzy_matched": fuzzy_rows,
+        "unmatched": total_rows - matched_rows - fuzzy_rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(total_rows / elapsed) if elapsed > 0 else None,
+    }
+    print(
+        f"Processed {stats['rows']} rows ({stats['pre_matched']} pre-matched, "
+        f"{stats['fuzzy_matched']} fuzzy-matched, {stats['unmatched']} unmatched) in {stats['seconds']}s "
+        f"({stats['rows_per_second']} rows/s). Output: {output_path}"
+    )
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Dictionary pre-match for occupation CSVs. "
+                    "Run without arguments for the interactive (Tkinter) pipeline."
+    )
+    parser.add_argument("--input", help="CSV, Parquet or Arrow file containing occupation data.")
+    parser.add_argument("--output", help="Path for the output (.csv, .parquet or .arrow).")
+    parser.add_argument("--column", help="Name of the occupation column.")
+    parser.add_argument("--dict", dest="jsonl_path", help="Path to finetune.jsonl.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f"Rows per chunk (default: {DEFAULT_CHUNKSIZE}).")
+    parser.add_argument("--fuzzy", action="store_true",
+                        help="Also run the fuzzy tier on rows without an exact match.")
+    parser.add_argument("--output-mode", choices=OUTPUT_MODES, default="merge",
+                        help="'merge' writes every input column plus the match columns; 'key' reads only "
+                             "the key and occupation columns and writes the key plus the match columns.")
+    parser.add_argument("--key-column", help="Row key for --output-mode key (default: row number).")
+    parser.add_argument("--compact-dict", action="store_true",
+                        help="Memory-map a compact copy of the dictionary (<dict>.dict) instead of "
+                             "loading it into a dict; for dictionaries with millions of aliases.")
+    parser.add_argument("--metrics", help="Write per-stage metrics here (.prom for Prometheus text, else JSON).")
+    parser.add_argument("--min-similarity", type=float,
+                        help=f"Minimum fuzzy-match similarity, with --fuzzy (default: {DEFAULT_MIN_SIMILARITY}).")
+    args = parser.parse_args(argv)
+    if args.min_similarity is not None and not args.fuzzy:
+        parser.error("--min-similarity only applies to the fuzzy tier; add --fuzzy")
+    return args
+
+
 if __name__ == "__main__":
-    run_pre_match_pipeline()
+    args = parse_args()
+    headless_args = (args.input, args.output, args.column, args.jsonl_path)
+    if not any(headless_args):
+        run_pre_match_pipeline()
+    elif not all(headless_args):
+        print("Headless mode needs --input, --output, --column and --dict.")
+        sys.exit(2)
+    else:
+        if args.metrics:
+            metrics.enable()
+        min_similarity = None
+        if args.fuzzy:
+            min_similarity = DEFAULT_MIN_SIMILARITY if args.min_similarity is None else args.min_similarity
+        run_headless_pre_match(
+            args.input, args.output, args.column, args.jsonl_path, args.chunksize,
+            min_similarity=min_similarity,
+            output_mode=args.output_mode, key_column=args.key_column, compact_dict=args.compact_dict
+        )
+        if args.metrics:
+            metrics.dump(args.metrics)
+            print(f"Metrics written to {args.metrics}")
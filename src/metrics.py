@@ -0,0 +1,225 @@
+"""
+Lightweight, process-wide instrumentation for the classification pipeline.
+
+Stages record timers, counters and latency histograms here; a run can dump
+them as JSON or Prometheus text format. Recording is off unless enabled
+with enable() or the OCC_METRICS=1 environment variable, and when it is off
+every helper returns after a single flag check.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get("OCC_METRICS", "") not in ("", "0", "false")
+_lock = threading.Lock()
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+_counters: Dict[LabelKey, float] = {}
+_timers: Dict[str, list] = {}       # stage -> [calls, total seconds, max seconds]
+_histograms: Dict[str, list] = {}   # name -> [bucket counts..., +Inf count, sum]
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+        _histograms.clear()
+
+
+def _key(name: str, labels: Optional[Dict[str, str]]) -> LabelKey:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, value: float = 1, labels: Optional[Dict[str, str]] = None) -> None:
+    """
+    Adds value to a counter, e.g. inc("pre_match_rows", len(df)).
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float) -> None:
+    """
+    Records one latency sample in the histogram `name`.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        hist[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        hist[-1] += seconds
+
+
+def record_time(stage: str, seconds: float) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        timer = _timers.get(stage)
+        if timer is None:
+            timer = _timers[stage] = [0, 0.0, 0.0]
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+
+@contextmanager
+def timer(stage: str):
+    """
+    Times the enclosed block as one call of `stage`.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(stage, time.perf_counter() - start)
+
+
+def instrument(stage: str):
+    """
+    Decorator form of timer(): every call of the function is timed as `stage`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_time(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    """
+    Current values as plain data, plus derived dictionary hit rates.
+    """
+    with _lock:
+        counters = {}
+        for (name, labels), value in sorted(_counters.items()):
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            counters[f"{name}{{{label_text}}}" if label_text else name] = value
+        timers = {
+            stage: {"calls": calls, "total_seconds": round(total, 6),
+                    "mean_seconds": round(total / calls, 6) if calls else 0.0,
+                    "max_seconds": round(longest, 6)}
+            for stage, (calls, total, longest) in sorted(_timers.items())
+        }
+        histograms = {
+            name: {"buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], hist[:-1])),
+                   "count": sum(hist[:-1]), "sum": round(hist[-1], 6)}
+            for name, hist in sorted(_histograms.items())
+        }
+
+    rates = {}
+    for tier in ("pre_match", "fuzzy_match"):
+        rows = counters.get(f"{tier}_rows", 0)
+        if rows:
+            rates[f"{tier}_hit_rate"] = round(counters.get(f"{tier}_hits", 0) / rows, 4)
+    return {"enabled": _enabled, "counters": counters, "timers": timers,
+            "histograms": histograms, "rates": rates}
+
+
+def to_json(indent: int = 2) -> str:
+    return json.dumps(snapshot(), indent=indent)
+
+
+def _prom_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def to_prometheus(prefix: str = "occ_") -> str:
+    """
+    Prometheus text exposition format of the current metrics.
+    """
+    lines = []
+    with _lock:
+        seen = set()
+        for (name, labels), value in sorted(_counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                seen.add(name)
+            lines.append(f"{prefix}{name}_total{_prom_labels(labels)} {value}")
+
+        if _timers:
+            lines.append(f"# TYPE {prefix}stage_seconds summary")
+        for stage, (calls, total, _) in sorted(_timers.items()):
+            stage_label = (("stage", stage),)
+            lines.append(f"{prefix}stage_seconds_sum{_prom_labels(stage_label)} {total}")
+            lines.append(f"{prefix}stage_seconds_count{_prom_labels(stage_label)} {calls}")
+
+        for name, hist in sorted(_histograms.items()):
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            cumulative = 0
+            for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], hist[:-1]):
+                cumulative += count
+                lines.append(f"{prefix}{name}_bucket{_prom_labels((), (('le', bound),))} {cumulative}")
+            lines.append(f"{prefix}{name}_sum {hist[-1]}")
+            lines.append(f"{prefix}{name}_count {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def render_diagnostics(st, extra: Optional[Callable[[], dict]] = None) -> None:
+    """
+    Diagnostics panel for the Streamlit apps, drawn in the sidebar. Takes the
+    streamlit module as `st` so this file doesn't depend on it.
+
+    `extra` builds app-specific stats (cache sizes and the like); it is only
+    called while its checkbox is ticked, not on every rerun. The checkboxes
+    only show or hide things for the session viewing them; recording is
+    process-wide and stays under OCC_METRICS (set it before starting the
+    app), as every session shares it.
+    """
+    with st.sidebar.expander("Diagnostics"):
+        if extra is not None and st.checkbox("Show stats", value=False, key="show_stats"):
+            st.json(extra())
+        if not _enabled:
+            st.caption("Metrics recording is off; start the app with OCC_METRICS=1 to record.")
+        elif st.checkbox("Show metrics", value=False, key="show_metrics"):
+            st.json(snapshot())
+            st.download_button("Download Prometheus metrics", to_prometheus(),
+                               file_name="metrics.prom", mime="text/plain")
+
+
+def dump(path: str) -> None:
+    """
+    Writes the metrics to `path`: Prometheus text for .prom/.txt, JSON otherwise.
+    """
+    text = to_prometheus() if str(path).endswith((".prom", ".txt")) else to_json()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
@@ -0,0 +1,45 @@
+"""
+Occupation text normalization and matching defaults. Only uses the
+standard library, so entry points can use them (e.g. for --help text)
+without importing pandas; pre_matching re-exports them.
+"""
+import re
+
+# Abbreviations expanded by normalize_occupation (applied to whole words)
+ABBREVIATIONS = {
+    "sr": "senior",
+    "jr": "junior",
+    "asst": "assistant",
+    "assoc": "associate",
+    "mgr": "manager",
+    "mngr": "manager",
+    "dir": "director",
+    "engr": "engineer",
+    "eng": "engineer",
+    "admin": "administrator",
+    "exec": "executive",
+    "tech": "technician",
+    "prof": "professor",
+    "dr": "doctor",
+    "supv": "supervisor",
+    "coord": "coordinator",
+    "rep": "representative",
+    "dept": "department",
+    "svp": "senior vice president",
+    "govt": "government",
+    "atty": "attorney",
+}
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+DEFAULT_MIN_SIMILARITY = 0.7
+
+
+def normalize_occupation(text: str) -> str:
+    """
+    Normalizes an occupation string for fuzzy matching: lowercases it, turns
+    punctuation into spaces, collapses whitespace and expands common
+    abbreviations ("Sr. Software Engr." -> "senior software engineer").
+    """
+    words = _NON_WORD.sub(" ", str(text).lower()).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
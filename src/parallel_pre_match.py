@@ -0,0 +1,272 @@
+import argparse
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+from pre_matching import (
+    DEFAULT_MIN_SIMILARITY,
+    build_fuzzy_index,
+    fuzzy_pre_match_occupation,
+    load_pre_match_dict,
+    pre_match_occupation,
+)
+
+DEFAULT_PARTITION_MB = 64
+DEFAULT_CHUNKSIZE = 100_000
+
+# Set in the parent before the pool starts, so forked workers inherit the
+# parsed dictionary (copy-on-write) instead of loading it again
+_pre_match_dict: Optional[Mapping[str, str]] = None
+_fuzzy_index = None
+
+
+def _init_worker(jsonl_path: str, use_fuzzy: bool, compact_dict: bool) -> None:
+    # Only does work under spawn/forkserver, where globals aren't inherited;
+    # load_pre_match_dict then reads the compiled artifact, not the JSONL
+    global _pre_match_dict, _fuzzy_index
+    if _pre_match_dict is None:
+        _pre_match_dict = load_pre_match_dict(jsonl_path, compact=compact_dict)
+    if use_fuzzy and _fuzzy_index is None:
+        _fuzzy_index = build_fuzzy_index(_pre_match_dict)
+
+
+def expand_inputs(patterns: List[str]) -> List[Path]:
+    """
+    CSV files named by paths, directories (all *.csv inside) or glob patterns,
+    sorted and deduplicated.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(Path(pattern).glob("*.csv"))
+        else:
+            paths.update(Path(p) for p in glob.glob(pattern))
+    return sorted(p.resolve() for p in paths if p.is_file())
+
+
+def output_names(paths: List[Path]) -> List[str]:
+    """
+    Output file name for each input: <stem>.prematched.csv, or
+    <stem>-<hash of the resolved path>.prematched.csv for inputs whose
+    stem is shared with another input (e.g. a/data.csv and b/data.csv).
+    Raises ValueError if two names would still clash (compared
+    case-insensitively, for case-insensitive filesystems).
+    """
+    stem_counts = {}
+    for path in paths:
+        stem_counts[path.stem.casefold()] = stem_counts.get(path.stem.casefold(), 0) + 1
+    names = []
+    for path in paths:
+        stem = path.stem
+        if stem_counts[stem.casefold()] > 1:
+            stem += "-" + hashlib.sha1(str(path.resolve()).encode("utf-8")).hexdigest()[:8]
+        names.append(f"{stem}.prematched.csv")
+
+    seen = {}
+    for path, name in zip(paths, names):
+        if name.casefold() in seen:
+            raise ValueError(f"{seen[name.casefold()]} and {path} would both be written to {name}")
+        seen[name.casefold()] = path
+    return names
+
+
+def partition_file(path: Path, partition_bytes: int) -> List[Tuple[int, int]]:
+    """
+    Splits a CSV into (start, end) byte ranges of roughly partition_bytes,
+    each starting right after a newline. The first range starts after the
+    header line. A file with a header but no rows gets one empty range, so
+    its output still gets the header.
+
+    Rows are assumed not to contain quoted newlines; files that do should be
+    processed with partitioning disabled (partition_bytes=0).
+    """
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        f.readline()
+        start = f.tell()
+        if start >= size:
+            return [(start, start)] if start > 0 else []
+        if partition_bytes <= 0:
+            return [(start, size)]
+
+        ranges = []
+        while start < size:
+            f.seek(min(start + partition_bytes, size))
+            if f.tell() < size:
+                f.readline()  # advance to the end of the current row
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _process_partition(task: dict) -> dict:
+    start_time = time.perf_counter()
+    with open(task["path"], "rb") as f:
+        header = f.readline()
+        f.seek(task["start"])
+        body = f.read(task["end"] - task["start"])
+
+    rows = pre_matched = fuzzy_matched = 0
+    with open(task["part_path"], "w", encoding="utf-8", newline="") as out:
+        # As text: inferring dtypes per partition could write the same column
+        # differently from one partition to the next (e.g. 7 and 7.0)
+        reader = pd.read_csv(io.BytesIO(header + body), chunksize=task["chunksize"], dtype=str)
+        for i, chunk in enumerate(reader):
+            chunk = pre_match_occupation(chunk, task["column"], _pre_match_dict)
+            if _fuzzy_index is not None:
+                chunk = fuzzy_pre_match_occupation(chunk, task["column"], _fuzzy_index, task["min_similarity"])
+            # Only the file's first partition carries the output header
+            chunk.to_csv(out, index=False, header=(task["part"] == 0 and i == 0))
+            rows += len(chunk)
+            pre_matched += int((chunk["method"] == "pre_match").sum())
+            fuzzy_matched += int((chunk["method"] == "fuzzy_match").sum())
+
+    return {"path": task["path"], "part": task["part"], "part_path": task["part_path"],
+            "rows": rows, "pre_matched": pre_matched, "fuzzy_matched": fuzzy_matched,
+            "bytes": task["end"] - task["start"], "seconds": time.perf_counter() - start_time}
+
+
+def run_parallel_pre_match(
+    inputs: List[str],
+    output_dir: str,
+    occupation_column: str,
+    jsonl_path: str,
+    workers: Optional[int] = None,
+    partition_mb: float = DEFAULT_PARTITION_MB,
+    min_similarity: Optional[float] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    compact_dict: bool = False
+) -> dict:
+    """
+    Pre-matches many CSV files in a process pool. Large files are split into
+    byte-range partitions so one big file also uses every core; each input
+    gets its own <name>.prematched.csv in output_dir (see output_names),
+    and a combined summary.json is written next to them.
+
+    Args:
+        inputs (List[str]): Files, directories or glob patterns.
+        output_dir (str): Where the outputs and summary.json go.
+        occupation_column (str): Name of the occupation column (same in every file).
+        jsonl_path (str): Path to the finetune.jsonl dictionary.
+        workers (int, optional): Processes to use (default: all cores).
+        partition_mb (float, optional): Target partition size; 0 disables splitting.
+        min_similarity (float, optional): If set, also run the fuzzy tier.
+        chunksize (int, optional): Rows per chunk inside a partition.
+        compact_dict (bool, optional): Share one memory-mapped CompactDict
+            between the workers instead of a dict, so a huge dictionary
+            costs its page cache once rather than copy-on-write pages per worker.
+
+    Returns:
+        dict: The combined summary (per-file counts and overall throughput).
+    """
+    global _pre_match_dict, _fuzzy_index
+    start_time = time.perf_counter()
+    paths = expand_inputs(inputs)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Load once in the parent; fork shares it with every worker
+    _pre_match_dict = load_pre_match_dict(jsonl_path, compact=compact_dict)
+    _fuzzy_index = build_fuzzy_index(_pre_match_dict) if min_similarity is not None else None
+
+    # Checked before any work starts, so a clash can't overwrite outputs
+    names = output_names(paths)
+
+    tasks = []
+    for index, path in enumerate(paths):
+        for part, (start, end) in enumerate(partition_file(path, int(partition_mb * 2 ** 20))):
+            tasks.append({
+                "path": str(path), "part": part, "start": start, "end": end,
+                # The input's index keeps parts of same-named inputs apart
+                "part_path": str(output_dir / f"{index:05d}.{path.stem}.part{part:05d}.csv"),
+                "column": occupation_column, "min_similarity": min_similarity,
+                "chunksize": chunksize,
+            })
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(jsonl_path, min_similarity is not None, compact_dict)) as executor:
+        part_results = list(executor.map(_process_partition, tasks))
+
+    # Stitch partitions back together in order, one output per input file
+    files = {}
+    for result in part_results:
+        files.setdefault(result["path"], []).append(result)
+    summary_files = []
+    for path, name in zip(paths, names):
+        parts = sorted(files.get(str(path), []), key=lambda r: r["part"])
+        output_path = output_dir / name
+        with open(output_path, "wb") as out:
+            for result in parts:
+                with open(result["part_path"], "rb") as part_file:
+                    shutil.copyfileobj(part_file, out)
+                os.remove(result["part_path"])
+        summary_files.append({
+            "input": str(path), "output": str(output_path), "partitions": len(parts),
+            "rows": sum(r["rows"] for r in parts),
+            "pre_matched": sum(r["pre_matched"] for r in parts),
+            "fuzzy_matched": sum(r["fuzzy_matched"] for r in parts),
+        })
+
+    elapsed = time.perf_counter() - start_time
+    total_rows = sum(f["rows"] for f in summary_files)
+    summary = {
+        "files": summary_files,
+        "total_files": len(summary_files),
+        "total_partitions": len(tasks),
+        "total_rows": total_rows,
+        "pre_matched": sum(f["pre_matched"] for f in summary_files),
+        "fuzzy_matched": sum(f["fuzzy_matched"] for f in summary_files),
+        "workers": workers or os.cpu_count(),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(total_rows / elapsed) if elapsed > 0 else None,
+    }
+    with open(output_dir / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-match many CSV files in parallel.")
+    parser.add_argument("inputs", nargs="+", help="CSV files, directories or glob patterns.")
+    parser.add_argument("--output-dir", required=True, help="Directory for outputs and summary.json.")
+    parser.add_argument("--column", required=True, help="Name of the occupation column.")
+    parser.add_argument("--dict", dest="jsonl_path", required=True, help="Path to finetune.jsonl.")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores).")
+    parser.add_argument("--partition-mb", type=float, default=DEFAULT_PARTITION_MB,
+                        help=f"Split files into ~N MB partitions; 0 disables splitting, e.g. for "
+                             f"files with quoted newlines (default: {DEFAULT_PARTITION_MB}).")
+    parser.add_argument("--fuzzy", action="store_true", help="Also run the fuzzy tier.")
+    parser.add_argument("--min-similarity", type=float, default=DEFAULT_MIN_SIMILARITY,
+                        help=f"Minimum fuzzy-match similarity (default: {DEFAULT_MIN_SIMILARITY}).")
+    parser.add_argument("--compact-dict", action="store_true",
+                        help="Share a memory-mapped compact copy of the dictionary (<dict>.dict) "
+                             "between the workers instead of a dict.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = run_parallel_pre_match(
+        args.inputs, args.output_dir, args.column, args.jsonl_path,
+        workers=args.workers, partition_mb=args.partition_mb,
+        min_similarity=args.min_similarity if args.fuzzy else None,
+        compact_dict=args.compact_dict
+    )
+    print(
+        f"Processed {summary['total_rows']} rows from {summary['total_files']} files "
+        f"({summary['total_partitions']} partitions) in {summary['seconds']}s "
+        f"({summary['rows_per_second']} rows/s). Summary: {Path(args.output_dir) / 'summary.json'}"
+    )
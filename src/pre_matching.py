@@ -1,34 +1,47 @@
-import json
+import itertools
 import pandas as pd
 import numpy as np
-from typing import Dict
+from typing import Dict, Mapping, Optional, Tuple
 
-def load_pre_match_dict(jsonl_path: str) -> Dict[str, str]:
+import metrics
+from compact_dict import CompactDict, load_compact_dict
+from finetune_data import load_finetune_data
+from occupation_text import DEFAULT_MIN_SIMILARITY, normalize_occupation
+
+# Bounds on the work of one FuzzyIndex.lookup in a large dictionary
+DEFAULT_MAX_POSTINGS = 20_000
+DEFAULT_MAX_CANDIDATES = 256
+
+
+@metrics.instrument("load_pre_match_dict")
+def load_pre_match_dict(jsonl_path: str, compact: bool = False) -> Mapping[str, str]:
     """
     Reads a finetuning JSONL file and returns a dictionary mapping
     prompt_occupation -> completion.
 
+    The file is parsed by load_finetune_data, so repeated calls (and the
+    decoder/suggestion loaders) reuse one cached parse. The returned dict is
+    shared; copy it before modifying.
+
     Args:
         jsonl_path (str): Path to the finetune.jsonl file.
+        compact (bool, optional): Return a memory-mapped CompactDict instead
+            of a dict, for dictionaries with millions of aliases.
 
     Returns:
-        dict: A dictionary where keys are the prompt occupations (in lowercase),
+        Mapping[str, str]: Keys are the prompt occupations (in lowercase),
               and values are the corresponding 'completion' strings.
     """
-    mapping = {}
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            entry = json.loads(line.strip())
-            prompt_occ = entry["prompt_occupation"].strip().lower()
-            completion_val = entry["completion"].strip()
-            mapping[prompt_occ] = completion_val
-    return mapping
+    if compact:
+        return load_compact_dict(jsonl_path)
+    return load_finetune_data(jsonl_path).pre_match
 
 
+@metrics.instrument("pre_match")
 def pre_match_occupation(
     df: pd.DataFrame,
     occupation_column: str,
-    pre_match_dict: Dict[str, str],
+    pre_match_dict: Mapping[str, str],
     output_col: str = "final_output",
     method_col: str = "method"
 ) -> pd.DataFrame:
@@ -39,42 +52,250 @@ def pre_match_occupation(
         method = 'pre_match'
     Otherwise, sets both columns to NaN.
 
+    The column is factorized first, so each distinct occupation string is
+    lowercased and looked up only once; the results are then broadcast back
+    to every row through the factorization codes. A CompactDict is queried
+    with one bulk lookup.
+
     Args:
         df (pd.DataFrame): The input DataFrame containing at least one occupation column.
         occupation_column (str): Name of the column with occupation data.
-        pre_match_dict (Dict[str, str]): Dictionary mapping occupation -> classification.
+        pre_match_dict (Mapping[str, str]): Dictionary mapping occupation -> classification,
+            e.g. a dict or CompactDict from load_pre_match_dict.
         output_col (str, optional): Name of the new column for the final classification.
         method_col (str, optional): Name of the new column for the method label.
 
     Returns:
         pd.DataFrame: The original DataFrame with two new columns appended.
     """
-    # Create empty lists to store the results
-    final_output_list = []
-    method_list = []
-
-    for _, row in df.iterrows():
-        occ_value = row[occupation_column]
-
-        # If the occupation is missing or NaN, leave results as NaN
-        if pd.isna(occ_value):
-            final_output_list.append(np.nan)
-            method_list.append(np.nan)
-            continue
-
-        # Convert to string and lowercase
-        occ_str_lower = str(occ_value).lower()
-
-        # Attempt to match in the dictionary
-        if occ_str_lower in pre_match_dict:
-            final_output_list.append(pre_match_dict[occ_str_lower])
-            method_list.append("pre_match")
-        else:
-            final_output_list.append(np.nan)
-            method_list.append(np.nan)
-
-    # Append columns to the original DataFrame
-    df[output_col] = final_output_list
-    df[method_col] = method_list
+    # Missing values (NaN/None) get code -1 and are never looked up
+    codes, uniques = pd.factorize(df[occupation_column])
+
+    # One lookup per distinct occupation instead of one per row. Both arrays
+    # carry a trailing NaN slot, which code -1 (missing) indexes into.
+    unique_matches = np.full(len(uniques) + 1, np.nan, dtype=object)
+    unique_methods = np.full(len(uniques) + 1, np.nan, dtype=object)
+    if isinstance(pre_match_dict, CompactDict):
+        label_codes = pre_match_dict.lookup_codes([str(occ_value).lower() for occ_value in uniques])
+        found = np.flatnonzero(label_codes >= 0)
+        unique_matches[found] = np.asarray(pre_match_dict.labels, dtype=object)[label_codes[found]]
+        unique_methods[found] = "pre_match"
+    else:
+        for i, occ_value in enumerate(uniques):
+            completion = pre_match_dict.get(str(occ_value).lower())
+            if completion is not None:
+                unique_matches[i] = completion
+                unique_methods[i] = "pre_match"
+
+    # Broadcast the per-unique results back to every row
+    final_output = unique_matches[codes]
+    method = unique_methods[codes]
+
+    # Append columns to the original DataFrame. Assigning lists keeps the dtype
+    # inference of the row-by-row version (e.g. float64 when nothing matched).
+    df[output_col] = final_output.tolist()
+    df[method_col] = method.tolist()
+
+    if metrics.is_enabled():
+        metrics.inc("pre_match_rows", len(df))
+        metrics.inc("pre_match_hits", int(np.count_nonzero(method == "pre_match")))
+
+    return df
+
+
+def _char_ngrams(text: str, n: int = 3) -> set:
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+class FuzzyIndex:
+    """
+    Character n-gram index over the normalized keys of a pre-match dictionary.
+
+    Each n-gram maps to the sorted ids of the keys containing it, and each
+    key to the ids of its n-grams (both as flat CSR arrays). Candidates are
+    keys sharing n-grams with the query, scored with the Dice coefficient
+    of their n-gram sets.
+
+    Common n-grams (like "er ") can be in a large share of a big dictionary,
+    so a lookup bounds its work: it counts shared n-grams over the query's
+    rarest n-grams only, as many as fit in `max_postings` postings. When
+    that leaves some out, only the `max_candidates` keys sharing the most
+    of the counted n-grams (and, with a min_similarity, of a size that can
+    reach it) are scored exactly. A key that matches mostly through very
+    common n-grams can then be missed; near-exact variants of a key, which
+    share its rare n-grams too, are not.
+    """
+
+    def __init__(
+        self,
+        pre_match_dict: Mapping[str, str],
+        n: int = 3,
+        max_postings: int = DEFAULT_MAX_POSTINGS,
+        max_candidates: int = DEFAULT_MAX_CANDIDATES
+    ):
+        self.n = n
+        self.max_postings = max_postings
+        self.max_candidates = max_candidates
+        # Normalized key -> completion; the first dictionary entry wins
+        self.exact: Dict[str, str] = {}
+        for key, completion in pre_match_dict.items():
+            self.exact.setdefault(normalize_occupation(key), completion)
+
+        self.keys = list(self.exact)
+        self.completions = [self.exact[key] for key in self.keys]
+
+        self.gram_ids: Dict[str, int] = {}
+        gram_id = self.gram_ids.setdefault
+        key_grams = [[gram_id(gram, len(self.gram_ids)) for gram in _char_ngrams(key, n)] for key in self.keys]
+        self.gram_counts = np.fromiter(map(len, key_grams), dtype=np.int32, count=len(key_grams))
+        self.key_grams = np.fromiter(itertools.chain.from_iterable(key_grams), dtype=np.int32,
+                                     count=int(self.gram_counts.sum()))
+        self.key_ptr = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        np.cumsum(self.gram_counts, out=self.key_ptr[1:])
+
+        # Invert to postings; the stable sort keeps each list in key order
+        owners = np.repeat(np.arange(len(self.keys), dtype=np.intp), self.gram_counts)
+        self.postings = owners[np.argsort(self.key_grams, kind="stable")]
+        self.doc_freq = np.bincount(self.key_grams, minlength=len(self.gram_ids))
+        self.posting_ptr = np.zeros(len(self.gram_ids) + 1, dtype=np.int64)
+        np.cumsum(self.doc_freq, out=self.posting_ptr[1:])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _shared_counts(self, candidates: np.ndarray, query_ids: np.ndarray) -> np.ndarray:
+        # Gather every candidate's n-gram ids and count those in the query
+        lengths = self.gram_counts[candidates].astype(np.int64)
+        offsets = np.zeros(len(candidates), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        flat = np.repeat(self.key_ptr[candidates] - offsets, lengths) + np.arange(int(lengths.sum()))
+        in_query = np.zeros(len(self.gram_ids), dtype=np.int32)
+        in_query[query_ids] = 1
+        return np.add.reduceat(in_query[self.key_grams[flat]], offsets)
+
+    def lookup(self, text: str, min_similarity: float = 0.0) -> Tuple[Optional[str], float]:
+        """
+        Best dictionary completion for `text` and its similarity in [0, 1].
+        Returns (None, 0.0) when no key shares an n-gram with the query.
+        With a min_similarity, keys too short or too long to reach it are
+        never scored.
+        """
+        query = normalize_occupation(text)
+        if query in self.exact:
+            return self.exact[query], 1.0
+
+        grams = _char_ngrams(query, self.n)
+        query_ids = np.array([self.gram_ids[gram] for gram in grams if gram in self.gram_ids], dtype=np.intp)
+        if not len(query_ids):
+            return None, 0.0
+        query_count = len(grams)
+
+        # Rarest first, as many as fit in the postings budget (at least one)
+        query_ids = query_ids[np.argsort(self.doc_freq[query_ids], kind="stable")]
+        counted = max(1, int(np.count_nonzero(np.cumsum(self.doc_freq[query_ids]) <= self.max_postings)))
+        hits = np.concatenate([self.postings[self.posting_ptr[g]:self.posting_ptr[g + 1]]
+                               for g in query_ids[:counted].tolist()])
+        if min_similarity > 0:
+            # Dice = 2 * shared / (query_count + key_count) >= t needs a key
+            # of between t / (2 - t) and (2 - t) / t times the query's size
+            t = min(min_similarity, 1.0)
+            sizes = self.gram_counts[hits]
+            hits = hits[(sizes >= t * query_count / (2 - t) - 1e-9) & (sizes <= (2 - t) * query_count / t + 1e-9)]
+            if not len(hits):
+                return None, 0.0
+        counts = np.bincount(hits, minlength=len(self.keys))
+
+        if counted == len(query_ids):
+            # Every query n-gram was counted, so counts are the shared sizes
+            dice = 2.0 * counts[hits] / (query_count + self.gram_counts[hits])
+            best = int(hits[dice == dice.max()].min())
+            return self.completions[best], float(dice.max())
+
+        # A key is hit once per counted n-gram it shares, so the histogram of
+        # counts over the hits, divided by the count, is the number of keys
+        # per count; keep the fewest top counts covering max_candidates keys
+        hit_counts = counts[hits]
+        per_count = np.bincount(hit_counts) // np.maximum(np.arange(hit_counts.max() + 1), 1)
+        covered = np.cumsum(per_count[::-1])
+        need = len(per_count) - 1 - int(np.searchsorted(covered, min(self.max_candidates, covered[-1])))
+        need = max(need, 1)
+        candidates = np.flatnonzero(counts >= need)
+        if len(candidates) > self.max_candidates:
+            # Ties at the threshold are taken in key order
+            above = counts[candidates] > need
+            candidates = np.sort(np.concatenate([
+                candidates[above], candidates[~above][:self.max_candidates - int(above.sum())]
+            ]))
+        shared = self._shared_counts(candidates, query_ids)
+        dice = 2.0 * shared / (query_count + self.gram_counts[candidates])
+        best = int(np.argmax(dice))
+        return self.completions[candidates[best]], float(dice[best])
+
+
+def build_fuzzy_index(pre_match_dict: Mapping[str, str]) -> FuzzyIndex:
+    """
+    Builds the fuzzy-match index from the output of load_pre_match_dict.
+    """
+    return FuzzyIndex(pre_match_dict)
+
+
+@metrics.instrument("fuzzy_pre_match")
+def fuzzy_pre_match_occupation(
+    df: pd.DataFrame,
+    occupation_column: str,
+    fuzzy_index: FuzzyIndex,
+    min_similarity: float = DEFAULT_MIN_SIMILARITY,
+    output_col: str = "final_output",
+    method_col: str = "method",
+    score_col: str = "match_score"
+) -> pd.DataFrame:
+    """
+    Second pre-match tier, run after pre_match_occupation. For rows that are
+    still unmatched, looks up the normalized occupation in the fuzzy index and,
+    if the best entry scores at least min_similarity, sets:
+        final_output = matched 'completion'
+        method = 'fuzzy_match'
+        match_score = similarity
+    Exact pre-matches get a score of 1.0; everything else stays NaN.
+
+    Args:
+        df (pd.DataFrame): Output of pre_match_occupation.
+        occupation_column (str): Name of the column with occupation data.
+        fuzzy_index (FuzzyIndex): Index built with build_fuzzy_index.
+        min_similarity (float, optional): Minimum similarity for a fuzzy match.
+        output_col (str, optional): Name of the column with the final classification.
+        method_col (str, optional): Name of the column with the method label.
+        score_col (str, optional): Name of the new column for the match score.
+
+    Returns:
+        pd.DataFrame: The DataFrame with unmatched rows filled where possible
+        and the score column added.
+    """
+    scores = np.where(df[method_col] == "pre_match", 1.0, np.nan)
+
+    unmatched = (df[output_col].isna() & df[occupation_column].notna()).to_numpy()
+    if unmatched.any():
+        # Each distinct unmatched occupation is looked up once
+        codes, uniques = pd.factorize(df[occupation_column].to_numpy()[unmatched])
+        results = [fuzzy_index.lookup(occ_value, min_similarity) for occ_value in uniques]
+        unique_scores = np.array([score for _, score in results])
+        accepted = unique_scores >= min_similarity
+
+        row_accepted = accepted[codes]
+        metrics.inc("fuzzy_match_rows", len(codes))
+        metrics.inc("fuzzy_match_hits", int(np.count_nonzero(row_accepted)))
+        if row_accepted.any():
+            # Positions, not index labels, so any index (duplicated, non-default) works
+            rows = np.flatnonzero(unmatched)[row_accepted]
+            unique_completions = np.array([completion for completion, _ in results], dtype=object)
+            final_output = df[output_col].to_numpy(dtype=object, copy=True)
+            method = df[method_col].to_numpy(dtype=object, copy=True)
+            final_output[rows] = unique_completions[codes[row_accepted]]
+            method[rows] = "fuzzy_match"
+            df[output_col] = final_output
+            df[method_col] = method
+            scores[rows] = unique_scores[codes[row_accepted]]
 
+    df[score_col] = scores
     return df
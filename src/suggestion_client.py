@@ -0,0 +1,144 @@
+"""
+Thin client for the warm suggestion server (suggestion_server.py).
+
+Only uses the standard library, so tools that talk to the server start
+without importing torch or sentence_transformers.
+"""
+import hashlib
+import json
+import os
+import urllib.error
+import urllib.request
+from typing import Iterator, List, Optional, Tuple
+
+import metrics
+
+DEFAULT_URL = os.environ.get("OCC_SUGGEST_URL", "http://127.0.0.1:8765")
+# Titles sent per request by suggest_batch
+DEFAULT_REQUEST_SIZE = 1024
+
+
+def _file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    # embedding_index.file_sha256, without importing numpy
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SuggestionClient:
+    """
+    Client for a running suggestion server, e.g.
+
+        client = SuggestionClient()
+        if client.serves("data/finetune.jsonl", "all-MiniLM-L6-v2"):
+            labels = client.suggest("registered nurse", k=5)
+
+    Calls raise OSError (e.g. urllib.error.URLError) when the server can't be
+    reached and RuntimeError when it answers with an error.
+    """
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 30.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        # The server is local; never route requests through an HTTP(S)_PROXY
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def _request(self, path: str, payload: Optional[dict] = None, timeout: Optional[float] = None) -> dict:
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(
+            self.url + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with self._opener.open(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            # The server puts the reason in a JSON body
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise RuntimeError(f"Suggestion server error ({e.code}): {message}") from None
+
+    def health(self) -> dict:
+        """
+        Model name, label count and source file of the running server.
+        """
+        return self._request("/health")
+
+    def is_available(self, timeout: float = 0.5) -> bool:
+        try:
+            self._request("/health", timeout=timeout)
+        except (OSError, RuntimeError, ValueError):
+            return False
+        return True
+
+    def serves(self, jsonl_path: str, model_name: str, timeout: float = 0.5) -> bool:
+        """
+        Whether a server is running with `model_name` and a finetune.jsonl
+        with the same content as jsonl_path, i.e. whether its suggestions are
+        the ones a locally loaded model would give.
+        """
+        try:
+            health = self._request("/health", timeout=timeout)
+            return health.get("model") == model_name and health.get("jsonl_sha256") == _file_sha256(jsonl_path)
+        except (OSError, RuntimeError, ValueError):
+            return False
+
+    def serves_examples(self, jsonl_path: str, model_name: str, timeout: float = 0.5) -> bool:
+        """
+        Whether the server holds the labeled examples of jsonl_path (started
+        with --examples) for `model_name`, so example_votes, add_example and
+        remove_example can stand in for a local example_index.ExampleIndex.
+        """
+        try:
+            health = self._request("/health", timeout=timeout)
+            return health.get("model") == model_name and health.get("examples_sha256") == _file_sha256(jsonl_path)
+        except (OSError, RuntimeError, ValueError):
+            return False
+
+    def example_votes(self, title: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        ExampleIndex.suggest for one title: [(label, share of the vote), ...].
+        """
+        response = self._request("/examples/vote", {"title": title, "k": k})
+        return [(label, share) for label, share in response["votes"]]
+
+    def add_example(self, prompt_occupation: str, completion: str) -> None:
+        self._request("/examples/add", {"prompt_occupation": prompt_occupation, "completion": completion})
+
+    def remove_example(self, prompt_occupation: str, completion: str) -> bool:
+        return self._request("/examples/remove",
+                             {"prompt_occupation": prompt_occupation, "completion": completion})["removed"]
+
+    def suggest_scored(self, titles: List[str], k: int = 5) -> List[Tuple[str, List[Tuple[str, float]]]]:
+        """
+        One request: [(title, [(label, score), ...]), ...] in input order, best first.
+        """
+        with metrics.timer("suggest_remote"):
+            response = self._request("/suggest", {"titles": list(titles), "k": k})
+        metrics.inc("suggest_remote_titles", len(titles))
+        return [
+            (result["title"], [(label, score) for label, score in result["candidates"]])
+            for result in response["results"]
+        ]
+
+    def suggest(self, title: str, k: int = 5) -> List[str]:
+        """
+        Top k labels for one title, best first.
+        """
+        return [label for label, _ in self.suggest_scored([title], k)[0][1]]
+
+    def suggest_batch(
+        self,
+        titles: List[str],
+        k: int = 5,
+        request_size: int = DEFAULT_REQUEST_SIZE
+    ) -> Iterator[Tuple[str, List[Tuple[str, float]]]]:
+        """
+        Same output as batch_suggest.suggest_completions_batch, computed by the
+        server `request_size` titles per request.
+        """
+        for start in range(0, len(titles), request_size):
+            yield from self.suggest_scored(titles[start:start + request_size], k)
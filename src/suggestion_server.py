@@ -0,0 +1,210 @@
+"""
+Local suggestion server: keeps the SentenceTransformer model and the
+completion embedding index warm in one process and answers suggestion
+requests over localhost HTTP, so the Tkinter tool, the Streamlit app and
+batch scripts can use suggestion_client.SuggestionClient instead of loading
+torch themselves.
+
+    python suggestion_server.py --dict data/finetune.jsonl [--examples data/prematch.jsonl] [--port 8765]
+
+Endpoints (JSON in and out):
+    GET  /health   -> {"model": ..., "labels": ..., "jsonl_sha256": ..., "precision": ...,
+                       "query_cache": {...}, ...}
+    POST /suggest  {"titles": [...], "k": 5}
+                   -> {"results": [{"title": ..., "candidates": [[label, score], ...]}]}
+
+With --examples, the server also holds the example_index.ExampleIndex of
+that file, so clients can vote with and record labeled examples without a
+model of their own:
+    POST /examples/vote    {"title": ..., "k": 5} -> {"votes": [[label, share], ...]}
+    POST /examples/add     {"prompt_occupation": ..., "completion": ...} -> {"examples": ...}
+    POST /examples/remove  {"prompt_occupation": ..., "completion": ...} -> {"removed": true}
+"""
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+import metrics
+from batch_suggest import MODEL_NAME, suggest_completions_batch
+from embedding_index import PRECISIONS, CompletionIndex, QueryEmbeddingCache, file_sha256
+from example_index import ExampleIndex
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_K = 100
+
+
+class SuggestionService:
+    """
+    The warm model plus its completion index and a query-embedding cache,
+    and optionally the labeled-example index of `examples_path`. The
+    completion index is reloaded (and rebuilt if needed) when finetune.jsonl
+    changes on disk; encoding is serialized with a lock, as the model is
+    shared by all request threads.
+    """
+
+    def __init__(
+        self,
+        jsonl_path: str,
+        model,
+        model_name: str = MODEL_NAME,
+        precision: str = "float32",
+        examples_path: Optional[str] = None
+    ):
+        self.jsonl_path = jsonl_path
+        self.model = model
+        self.model_name = model_name
+        self.precision = precision
+        self.query_cache = QueryEmbeddingCache(model)
+        self._lock = threading.Lock()
+        self._mtime = os.path.getmtime(jsonl_path)
+        # (mtime, digest) of the finetune.jsonl the next suggest call will serve
+        self._digest = (self._mtime, file_sha256(jsonl_path))
+        self.index = CompletionIndex.load_or_build(jsonl_path, model, model_name, precision=precision)
+        self.examples_path = examples_path
+        self.examples = ExampleIndex.open(examples_path, model, model_name) if examples_path else None
+        # Annotations go to the cache directory, so the file itself doesn't change
+        self._examples_sha256 = file_sha256(examples_path) if examples_path else None
+
+    def _refresh_index(self) -> None:
+        mtime = os.path.getmtime(self.jsonl_path)
+        if mtime != self._mtime:
+            self.index = CompletionIndex.load_or_build(
+                self.jsonl_path, self.model, self.model_name, precision=self.precision
+            )
+            self._mtime = mtime
+
+    def jsonl_sha256(self) -> str:
+        # Same mtime check as _refresh_index, without waiting for the lock
+        mtime = os.path.getmtime(self.jsonl_path)
+        if mtime != self._digest[0]:
+            self._digest = (mtime, file_sha256(self.jsonl_path))
+        return self._digest[1]
+
+    def health(self) -> dict:
+        return {"model": self.model_name, "labels": len(self.index), "jsonl_path": self.jsonl_path,
+                "jsonl_sha256": self.jsonl_sha256(),
+                "precision": self.index.precision, "index_bytes": self.index.nbytes,
+                "query_cache": self.query_cache.stats(),
+                "examples_path": self.examples_path, "examples_sha256": self._examples_sha256,
+                "examples": len(self.examples) if self.examples is not None else None}
+
+    def suggest(self, titles: List[str], k: int) -> List[Tuple[str, List[Tuple[str, float]]]]:
+        with self._lock:
+            self._refresh_index()
+            return list(suggest_completions_batch(titles, self.index, self.model, k,
+                                                  query_cache=self.query_cache))
+
+    def vote(self, title: str, k: int) -> List[Tuple[str, float]]:
+        with self._lock:
+            return self.examples.suggest(self.query_cache.encode(title), k)
+
+    def add_example(self, prompt_occupation: str, completion: str) -> int:
+        with self._lock:
+            self.examples.add(prompt_occupation, completion)
+        return len(self.examples)
+
+    def remove_example(self, prompt_occupation: str, completion: str) -> bool:
+        return self.examples.remove(prompt_occupation, completion)
+
+
+class SuggestionHandler(BaseHTTPRequestHandler):
+    service: SuggestionService = None
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.service.health())
+        elif self.path == "/metrics":
+            self._send_json(200, metrics.snapshot())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/suggest", "/examples/vote", "/examples/add", "/examples/remove"):
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        if self.path.startswith("/examples/") and self.service.examples is None:
+            self._send_json(404, {"error": "No labeled examples loaded (start the server with --examples)"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path in ("/examples/add", "/examples/remove"):
+                example = (str(payload["prompt_occupation"]), str(payload["completion"]))
+            else:
+                titles = [str(payload["title"])] if self.path == "/examples/vote" \
+                    else [str(t) for t in payload["titles"]]
+                k = int(payload.get("k", 5))
+                if not 1 <= k <= MAX_K:
+                    raise ValueError(f"k must be between 1 and {MAX_K}")
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+            return
+
+        if self.path == "/examples/vote":
+            votes = self.service.vote(titles[0], k)
+            self._send_json(200, {"votes": [[label, round(share, 6)] for label, share in votes]})
+        elif self.path == "/examples/add":
+            self._send_json(200, {"examples": self.service.add_example(*example)})
+        elif self.path == "/examples/remove":
+            self._send_json(200, {"removed": self.service.remove_example(*example)})
+        else:
+            results = self.service.suggest(titles, k)
+            self._send_json(200, {"results": [
+                {"title": title, "candidates": [[label, round(score, 6)] for label, score in candidates]}
+                for title, candidates in results
+            ]})
+
+    def log_message(self, format, *args):
+        # Per-request access logs would drown the console; use /metrics instead
+        pass
+
+
+def serve(service: SuggestionService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """
+    Creates (but does not start) an HTTP server answering with `service`;
+    call serve_forever() on the result.
+    """
+    handler = type("BoundSuggestionHandler", (SuggestionHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve completion suggestions from a warm model.")
+    parser.add_argument("--dict", dest="jsonl_path", required=True, help="Path to finetune.jsonl.")
+    parser.add_argument("--model", default=MODEL_NAME, help=f"SentenceTransformer model (default: {MODEL_NAME}).")
+    parser.add_argument("--examples", dest="examples_path",
+                        help="Labeled examples (e.g. data/prematch.jsonl) to vote with and record mappings in.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32",
+                        help="Storage precision of the label embeddings (default: float32).")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Interface to bind (default: {DEFAULT_HOST}).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT}).")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+
+    args = parse_args()
+    metrics.enable()
+    print("Loading sentence transformer model...")
+    service = SuggestionService(args.jsonl_path, SentenceTransformer(args.model), args.model, args.precision,
+                                examples_path=args.examples_path)
+    server = serve(service, args.host, args.port)
+    print(f"Serving {len(service.index)} labels on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
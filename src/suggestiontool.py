@@ -1,41 +1,77 @@
 import tkinter as tk
 from tkinter import simpledialog, filedialog, messagebox
 import json
-import numpy as np
-from sentence_transformers import SentenceTransformer, util  # For semantic similarity
+
+import metrics
+from embedding_index import CompletionIndex, QueryEmbeddingCache, encode_normalized, top_k_indices
+from finetune_data import load_finetune_data
+from suggestion_client import SuggestionClient
+
+MODEL_NAME = "all-MiniLM-L6-v2"  # Lightweight and fast for sentence embeddings
 
 # Load the unique completion values from finetune.jsonl
 def load_finetune_completions(jsonl_path):
-    completions = set()
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            entry = json.loads(line.strip())
-            completions.add(entry["completion"])
-    return sorted(completions)  # Return a sorted list of unique completions
+    return list(load_finetune_data(jsonl_path).completions)  # Sorted list of unique completions
 
 
 # Semantic similarity-based suggestion
-def suggest_completions_semantically(profession, completion_list, model, num_suggestions=5):
+@metrics.instrument("suggest")
+def suggest_completions_semantically(profession, completion_list, model, num_suggestions=5, index=None, query_cache=None):
     """
     Suggest completions for the given profession using semantic similarity.
+    If a CompletionIndex is given, the label embeddings come from it and only
+    the profession is encoded (or taken from `query_cache`, a QueryEmbeddingCache);
+    otherwise every label is encoded per call.
     """
-    # Generate embeddings for the input profession and all completion values
-    profession_embedding = model.encode(profession, convert_to_tensor=True)
-    completion_embeddings = model.encode(completion_list, convert_to_tensor=True)
+    if index is not None:
+        # One query encoding plus one matrix-vector product
+        completion_list = index.labels
+        if query_cache is not None:
+            query = query_cache.encode(profession)
+        else:
+            query = encode_normalized(model, profession)
+        similarities = index.scores(query)
+    else:
+        from sentence_transformers import util  # For semantic similarity
+
+        # Generate embeddings for the input profession and all completion values
+        profession_embedding = model.encode(profession, convert_to_tensor=True)
+        completion_embeddings = model.encode(completion_list, convert_to_tensor=True)
 
-    # Compute cosine similarity
-    similarities = util.cos_sim(profession_embedding, completion_embeddings).squeeze(0).cpu().numpy()
+        # Compute cosine similarity
+        similarities = util.cos_sim(profession_embedding, completion_embeddings).squeeze(0).cpu().numpy()
 
-    # Rank the completions by similarity
-    top_indices = np.argsort(similarities)[::-1][:num_suggestions]
+    # Pick the top matches by similarity (partial selection, not a full sort)
+    top_indices = top_k_indices(similarities, num_suggestions)
     suggestions = [completion_list[i] for i in top_indices]
     return suggestions
 
 
+def load_local_suggester(jsonl_path, model_name=MODEL_NAME):
+    """
+    Load the sentence transformer model, its completion embedding index and a
+    query cache, for suggesting without the suggestion server.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    print("Loading sentence transformer model...")
+    model = SentenceTransformer(model_name)
+    print("Model loaded successfully.")
+
+    # Load the completion embeddings from disk, embedding the labels only if
+    # finetune.jsonl or the model changed since the index was last built
+    print("Loading completion embedding index...")
+    index = CompletionIndex.load_or_build(jsonl_path, model, model_name)
+    print(f"Embedding index ready ({len(index)} labels).")
+    return model, index, QueryEmbeddingCache(model)
+
+
 # Interface for mapping professions
-def map_professions_semantically(completion_list, model):
+def map_professions_semantically(completion_list, model, index=None, client=None, query_cache=None, load_local=None):
     """
     A GUI for mapping professions to completions using semantic similarity. Outputs results to JSONL format.
+    With a SuggestionClient, suggestions come from the suggestion server and `model` may be None; if the
+    server fails, `load_local` (returning model, index, query_cache) is called once and used from then on.
     """
     # List to store the results
     results = []
@@ -84,12 +120,28 @@ def map_professions_semantically(completion_list, model):
 
     # Function to handle completion suggestions
     def suggest_values():
+        nonlocal client, model, index, query_cache
         profession = profession_input.get().strip()
         if not profession:
             messagebox.showerror("Error", "Please enter a profession to get suggestions.")
             return
 
-        suggestions = suggest_completions_semantically(profession, completion_list, model)
+        suggestions = None
+        if client is not None:
+            try:
+                suggestions = client.suggest(profession)
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"Suggestion server failed ({e}); using the local model from now on.")
+                client = None
+                if model is None:
+                    if load_local is None:
+                        messagebox.showerror("Error", f"Suggestion server failed: {e}")
+                        return
+                    model, index, query_cache = load_local()
+        if suggestions is None:
+            suggestions = suggest_completions_semantically(
+                profession, completion_list, model, index=index, query_cache=query_cache
+            )
         if suggestions:
             completion_var.set(suggestions[0])  # Set the first suggestion as default
             suggestion_menu["menu"].delete(0, "end")  # Clear the dropdown menu
@@ -142,10 +194,16 @@ if __name__ == "__main__":
     completions = load_finetune_completions(finetune_path)
     print(f"Loaded {len(completions)} unique completions from {finetune_path}.")
 
-    # Load a pre-trained sentence transformer model
-    print("Loading sentence transformer model...")
-    model = SentenceTransformer("all-MiniLM-L6-v2")  # Lightweight and fast for sentence embeddings
-    print("Model loaded successfully.")
+    # Use a running suggestion server if it has the same model and labels
+    # (no model load here unless it fails)
+    client = SuggestionClient()
+    if client.serves(finetune_path, MODEL_NAME):
+        print(f"Using suggestion server at {client.url}.")
+        map_professions_semantically(
+            completions, None, client=client, load_local=lambda: load_local_suggester(finetune_path)
+        )
+        exit()
 
     # Launch the profession-to-completion mapper with semantic matching
-    map_professions_semantically(completions, model)
+    model, index, query_cache = load_local_suggester(finetune_path)
+    map_professions_semantically(completions, model, index, query_cache=query_cache)
@@ -1,47 +1,135 @@
 import streamlit as st
 import json
-import numpy as np
-from sentence_transformers import SentenceTransformer, util
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+import metrics
+from embedding_index import CompletionIndex, QueryEmbeddingCache, encode_normalized, top_k_indices
+from example_index import ExampleIndex
+from finetune_data import load_finetune_data
+from suggestion_client import SuggestionClient
 
 # Constants
 FINETUNE_JSONL_PATH = "C:\\Users\\spatt\\Desktop\\finetune_streamlit\\data\\finetune.jsonl"
+# Labeled examples whose neighbours vote for suggestions; mappings added in the app are appended to them
+EXAMPLES_JSONL_PATH = str(Path(__file__).parent / "data" / "prematch.jsonl")
 MODEL_NAME = "all-MiniLM-L6-v2"
+# "float32", "float16" or "int8" storage for the completion embeddings
+EMBEDDING_PRECISION = "float32"
+# How long a suggestion server probe (found or not) is reused before probing again
+SERVER_PROBE_TTL_SECONDS = 30
 
 @st.cache_data
 def load_finetune_completions(jsonl_path):
     """
     Load unique completions from finetune.jsonl and return as a sorted list.
     """
-    completions = set()
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            entry = json.loads(line.strip())
-            completions.add(entry["completion"])
-    return sorted(completions)
+    return list(load_finetune_data(jsonl_path).completions)
 
 @st.cache_resource
 def load_model(model_name):
     """
     Load and cache the SentenceTransformer model.
     """
+    from sentence_transformers import SentenceTransformer
+
     return SentenceTransformer(model_name)
 
-def suggest_completions_semantically(profession, completion_list, model, num_suggestions=10):
+@st.cache_resource(ttl=SERVER_PROBE_TTL_SECONDS)
+def get_suggestion_client():
+    """
+    A client for the local suggestion server if one is running with the same
+    model and finetune.jsonl, else None (the app then loads the model itself).
+    The result expires after SERVER_PROBE_TTL_SECONDS, so a server started
+    later is picked up.
+    """
+    client = SuggestionClient()
+    return client if client.serves(FINETUNE_JSONL_PATH, MODEL_NAME) else None
+
+@st.cache_resource
+def load_completion_index(jsonl_path, model_name, mtime, precision="float32"):
+    """
+    Load (or build once and save) the on-disk completion embedding index.
+    `mtime` is only part of the cache key, so an edited finetune.jsonl is picked up.
+    """
+    return CompletionIndex.load_or_build(jsonl_path, load_model(model_name), model_name, precision=precision)
+
+@st.cache_resource
+def load_example_index(jsonl_path, model_name, mtime):
+    """
+    Load the nearest-neighbour index over labeled examples plus the mappings
+    added in earlier sessions. Updated in place by Add Mapping/Delete.
+    """
+    return ExampleIndex.open(jsonl_path, load_model(model_name), model_name)
+
+@st.cache_resource
+def get_query_cache(model_name):
+    """
+    Query-embedding LRU cache shared by all sessions, so repeated professions skip the model.
+    """
+    return QueryEmbeddingCache(load_model(model_name))
+
+@metrics.instrument("suggest")
+def suggest_completions_semantically(profession, completion_list, model, num_suggestions=10, index=None, query_cache=None):
     """
     Suggest completions for the given profession using semantic similarity.
+    If a CompletionIndex is given, the label embeddings come from it and only
+    the profession is encoded (or taken from `query_cache`, a QueryEmbeddingCache);
+    otherwise every label is encoded per call.
     """
-    # Generate embeddings for the input profession and all completion values
-    profession_embedding = model.encode(profession, convert_to_tensor=True)
-    completion_embeddings = model.encode(completion_list, convert_to_tensor=True)
+    if index is not None:
+        # One query encoding plus one matrix-vector product
+        completion_list = index.labels
+        if query_cache is not None:
+            query = query_cache.encode(profession)
+        else:
+            query = encode_normalized(model, profession)
+        similarities = index.scores(query)
+    else:
+        from sentence_transformers import util
+
+        # Generate embeddings for the input profession and all completion values
+        profession_embedding = model.encode(profession, convert_to_tensor=True)
+        completion_embeddings = model.encode(completion_list, convert_to_tensor=True)
 
-    # Compute cosine similarity
-    similarities = util.cos_sim(profession_embedding, completion_embeddings).squeeze(0).cpu().numpy()
+        # Compute cosine similarity
+        similarities = util.cos_sim(profession_embedding, completion_embeddings).squeeze(0).cpu().numpy()
 
-    # Rank the completions by similarity
-    top_indices = np.argsort(similarities)[::-1][:num_suggestions]
+    # Pick the top matches by similarity (partial selection, not a full sort)
+    top_indices = top_k_indices(similarities, num_suggestions)
     suggestions = [completion_list[i] for i in top_indices]
     return suggestions
 
+def load_local_suggesters():
+    """
+    The model and completion index for suggesting without the suggestion server.
+    """
+    with st.spinner("Loading model..."):
+        model = load_model(MODEL_NAME)
+    with st.spinner("Loading completion embeddings..."):
+        index = load_completion_index(
+            FINETUNE_JSONL_PATH, MODEL_NAME, os.path.getmtime(FINETUNE_JSONL_PATH), EMBEDDING_PRECISION
+        )
+    return model, index
+
+def load_local_examples():
+    """
+    The labeled-example index, for when the suggestion server doesn't hold it.
+    """
+    with st.spinner("Loading labeled examples..."):
+        return load_example_index(EXAMPLES_JSONL_PATH, MODEL_NAME, os.path.getmtime(EXAMPLES_JSONL_PATH))
+
+def example_votes(profession, num_suggestions, client, example_index):
+    """
+    Labels voted for by the labeled examples nearest to `profession`, from
+    the local example index if one is loaded, else from the server.
+    """
+    if example_index is not None:
+        return example_index.suggest(get_query_cache(MODEL_NAME).encode(profession), num_suggestions)
+    return client.example_votes(profession, num_suggestions)
+
 def main():
     # Load model and finetune data
     st.title("Profession to Completion Mapper (Semantic Matching)")
@@ -67,13 +155,24 @@ def main():
     if "selected_completion" not in st.session_state:
         st.session_state.selected_completion = None
 
-    # Load model and completions
-    with st.spinner("Loading model..."):
-        model = load_model(MODEL_NAME)
+    # Load model and completions, unless a suggestion server already holds
+    # them; the labeled examples too, unless the server holds the same ones
+    client = get_suggestion_client()
+    model = index = example_index = None
+    if client is None:
+        model, index = load_local_suggesters()
+    if client is None or not client.serves_examples(EXAMPLES_JSONL_PATH, MODEL_NAME):
+        example_index = load_local_examples()
 
     with st.spinner("Loading finetune.jsonl..."):
         completion_list = load_finetune_completions(FINETUNE_JSONL_PATH)
 
+    metrics.render_diagnostics(st, lambda: {
+        "suggestion_server": client.url if client else None,
+        "query_cache": get_query_cache(MODEL_NAME).stats() if client is None else None,
+        "labeled_examples": len(example_index) if example_index is not None else "served",
+    })
+
     # Input for number of suggestions
     num_suggestions = st.number_input(
         "Number of suggestions:",
@@ -92,7 +191,30 @@ def main():
             st.error("Please enter a profession to get suggestions.")
         else:
             with st.spinner("Finding suggestions..."):
-                suggestions = suggest_completions_semantically(profession, completion_list, model, int(num_suggestions))
+                suggestions = None
+                if client is not None:
+                    try:
+                        suggestions = client.suggest(profession, int(num_suggestions))
+                        voted = example_votes(profession, int(num_suggestions), client, example_index)
+                    except (OSError, RuntimeError, ValueError) as e:
+                        st.warning(f"Suggestion server failed ({e}); using the local model.")
+                        get_suggestion_client.clear()
+                        client = None
+                        suggestions = None
+                        model, index = load_local_suggesters()
+                        if example_index is None:
+                            example_index = load_local_examples()
+                if suggestions is None:
+                    voted = example_votes(profession, int(num_suggestions), client, example_index)
+                    suggestions = suggest_completions_semantically(
+                        profession, completion_list, model, int(num_suggestions), index=index,
+                        query_cache=get_query_cache(MODEL_NAME)
+                    )
+                # Labels voted for by similar labeled examples come first,
+                # then the closest label texts fill the remaining slots
+                suggestions = list(dict.fromkeys(
+                    [label for label, _ in voted] + suggestions
+                ))[:int(num_suggestions)]
             st.session_state.suggestions = suggestions  # Store suggestions in session state
             st.session_state.selected_completion = suggestions[0] if suggestions else None
 
@@ -114,6 +236,13 @@ def main():
             st.session_state.mappings.append(
                 {"prompt_occupation": profession.strip(), "completion": st.session_state.selected_completion}
             )
+            if example_index is not None:
+                example_index.add(profession.strip(), st.session_state.selected_completion)
+            else:
+                try:
+                    client.add_example(profession.strip(), st.session_state.selected_completion)
+                except (OSError, RuntimeError, ValueError) as e:
+                    st.warning(f"Suggestion server failed ({e}); the example wasn't recorded.")
             st.success(f"Mapping added: {profession.strip()} -> {st.session_state.selected_completion}")
             st.session_state.suggestions = []  # Clear suggestions after adding
             st.session_state.selected_completion = None  # Reset selection
@@ -127,7 +256,14 @@ def main():
                 st.write(f"- **{mapping['prompt_occupation']}** → {mapping['completion']}")
             with col2:
                 if st.button("Delete", key=f"delete_{i}"):
-                    st.session_state.mappings.pop(i)  # Remove the mapping
+                    removed = st.session_state.mappings.pop(i)  # Remove the mapping
+                    if example_index is not None:
+                        example_index.remove(removed["prompt_occupation"], removed["completion"])
+                    else:
+                        try:
+                            client.remove_example(removed["prompt_occupation"], removed["completion"])
+                        except (OSError, RuntimeError, ValueError) as e:
+                            st.warning(f"Suggestion server failed ({e}); the example wasn't removed.")
                     st.experimental_rerun()  # Refresh the app to update the UI
     else:
         st.info("No mappings added yet.")
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules under src/ import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def artifact_dir(tmp_path_factory):
+    # Compiled finetune.jsonl artifacts go to a temp dir, not next to the fixtures
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("OCC_ARTIFACT_DIR", str(tmp_path_factory.mktemp("artifacts")))
+        yield
@@ -0,0 +1,116 @@
+from pathlib import Path
+
+import openai
+import pandas as pd
+import pytest
+
+import batch_classify
+from batch_classify import classify_dataframe, classify_file_resumable
+from classification import build_repair_index, load_decoder
+from classification_cache import ClassificationCache
+from classification_journal import ClassificationJournal
+
+FIXTURES = Path(__file__).parent / "fixtures" / "batch"
+
+
+@pytest.fixture
+def decoder_map():
+    return load_decoder(str(FIXTURES / "finetune.jsonl"))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "cache.db"))
+    # An exact label stored under an older finetune.jsonl, and an output
+    # that a previous run could only decode through the repair index
+    cache.put("Cashier", "cashiers", "Old label")
+    cache.put("Clerk", "Cashiers", "Cashiers")
+    return cache
+
+
+def no_api(**kwargs):
+    raise AssertionError("cached titles must not be sent")
+
+
+def test_classify_dataframe_redecodes_cache_hits(decoder_map, cache):
+    df = pd.DataFrame({"occupation": ["Cashier", "Clerk"]})
+
+    classify_dataframe(df, "occupation", decoder_map, cache=cache, create=no_api)
+
+    assert df["final_output"].tolist()[0] == "Cashiers"
+    # Repair is off here, so the repaired label from the cache is not reused
+    assert pd.isna(df["final_output"].tolist()[1])
+    assert df["raw_output"].tolist() == ["cashiers", "Cashiers"]
+
+
+def test_classify_dataframe_repairs_cache_hits(decoder_map, cache):
+    df = pd.DataFrame({"occupation": ["Clerk"]})
+
+    classify_dataframe(df, "occupation", decoder_map, cache=cache, create=no_api,
+                       repair_index=build_repair_index(decoder_map))
+
+    assert df["final_output"].tolist() == ["Cashiers"]
+    assert df["method"].tolist() == ["model_repaired"]
+
+
+def test_classify_file_resumable_redecodes_cache_hits(tmp_path, decoder_map, cache):
+    input_path = tmp_path / "input.csv"
+    pd.DataFrame({"occupation": ["Cashier", "Clerk"]}).to_csv(input_path, index=False)
+    output_path = tmp_path / "output.csv"
+
+    stats = classify_file_resumable(
+        str(input_path), str(output_path), "occupation", decoder_map, str(tmp_path / "journal.jsonl"),
+        create=no_api, cache=cache
+    )
+
+    assert stats["sent_titles"] == 0
+    df = pd.read_csv(output_path)
+    assert df["final_output"].tolist()[0] == "Cashiers"
+    assert pd.isna(df["final_output"].tolist()[1])
+
+
+def fake_create(**kwargs):
+    if "cash" not in kwargs["messages"][-1]["content"].lower():
+        raise openai.error.InvalidRequestError("Unknown title", None)
+    return {"choices": [{"message": {"content": "cashiers"}}]}
+
+
+def test_resume_reads_pending_titles_from_sidecar(tmp_path, decoder_map, monkeypatch):
+    input_path = tmp_path / "input.csv"
+    pd.DataFrame({"occupation": ["Cashier", "Night cashier", "Nurse", "cashier"]}).to_csv(input_path, index=False)
+    journal_path = str(tmp_path / "journal.jsonl")
+    run = lambda: classify_file_resumable(  # noqa: E731
+        str(input_path), str(tmp_path / "output.csv"), "occupation", decoder_map, journal_path, create=fake_create
+    )
+
+    assert run()["sent_titles"] == 3
+    assert (tmp_path / "journal.jsonl.pending").exists()
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("a resume must not rescan the input for pending titles")
+
+    monkeypatch.setattr(batch_classify, "read_pending_titles", no_scan)
+    stats = run()
+    assert (stats["resumed_titles"], stats["sent_titles"]) == (2, 1)
+    df = pd.read_csv(tmp_path / "output.csv")
+    assert df["final_output"].tolist()[:2] == ["Cashiers", "Cashiers"]
+
+    # A changed input invalidates the saved titles
+    pd.DataFrame({"occupation": ["Cashier", "Clerk"]}).to_csv(input_path, index=False)
+    with pytest.raises(AssertionError, match="rescan"):
+        run()
+
+
+def test_journal_cuts_only_a_torn_last_line(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    with ClassificationJournal(str(path)) as journal:
+        journal.append("cashier", "cashiers", "Cashiers")
+    good = path.read_bytes()
+    # A torn line longer than one read-back block
+    path.write_bytes(good + b'{"key": "' + b"x" * 200_000)
+
+    with ClassificationJournal(str(path)) as journal:
+        assert path.read_bytes() == good
+        offset = journal.append("nurse", "Error: timeout", None)
+        assert journal.index() == {"cashier": 0}
+        assert journal.get_many({"nurse": offset}) == {"nurse": ("Error: timeout", None)}
@@ -0,0 +1,192 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from batch_jobs import (
+    batch_custom_id,
+    build_batch_requests,
+    build_request_line,
+    ingest_batch_results,
+    parse_result_line,
+    write_request_shards,
+)
+from classification import build_repair_index, load_decoder
+from classification_cache import ClassificationCache
+
+FIXTURES = Path(__file__).parent / "fixtures" / "batch"
+RESULTS = [str(FIXTURES / "results-0.jsonl"), str(FIXTURES / "results-1.jsonl")]
+
+
+@pytest.fixture
+def decoder_map():
+    return load_decoder(str(FIXTURES / "finetune.jsonl"))
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def ingest(tmp_path, decoder_map, cache=None, result_paths=RESULTS):
+    output = tmp_path / "out.csv"
+    stats = ingest_batch_results(
+        str(FIXTURES / "input.csv"), result_paths, str(output), "occupation", decoder_map,
+        repair_index=build_repair_index(decoder_map), cache=cache, chunksize=3
+    )
+    return stats, pd.read_csv(output, dtype=str, keep_default_na=False).set_index("id")
+
+
+def test_build_dedups_pending_titles(tmp_path):
+    manifest = build_batch_requests(str(FIXTURES / "input.csv"), "occupation", str(tmp_path), chunksize=3)
+
+    # "software  dev" shares its request with "Software Dev"; the filled and
+    # empty rows need none
+    assert manifest["requests"] == 5
+    assert manifest["cached_titles_skipped"] == 0
+    assert [shard["requests"] for shard in manifest["shards"]] == [5]
+    assert read_lines(manifest["shards"][0]["path"]) == read_lines(FIXTURES / "requests.jsonl")
+    assert json.loads((tmp_path / "manifest.json").read_text()) == manifest
+
+
+def test_build_skips_cached_titles(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "cache.db"))
+    cache.put("clerk", "janitors_and_cleaners", "Janitors and cleaners")
+
+    manifest = build_batch_requests(str(FIXTURES / "input.csv"), "occupation", str(tmp_path / "out"),
+                                    cache=cache)
+
+    assert manifest["requests"] == 4
+    assert manifest["cached_titles_skipped"] == 1
+    custom_ids = {line["custom_id"] for line in read_lines(manifest["shards"][0]["path"])}
+    assert batch_custom_id("Clerk") not in custom_ids
+
+
+def test_shards_respect_request_limit(tmp_path):
+    titles = [f"title {i}" for i in range(7)]
+    shards = write_request_shards(titles, str(tmp_path), max_requests=3)
+
+    assert [shard["requests"] for shard in shards] == [3, 3, 1]
+    assert [Path(shard["path"]).name for shard in shards] == [
+        "requests-00000.jsonl", "requests-00001.jsonl", "requests-00002.jsonl"
+    ]
+    written = [line["custom_id"] for shard in shards for line in read_lines(shard["path"])]
+    assert written == [batch_custom_id(title) for title in titles]
+
+
+def test_shards_respect_byte_limit(tmp_path):
+    titles = [f"title {i}" for i in range(5)]
+    line_bytes = len((build_request_line(titles[0]) + "\n").encode("utf-8"))
+    shards = write_request_shards(titles, str(tmp_path), max_bytes=2 * line_bytes)
+
+    assert [shard["requests"] for shard in shards] == [2, 2, 1]
+    for shard in shards:
+        assert shard["bytes"] <= 2 * line_bytes
+        assert Path(shard["path"]).stat().st_size == shard["bytes"]
+
+
+def test_shards_reject_oversized_request(tmp_path):
+    with pytest.raises(ValueError):
+        write_request_shards(["title"], str(tmp_path), max_bytes=10)
+
+
+def test_parse_result_line_success():
+    line = json.dumps({"custom_id": "occ-1", "error": None, "response": {
+        "status_code": 200, "body": {"choices": [{"message": {"content": " cashiers \n"}}]}
+    }})
+    assert parse_result_line(line) == ("occ-1", "cashiers")
+
+
+def test_parse_result_line_error_object():
+    line = json.dumps({"custom_id": "occ-1", "response": None,
+                       "error": {"code": "server_error", "message": "The server had an error."}})
+    assert parse_result_line(line) == ("occ-1", "Error: The server had an error.")
+
+    line = json.dumps({"custom_id": "occ-1", "response": None, "error": {"code": "server_error"}})
+    assert parse_result_line(line) == ("occ-1", "Error: server_error")
+
+
+def test_parse_result_line_non_200():
+    line = json.dumps({"custom_id": "occ-1", "error": None, "response": {
+        "status_code": 429, "body": {"error": {"message": "Rate limit reached."}}
+    }})
+    assert parse_result_line(line) == ("occ-1", "Error: HTTP 429 Rate limit reached.")
+
+    line = json.dumps({"custom_id": "occ-1", "error": None, "response": {"status_code": 500, "body": {}}})
+    assert parse_result_line(line) == ("occ-1", "Error: HTTP 500")
+
+
+@pytest.mark.parametrize("body", [{}, {"choices": []}, {"choices": [{"message": {}}]},
+                                  {"choices": [{"message": {"content": None}}]}])
+def test_parse_result_line_missing_content(body):
+    line = json.dumps({"custom_id": "occ-1", "error": None, "response": {"status_code": 200, "body": body}})
+    assert parse_result_line(line) == ("occ-1", "Error: Result has no message content.")
+
+
+def test_ingest_joins_results(tmp_path, decoder_map):
+    stats, df = ingest(tmp_path, decoder_map)
+
+    assert stats == {"results": 7, "errors": 4, "rows": 8, "rows_filled": 4}
+    assert df.loc["1", "final_output"] == "Registered nurses"
+    assert df.loc["1", "method"] == "fine_tuned_model"
+    assert df.loc["2", "final_output"] == "Registered nurses"
+    # Pre-filled and empty rows are passed through untouched
+    assert (df.loc["6", "final_output"], df.loc["6", "method"], df.loc["6", "raw_output"]) == (
+        "Registered nurses", "", "")
+    assert df.loc["7", "raw_output"] == ""
+
+
+def test_ingest_repairs_near_miss_output(tmp_path, decoder_map):
+    _, df = ingest(tmp_path, decoder_map)
+
+    assert df.loc["3", "raw_output"] == "Cashiers"
+    assert df.loc["3", "final_output"] == "Cashiers"
+    assert df.loc["3", "method"] == "model_repaired"
+
+
+def test_ingest_later_success_supersedes_error(tmp_path, decoder_map):
+    _, df = ingest(tmp_path, decoder_map)
+    assert df.loc["4", "raw_output"] == "janitors_and_cleaners"
+    assert df.loc["4", "final_output"] == "Janitors and cleaners"
+
+    # The order of the result files doesn't matter
+    _, df = ingest(tmp_path, decoder_map, result_paths=RESULTS[::-1])
+    assert df.loc["4", "final_output"] == "Janitors and cleaners"
+
+
+def test_ingest_leaves_failed_rows_unfilled(tmp_path, decoder_map):
+    _, df = ingest(tmp_path, decoder_map)
+
+    assert df.loc["5", "raw_output"].startswith("Error: HTTP 429")
+    assert df.loc["5", "final_output"] == ""
+    assert df.loc["8", "raw_output"] == "Error: Result has no message content."
+    assert df.loc["8", "final_output"] == ""
+
+
+def test_ingest_cache_pass(tmp_path, decoder_map):
+    cache = ClassificationCache(str(tmp_path / "cache.db"))
+    # Barista was skipped by build because it was already cached
+    cache.put("Barista", "cashiers", "Cashiers")
+
+    stats, df = ingest(tmp_path, decoder_map, cache=cache)
+
+    assert stats["rows_filled"] == 5
+    assert df.loc["5", "final_output"] == "Cashiers"
+    assert df.loc["5", "raw_output"] == "cashiers"
+    cached = cache.get_many(["Software Dev", "Night Cashier", "Clerk", "Ghost Title"])
+    assert cached["software dev"] == ("registered_nurses", "Registered nurses")
+    assert cached["night cashier"] == ("Cashiers", "Cashiers")
+    assert cached["clerk"] == ("janitors_and_cleaners", "Janitors and cleaners")
+    # Errors are never cached
+    assert "ghost title" not in cached
+
+
+def test_ingest_redecodes_cached_results(tmp_path, decoder_map):
+    cache = ClassificationCache(str(tmp_path / "cache.db"))
+    # Stored by a run with another decoder; the raw output is what counts
+    cache.put("Barista", "cashiers", "Old label")
+
+    _, df = ingest(tmp_path, decoder_map, cache=cache)
+
+    assert df.loc["5", "final_output"] == "Cashiers"
@@ -0,0 +1,55 @@
+import time
+
+from classification_cache import ClassificationCache
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "cache.db"), max_entries=3)
+    for i in range(3):
+        cache.put(f"title {i}", f"raw {i}", None)
+        time.sleep(0.01)
+    cache.get("title 0")  # now the most recently used
+    time.sleep(0.01)
+
+    cache.put_many([("title 3", "raw 3", None), ("title 4", "raw 4", None)])
+
+    assert len(cache) == 3
+    assert set(cache.get_many([f"title {i}" for i in range(5)])) == {"title 0", "title 3", "title 4"}
+
+
+def test_replacing_a_title_does_not_count_as_new(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put("nurse", "raw 1", "Label 1")
+    cache.put("cashier", "raw", None)
+
+    cache.put_many([("Nurse", "raw 2", "Label 2"), ("nurse ", "raw 3", "Label 3")])
+
+    assert len(cache) == 2
+    assert cache.get("nurse") == ("raw 3", "Label 3")
+    assert cache.get("cashier") == ("raw", None)
+
+
+def test_size_is_read_on_open(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    cache = ClassificationCache(db_path)
+    cache.put_many([(f"title {i}", "raw", None) for i in range(5)])
+    cache.close()
+
+    cache = ClassificationCache(db_path, max_entries=4)
+    cache.put("title 5", "raw", None)
+
+    assert len(cache) == 4
+
+
+def test_put_and_stats_do_not_count_rows(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "cache.db"), max_entries=2)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    for i in range(5):
+        cache.put(f"title {i}", "raw", None)
+    assert len(cache) == 2
+    assert cache.stats()["size"] == 2
+
+    assert not [sql for sql in statements if "COUNT(" in sql.upper()]
+    cache._conn.set_trace_callback(None)
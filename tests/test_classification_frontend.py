@@ -0,0 +1,110 @@
+import threading
+import time
+
+import openai
+import pytest
+
+import batch_classify
+from classification_frontend import BUSY_ERROR, ClassificationFrontend
+
+
+def response(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(batch_classify.random, "uniform", lambda a, b: 0.0)
+
+
+def test_every_retry_takes_a_token(monkeypatch, no_backoff):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise openai.error.RateLimitError("Rate limit reached")
+        return response("cashiers")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    frontend = ClassificationFrontend(requests_per_second=1000.0, burst=3, queue_timeout=1.0)
+
+    assert frontend.classify("Cashier") == "cashiers"
+    assert len(calls) == 3
+    assert frontend.stats()["upstream_calls"] == 3
+
+
+def test_retries_stop_when_tokens_run_out(monkeypatch, no_backoff):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        raise openai.error.RateLimitError("Rate limit reached")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    # Two tokens and practically no refill: the third attempt must not go out
+    frontend = ClassificationFrontend(requests_per_second=0.001, burst=2, queue_timeout=0.0)
+
+    assert frontend.classify("Cashier") == BUSY_ERROR
+    assert len(calls) == 2
+    stats = frontend.stats()
+    assert (stats["upstream_calls"], stats["rejected"]) == (2, 1)
+
+
+def test_custom_classify_takes_one_token_per_call():
+    frontend = ClassificationFrontend(classify=lambda title: "cashiers", requests_per_second=0.001,
+                                      burst=1, queue_timeout=0.0, memo_ttl=0.0)
+
+    assert frontend.classify("Cashier") == "cashiers"
+    assert frontend.classify("Cashier") == BUSY_ERROR
+
+
+def test_identical_requests_share_one_call():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def classify(title):
+        calls.append(title)
+        started.set()
+        release.wait(5)
+        return "cashiers"
+
+    frontend = ClassificationFrontend(classify=classify, queue_timeout=5.0)
+    results = []
+    leader = threading.Thread(target=lambda: results.append(frontend.classify("Cashier")))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(frontend.classify("cashier ")))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ["cashiers", "cashiers"]
+    assert len(calls) == 1
+    assert frontend.stats()["coalesced"] == 1
+
+
+def test_follower_gives_up_after_queue_timeout():
+    started, release = threading.Event(), threading.Event()
+
+    def classify(title):
+        started.set()
+        release.wait(5)
+        return "cashiers"
+
+    frontend = ClassificationFrontend(classify=classify, queue_timeout=0.1)
+    leader = threading.Thread(target=frontend.classify, args=("Cashier",))
+    leader.start()
+    started.wait(5)
+    try:
+        start = time.monotonic()
+        assert frontend.classify("Cashier") == BUSY_ERROR
+        assert time.monotonic() - start < 2
+        assert frontend.stats()["rejected"] == 1
+    finally:
+        release.set()
+        leader.join(5)
+    # The leader's answer is still memoized for later requests
+    assert frontend.classify("Cashier") == "cashiers"
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from columnar_io import BatchWriter, iter_batches
+from main import run_headless_pre_match
+
+FINETUNE = Path(__file__).parent / "fixtures" / "batch" / "finetune.jsonl"
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".arrow"])
+def test_empty_input_writes_its_columns(tmp_path, suffix):
+    input_path = tmp_path / f"input{suffix}"
+    empty = pd.DataFrame({"id": pd.Series(dtype=str), "occupation": pd.Series(dtype=str)})
+    with BatchWriter(str(input_path)) as writer:
+        writer.write(empty)
+    assert [len(batch) for batch in iter_batches(str(input_path))] == [0]
+
+    output_path = tmp_path / f"output{suffix}"
+    stats = run_headless_pre_match(str(input_path), str(output_path), "occupation", str(FINETUNE))
+
+    assert stats["rows"] == 0
+    batches = list(iter_batches(str(output_path)))
+    assert list(batches[0].columns) == ["id", "occupation", "final_output", "method"]
+
+
+def test_writer_without_data_fails_loudly(tmp_path):
+    output_path = tmp_path / "output.csv"
+    with pytest.raises(ValueError, match="Nothing was written"):
+        with BatchWriter(str(output_path)):
+            pass
+    assert not output_path.exists()
+
+
+def test_empty_first_batch_writes_the_header_once(tmp_path):
+    output_path = tmp_path / "output.csv"
+    with BatchWriter(str(output_path)) as writer:
+        writer.write(pd.DataFrame({"a": pd.Series(dtype=str)}))
+        writer.write(pd.DataFrame({"a": ["x", "y"]}))
+    assert output_path.read_text(encoding="utf-8").splitlines() == ["a", "x", "y"]
@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+import compact_dict
+from compact_dict import CompactDict, compact_dict_path, load_compact_dict, write_compact_dict
+
+FINETUNE = Path(__file__).parent / "fixtures" / "batch" / "finetune.jsonl"
+
+
+def test_lone_surrogates_are_misses(tmp_path):
+    path = tmp_path / "aliases.dict"
+    write_compact_dict({"nurse": "Registered nurses", "cashier": "Cashiers"}, str(path))
+    compact = CompactDict(str(path))
+
+    assert compact.get_many(["nurse", "bad \udcff title", "\ud800"]).tolist() == ["Registered nurses", None, None]
+    assert "\udcff" not in compact
+
+
+def test_surrogate_keys_round_trip(tmp_path):
+    pre_match = {"nurse": "Registered nurses", "caf\udce9 worker": "Cooks"}
+    path = tmp_path / "aliases.dict"
+    write_compact_dict(pre_match, str(path))
+    compact = CompactDict(str(path))
+
+    assert compact["caf\udce9 worker"] == "Cooks"
+    assert compact.lookup_codes(["caf\udce9 worker", "café worker"]).tolist()[1] == -1
+    assert dict(compact.items()) == pre_match
+
+
+@pytest.fixture
+def read_only_dir(tmp_path, monkeypatch):
+    """Copies finetune.jsonl to a directory where writing the .dict fails."""
+    source = tmp_path / "data" / "finetune.jsonl"
+    source.parent.mkdir()
+    shutil.copy(FINETUNE, source)
+    tmp_dir = tmp_path / "tmp"
+    tmp_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_dir))
+
+    write = compact_dict.write_compact_dict
+    writes = []
+
+    def write_outside_data(pre_match, path, source_stat=None):
+        if Path(path) == compact_dict_path(str(source.resolve())):
+            raise PermissionError("read-only")
+        writes.append(path)
+        write(pre_match, path, source_stat)
+
+    monkeypatch.setattr(compact_dict, "write_compact_dict", write_outside_data)
+    return source, tmp_dir, writes
+
+
+def test_read_only_fallback_is_shared(read_only_dir):
+    source, tmp_dir, writes = read_only_dir
+
+    first = load_compact_dict(str(source))
+    second = load_compact_dict(str(source))
+
+    assert first.path == second.path
+    assert first.path.parent == tmp_dir
+    assert len(writes) == 1
+    assert second["nurse"] == "Registered nurses"
+
+
+def test_read_only_fallback_follows_source_changes(read_only_dir):
+    source, _, writes = read_only_dir
+    first = load_compact_dict(str(source))
+
+    with open(source, "a", encoding="utf-8") as f:
+        f.write('{"prompt_occupation": "chef", "completion": "Chefs"}\n')
+    second = load_compact_dict(str(source))
+
+    assert second.path != first.path
+    assert len(writes) == 2
+    assert second["chef"] == "Chefs"
@@ -0,0 +1,24 @@
+import shutil
+from pathlib import Path
+
+from finetune_data import artifact_path, clear_cache, load_finetune_data
+
+FINETUNE = Path(__file__).parent / "fixtures" / "batch" / "finetune.jsonl"
+
+
+def test_artifact_goes_to_the_configured_directory(tmp_path, monkeypatch):
+    jsonl_path = tmp_path / "data" / "finetune.jsonl"
+    jsonl_path.parent.mkdir()
+    shutil.copy(FINETUNE, jsonl_path)
+    monkeypatch.setenv("OCC_ARTIFACT_DIR", str(tmp_path / "artifacts"))
+
+    data = load_finetune_data(str(jsonl_path))
+    assert artifact_path(str(jsonl_path)).parent == tmp_path / "artifacts"
+    assert artifact_path(str(jsonl_path)).exists()
+    assert list(jsonl_path.parent.iterdir()) == [jsonl_path]
+
+    clear_cache()
+    assert load_finetune_data(str(jsonl_path)) == data
+
+    monkeypatch.delenv("OCC_ARTIFACT_DIR")
+    assert artifact_path(str(jsonl_path)) == jsonl_path.with_name("finetune.jsonl.compiled")
@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+
+from classification_cache import ClassificationCache
+from local_classifier import LocalClassifier, load_reference_labels, load_training_pairs
+
+TRAINING_TITLES = {
+    "registered_nurses": ["nurse", "registered nurse", "staff nurse", "night nurse", "charge nurse",
+                          "rn nurse", "ward nurse", "icu nurse", "school nurse", "head nurse"],
+    "cashiers": ["cashier", "store cashier", "checkout cashier", "till cashier", "cashier clerk",
+                 "supermarket cashier", "retail cashier", "head cashier", "gas station cashier", "casino cashier"],
+    "janitors_and_cleaners": ["janitor", "cleaner", "office cleaner", "school janitor", "night janitor",
+                              "custodian", "building cleaner", "hospital cleaner", "janitor cleaner", "floor cleaner"],
+}
+
+
+@pytest.fixture
+def training_jsonl(tmp_path):
+    path = tmp_path / "finetune.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for target, titles in TRAINING_TITLES.items():
+            for title in titles:
+                f.write(json.dumps({"prompt_occupation": title.title(), "completion": target.replace("_", " "),
+                                    "transformed_completion": target}) + "\n")
+    return path
+
+
+def test_training_pairs_use_the_model_facing_label(training_jsonl):
+    texts, targets = load_training_pairs(str(training_jsonl))
+    assert len(texts) == 30
+    assert dict(zip(texts, targets))["gas station cashier"] == "cashiers"
+
+
+def test_train_predict_save_load(training_jsonl, tmp_path):
+    classifier, report = LocalClassifier.train(str(training_jsonl), holdout_fraction=0.3, seed=0)
+    assert report["pairs"] == 30 and report["classes"] == 3
+    assert report["holdout_pairs"] > 0 and report["temperature"] == classifier.temperature
+
+    titles = ["Registered Nurse", "cashier clerk", "school janitor"]
+    predictions = classifier.predict(titles)
+    assert [label for label, _ in predictions] == ["registered_nurses", "cashiers", "janitors_and_cleaners"]
+    # The reported probability is the calibrated (temperature-scaled) softmax
+    logits = classifier.decision_function(titles)
+    scaled = np.exp(logits / classifier.temperature - (logits / classifier.temperature).max(axis=1, keepdims=True))
+    np.testing.assert_allclose([p for _, p in predictions], (scaled / scaled.sum(axis=1, keepdims=True)).max(axis=1),
+                               rtol=1e-6)
+    assert all(1 / 3 < p <= 1 for _, p in predictions)
+
+    model_path = tmp_path / "local_classifier.pkl"
+    classifier.save(str(model_path))
+    loaded = LocalClassifier.load(str(model_path), str(training_jsonl))
+    assert loaded.temperature == classifier.temperature
+    assert loaded.predict(titles) == predictions
+
+    # A model trained on an older finetune.jsonl is rejected
+    with open(training_jsonl, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"prompt_occupation": "Chef", "completion": "chefs",
+                            "transformed_completion": "chefs"}) + "\n")
+    with pytest.raises(ValueError, match="retrain"):
+        LocalClassifier.load(str(model_path), str(training_jsonl))
+    assert LocalClassifier.load(str(model_path)).predict(titles) == predictions
+
+
+def test_reference_labels_from_cache_match_current_model(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    ClassificationCache(db_path).put("Nurse", "registered_nurses", "Registered nurses")
+    ClassificationCache(db_path).put("Barista", "Error: timed out", None)
+    ClassificationCache(db_path, model_id="ft:older-model").put("Clerk", "cashiers", "Cashiers")
+    ClassificationCache(db_path, prompt_version="0").put("Janitor", "janitors_and_cleaners", "Janitors")
+
+    assert load_reference_labels(cache_path=db_path) == (["nurse"], ["registered_nurses"])
+    assert load_reference_labels(cache_path=db_path, model_id="ft:older-model") == (["clerk"], ["cashiers"])
@@ -0,0 +1,66 @@
+from contextlib import nullcontext
+
+import pytest
+
+import metrics
+
+
+class FakeStreamlit:
+    """Records what render_diagnostics draws; the checkbox returns `checked`."""
+
+    def __init__(self, checked):
+        self.checked = checked
+        self.calls = []
+        self.sidebar = self
+
+    def expander(self, label):
+        return nullcontext()
+
+    def checkbox(self, label, value=False, key=None):
+        self.calls.append("checkbox")
+        return self.checked
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append(name)
+
+
+@pytest.fixture
+def enabled():
+    was_enabled = metrics.is_enabled()
+    metrics.enable()
+    yield
+    if not was_enabled:
+        metrics.disable()
+
+
+@pytest.mark.parametrize("checked", [True, False])
+def test_diagnostics_checkbox_does_not_switch_recording(enabled, checked):
+    st = FakeStreamlit(checked)
+    metrics.render_diagnostics(st)
+
+    assert metrics.is_enabled()
+    assert ("download_button" in st.calls) == checked
+
+
+def test_diagnostics_when_recording_is_off():
+    was_enabled = metrics.is_enabled()
+    metrics.disable()
+    try:
+        st = FakeStreamlit(True)
+        metrics.render_diagnostics(st)
+        assert not metrics.is_enabled()
+        assert "checkbox" not in st.calls
+        assert "caption" in st.calls
+    finally:
+        if was_enabled:
+            metrics.enable()
+
+
+@pytest.mark.parametrize("checked", [True, False])
+def test_diagnostics_builds_extra_only_when_shown(checked):
+    built = []
+    st = FakeStreamlit(checked)
+    metrics.render_diagnostics(st, lambda: built.append(1) or {"size": 1})
+
+    assert len(built) == int(checked)
+    assert ("json" in st.calls) == checked
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+from parallel_pre_match import run_parallel_pre_match
+
+FINETUNE = Path(__file__).parent / "fixtures" / "batch" / "finetune.jsonl"
+
+
+def test_partitions_keep_passthrough_text_and_empty_inputs_keep_the_header(tmp_path):
+    # The first partition only has empty scores, the later ones only numbers
+    rows = [f"{i},{'Nurse' if i % 2 else 'Cashier'},{'' if i < 5 else i}" for i in range(20)]
+    (tmp_path / "a.csv").write_text("\n".join(["id,occupation,score"] + rows) + "\n", encoding="utf-8")
+    (tmp_path / "empty.csv").write_text("id,occupation\n", encoding="utf-8")
+
+    summary = run_parallel_pre_match([str(tmp_path / "*.csv")], str(tmp_path / "out"), "occupation",
+                                     str(FINETUNE), workers=2, partition_mb=50 / 2 ** 20)
+
+    assert summary["total_partitions"] > 2
+    lines = (tmp_path / "out" / "a.prematched.csv").read_text(encoding="utf-8").splitlines()
+    assert lines[0] == "id,occupation,score,final_output,method"
+    assert lines[6] == "5,Nurse,5,Registered nurses,pre_match"
+    assert len(lines) == 21
+    empty = (tmp_path / "out" / "empty.prematched.csv").read_text(encoding="utf-8")
+    assert empty.splitlines() == ["id,occupation,final_output,method"]
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+from run_benchmarks import STARTUP_FORBIDDEN, import_profile  # noqa: E402
+
+from occupation_text import DEFAULT_MIN_SIMILARITY  # noqa: E402
+
+
+@pytest.mark.parametrize("module", sorted(STARTUP_FORBIDDEN))
+def test_entry_point_imports_stay_light(module):
+    profile = import_profile(module)
+
+    assert module in profile["loaded"]
+    assert sorted(name for name in STARTUP_FORBIDDEN[module] if name in profile["loaded"]) == []
+
+
+def test_main_help_is_light_and_shows_defaults():
+    env = dict(os.environ, PYTHONPATH=str(BASE_DIR / "src"))
+    proc = subprocess.run([sys.executable, "-X", "importtime", str(BASE_DIR / "src" / "main.py"), "--help"],
+                          capture_output=True, text=True, env=env, check=True)
+
+    assert f"(default: {DEFAULT_MIN_SIMILARITY})" in " ".join(proc.stdout.split())
+    loaded = {line.rsplit("|", 1)[-1].strip() for line in proc.stderr.splitlines()
+              if line.startswith("import time:")}
+    assert "pandas" not in loaded
+
+
+def test_main_rejects_min_similarity_without_fuzzy(capsys):
+    from main import parse_args
+
+    with pytest.raises(SystemExit):
+        parse_args(["--input", "a.csv", "--min-similarity", "0.8"])
+    assert "--fuzzy" in capsys.readouterr().err
+    assert parse_args(["--fuzzy", "--min-similarity", "0.8"]).min_similarity == 0.8
@@ -0,0 +1,101 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from suggestion_client import SuggestionClient
+from suggestion_server import SuggestionService, serve
+
+FINETUNE = Path(__file__).parent / "fixtures" / "batch" / "finetune.jsonl"
+
+
+class FakeModel:
+    """Stands in for a SentenceTransformer: a fixed vector per text."""
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.array([[len(text) % 7 + 1.0, text.count("a") + 1.0, 1.0]
+                            for text in ([texts] if single else texts)], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if single else vectors
+
+
+@pytest.fixture
+def jsonl_path(tmp_path):
+    path = tmp_path / "finetune.jsonl"
+    shutil.copy(FINETUNE, path)
+    return path
+
+
+@pytest.fixture
+def server(jsonl_path):
+    httpd = serve(SuggestionService(str(jsonl_path), FakeModel(), "fake-model"), port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_serves_matching_model_and_labels(server, jsonl_path):
+    client = SuggestionClient(server)
+    assert client.serves(str(jsonl_path), "fake-model")
+    assert len(client.suggest("nurse", k=2)) == 2
+
+
+def test_serves_rejects_other_model_or_labels(server, jsonl_path, tmp_path):
+    client = SuggestionClient(server)
+    assert not client.serves(str(jsonl_path), "all-MiniLM-L6-v2")
+
+    other = tmp_path / "other.jsonl"
+    other.write_text(jsonl_path.read_text(encoding="utf-8").splitlines()[0] + "\n", encoding="utf-8")
+    assert not client.serves(str(other), "fake-model")
+    assert not client.serves(str(tmp_path / "missing.jsonl"), "fake-model")
+
+
+def test_serves_follows_edited_labels(server, jsonl_path):
+    client = SuggestionClient(server)
+    with open(jsonl_path, "a", encoding="utf-8") as f:
+        f.write('{"prompt_occupation": "chef", "completion": "Chefs and head cooks", '
+                '"transformed_completion": "chefs_and_head_cooks"}\n')
+    stat = jsonl_path.stat()
+    # Make sure the mtime moves even on coarse-grained filesystems
+    os.utime(jsonl_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert client.serves(str(jsonl_path), "fake-model")
+
+
+def test_unreachable_server():
+    client = SuggestionClient("http://127.0.0.1:9", timeout=0.5)
+    assert not client.serves(str(FINETUNE), "fake-model")
+    with pytest.raises(OSError):
+        client.suggest("nurse")
+
+
+def test_examples_served_with_examples_path(jsonl_path):
+    service = SuggestionService(str(jsonl_path), FakeModel(), "fake-model", examples_path=str(jsonl_path))
+    httpd = serve(service, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        client = SuggestionClient(f"http://127.0.0.1:{httpd.server_address[1]}")
+        assert client.serves_examples(str(jsonl_path), "fake-model")
+        base = len(service.examples)
+
+        client.add_example("Night Nurse", "registered_nurses")
+        assert len(service.examples) == base + 1
+        assert "registered_nurses" in [label for label, _ in client.example_votes("night nurse", k=3)]
+        assert client.remove_example("Night Nurse", "registered_nurses")
+        assert not client.remove_example("Night Nurse", "registered_nurses")
+        assert len(service.examples) == base
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_examples_not_served_without_examples_path(server, jsonl_path):
+    client = SuggestionClient(server)
+    assert not client.serves_examples(str(jsonl_path), "fake-model")
+    with pytest.raises(RuntimeError, match="--examples"):
+        client.example_votes("nurse")